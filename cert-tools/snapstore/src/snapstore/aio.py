@@ -0,0 +1,230 @@
+"""
+Asynchronous counterparts of `SnapstoreClient` and `SnapstoreInfo`.
+
+Requests are still submitted by the (synchronous) craft-store client,
+so authentication, connection pooling and caching are shared with
+`SnapstoreClient`, but each request runs in a worker thread so that
+many requests can be in flight at the same time.
+
+Example:
+```
+client = AsyncSnapstoreClient(SnapstoreClient(create_base_client()))
+info = AsyncSnapstoreInfo(client)
+results = asyncio.run(info.gather_info(entries))
+```
+"""
+
+import asyncio
+from collections.abc import Callable, Iterable
+from functools import partial
+
+from snapstore.client import SnapstoreClient
+from snapstore.info import SnapstoreInfo, group_refresh_requests
+from snapstore.projection import Projection
+from snapstore.snaps import SnapSpecifier
+
+
+class AsyncSnapstoreClient:
+    """
+    Interact with endpoints of the snap Store API asynchronously
+
+    At most `concurrency` requests are in flight at any time and each
+    of them is abandoned (raising `TimeoutError`) after `timeout` seconds.
+    The pool size of the wrapped client should be at least `concurrency`
+    for connections to be reused by concurrent requests.
+
+    A worker thread cannot be interrupted: an abandoned request keeps
+    running until the wrapped client gives up on it (after its own
+    `timeout` for each attempt, and its retries), and it holds its slot
+    until then, so that no more than `concurrency` requests are actually
+    in flight.
+    """
+
+    def __init__(
+        self,
+        client: SnapstoreClient,
+        concurrency: int = 10,
+        timeout: float | None = 30,
+    ):
+        self.client = client
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._semaphore = None
+        self._loop = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """
+        The semaphore bounding the requests in flight, created in (and
+        bound to) the running event loop, so that the client can be used
+        by consecutive `asyncio.run` calls.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    async def run(self, function: Callable, *args, **kwargs):
+        """
+        Run a (blocking) function in a worker thread, with bounded
+        concurrency and a timeout, and return its result.
+        """
+        semaphore = self.semaphore
+        await semaphore.acquire()
+        try:
+            thread = asyncio.ensure_future(
+                asyncio.to_thread(partial(function, *args, **kwargs))
+            )
+        except BaseException:
+            semaphore.release()
+            raise
+        # the slot is released when the thread finishes, rather than when
+        # the request is abandoned (the thread is shielded from the
+        # cancellation on timeout, since it would keep running anyway)
+        thread.add_done_callback(partial(self._finished, semaphore))
+        return await asyncio.wait_for(asyncio.shield(thread), timeout=self.timeout)
+
+    @staticmethod
+    def _finished(semaphore: asyncio.Semaphore, thread: asyncio.Future):
+        semaphore.release()
+        # retrieve the error of an abandoned request, so that it is not
+        # reported as never retrieved
+        if not thread.cancelled():
+            thread.exception()
+
+    async def get(
+        self,
+        endpoint: str,
+        params: dict | None = None,
+        store: str | None = None,
+        headers: dict | None = None,
+    ) -> dict:
+        """
+        Submit a GET request to an endpoint of the snap Store API
+        and return a dict with the contents of the response.
+        """
+        return await self.run(
+            self.client.get, endpoint, params=params, store=store, headers=headers
+        )
+
+    async def post(
+        self,
+        endpoint: str,
+        payload: dict,
+        store: str | None = None,
+        headers: dict | None = None,
+    ) -> dict:
+        """
+        Submit a POST request to an endpoint of the snap Store API
+        and return a dict with the contents of the response.
+        """
+        return await self.run(
+            self.client.post, endpoint, payload=payload, store=store, headers=headers
+        )
+
+
+class AsyncSnapstoreInfo:
+    """
+    Retrieve snap info through the snap Store API asynchronously
+
+    Ref:
+    - https://api.snapcraft.io/docs/refresh.html
+    - https://api.snapcraft.io/docs/info.html
+    """
+
+    def __init__(self, client: AsyncSnapstoreClient):
+        self.client = client
+        self.info = SnapstoreInfo(client.client)
+
+    async def get_snap_info(
+        self,
+        snap: str,
+        architecture: str | None = None,
+        store: str | None = None,
+        fields: Iterable[str] | None = None,
+        projection: Projection | Iterable[str] | None = None,
+    ) -> dict:
+        """
+        Return info for a specific snap, as retrieved from the
+        `v2/snaps/info/{snap}` endpoint of the snap Store API.
+        """
+        return await self.client.run(
+            self.info.get_snap_info,
+            snap=snap,
+            architecture=architecture,
+            store=store,
+            fields=fields,
+            projection=projection,
+        )
+
+    async def get_refresh_info(
+        self,
+        snap_specifiers: Iterable[SnapSpecifier],
+        architecture: str,
+        store: str | None = None,
+        fields: Iterable[str] | None = None,
+    ) -> list[dict]:
+        """
+        Return a list with the info for each of a collection of snaps, as
+        retrieved from the `v2/snaps/refresh` endpoint of the snap Store API.
+        """
+        return await self.client.run(
+            self.info.get_refresh_info,
+            snap_specifiers=list(snap_specifiers),
+            architecture=architecture,
+            store=store,
+            fields=fields,
+        )
+
+    async def gather_info(
+        self,
+        entries: Iterable[tuple[SnapSpecifier, str, str | None]],
+        fields: Iterable[str] | None = None,
+    ) -> list:
+        """
+        Return info for a collection of (snap specifier, architecture, store)
+        entries, in the same order as the entries.
+
+        Entries are grouped so that a single `v2/snaps/refresh` request is
+        submitted for each (architecture, store) and all requests are
+        submitted concurrently. Each item in the returned list is the
+        result for the corresponding entry (as returned by the Store) or
+        the exception raised while retrieving it.
+        """
+        entries = list(entries)
+        requests = group_refresh_requests(entries)
+        groups = [
+            (architecture, store, snaps)
+            for (architecture, store), batches in requests.items()
+            for snaps in batches
+        ]
+        responses = await asyncio.gather(
+            *(
+                self.get_refresh_info(
+                    snap_specifiers=snaps,
+                    architecture=architecture,
+                    store=store,
+                    fields=fields,
+                )
+                for architecture, store, snaps in groups
+            ),
+            return_exceptions=True,
+        )
+
+        # associate each entry with its result (or exception)
+        results = {}
+        for (architecture, store, snaps), response in zip(groups, responses):
+            if isinstance(response, BaseException):
+                for snap in snaps:
+                    results[(snap, architecture, store)] = response
+                continue
+            by_instance_key = {
+                result.get("instance-key"): result for result in response
+            }
+            for snap in snaps:
+                results[(snap, architecture, store)] = by_instance_key.get(
+                    snap.name,
+                    ValueError(f"No result for {snap} on {architecture}"),
+                )
+        return [results[entry] for entry in entries]
@@ -0,0 +1,147 @@
+"""
+An on-disk cache for responses from the snap Store API.
+
+Entries are stored as JSON files in a cache directory that can be shared
+by concurrent processes (e.g. parallel jobs on the same agent): access to
+the directory is serialized with a lock file and entries are written
+atomically.
+
+Ref: https://api.snapcraft.io/docs/
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+
+
+def default_cache_directory() -> Path:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "snapstore"
+
+
+@dataclass
+class CacheEntry:
+    body: dict
+    stored: float
+    etag: str | None = None
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    revalidations: int = 0
+
+
+class ResponseCache:
+    """
+    Cache responses from the snap Store API on disk
+
+    Entries are fresh for `ttl` seconds after they are stored. Stale
+    entries are kept so that they can be revalidated (using their ETag)
+    and the least recently used entries are evicted once there are
+    more than `max_entries` of them.
+    """
+
+    lock_filename = ".lock"
+
+    def __init__(
+        self,
+        directory: str | Path | None = None,
+        ttl: float = 300,
+        max_entries: int = 1000,
+    ):
+        self.directory = Path(directory or default_cache_directory())
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+
+    @staticmethod
+    def key(method: str, url: str, headers: dict, data: dict) -> str:
+        """
+        Return a key for a request, derived from its method, URL, headers
+        (i.e. store, architecture and credentials) and parameters or payload.
+        """
+        request = json.dumps([method, url, headers, data], sort_keys=True)
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    @contextmanager
+    def lock(self, exclusive: bool = False):
+        """
+        Hold a lock on the cache directory (shared or exclusive)
+        """
+        with open(self.directory / self.lock_filename, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.stored < self.ttl
+
+    def get(self, key: str) -> CacheEntry | None:
+        """
+        Return the (fresh or stale) entry for a key, or None if there is
+        no such entry. Hits and misses refer to fresh entries only.
+        """
+        path = self.path(key)
+        with self.lock():
+            try:
+                entry = CacheEntry(**json.loads(path.read_text()))
+                # mark the entry as recently used
+                os.utime(path)
+            except (OSError, ValueError, TypeError):
+                entry = None
+        if entry is not None and self.is_fresh(entry):
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+        return entry
+
+    def put(self, key: str, body: dict, etag: str | None = None):
+        """
+        Store the body of a response (and its ETag, if any) under a key
+        """
+        entry = CacheEntry(body=body, stored=time.time(), etag=etag)
+        with self.lock(exclusive=True):
+            with tempfile.NamedTemporaryFile(
+                "w", dir=self.directory, suffix=".tmp", delete=False
+            ) as temporary_file:
+                json.dump(entry.__dict__, temporary_file)
+            os.replace(temporary_file.name, self.path(key))
+            self.evict()
+
+    def revalidated(self, key: str, entry: CacheEntry):
+        """
+        Mark a stale entry as fresh, after the Store has confirmed that
+        it has not been modified.
+        """
+        self.stats.revalidations += 1
+        self.put(key, entry.body, entry.etag)
+
+    def evict(self):
+        """
+        Remove the least recently used entries in excess of `max_entries`
+        (the caller is expected to hold an exclusive lock)
+        """
+        paths = sorted(
+            self.directory.glob("*.json"), key=lambda path: path.stat().st_mtime
+        )
+        for path in paths[: max(len(paths) - self.max_entries, 0)]:
+            path.unlink(missing_ok=True)
+
+    def clear(self):
+        with self.lock(exclusive=True):
+            for path in self.directory.glob("*.json"):
+                path.unlink(missing_ok=True)
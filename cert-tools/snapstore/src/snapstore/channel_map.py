@@ -0,0 +1,93 @@
+"""
+An index over the `channel-map` of a `v2/snaps/info` response.
+
+Ref: https://api.snapcraft.io/docs/info.html
+"""
+
+from collections.abc import Iterable
+
+from snapstore.snaps import SnapChannel
+
+# risks, from the least to the most stable
+RISKS = ("edge", "beta", "candidate", "stable")
+
+DEFAULT_TRACK = "latest"
+
+
+class ChannelMap:
+    """
+    Index the entries of a channel map by (track, risk, branch, architecture)
+
+    The index is built once per response and each lookup takes constant
+    time (instead of a scan of the whole channel map). Entries that do not
+    specify an architecture match any architecture.
+    """
+
+    def __init__(self, entries: Iterable[dict]):
+        self.entries = {}
+        # entries for each channel, regardless of architecture
+        self.channels = {}
+        for entry in entries:
+            key = self.get_key(entry["channel"])
+            self.entries.setdefault(key, entry)
+            self.channels.setdefault(key[:3], []).append(entry)
+
+    @classmethod
+    def from_response(cls, response: dict) -> "ChannelMap":
+        return cls(response.get("channel-map", []))
+
+    @staticmethod
+    def get_key(channel: dict) -> tuple:
+        """
+        Return the (track, risk, branch, architecture) key for the
+        `channel` dict of a channel map entry.
+        """
+        track = channel.get("track")
+        risk = channel.get("risk")
+        branch = channel.get("branch")
+        if risk is None and "name" in channel:
+            parsed = SnapChannel.from_string(channel["name"])
+            track, risk, branch = track or parsed.track, parsed.risk, parsed.branch
+        return (track or DEFAULT_TRACK, risk, branch, channel.get("architecture"))
+
+    def get(
+        self, channel: SnapChannel | str, architecture: str | None = None
+    ) -> dict | None:
+        """
+        Return the entry for a channel and architecture (or for any
+        architecture, if none is specified) or None if there is no entry.
+        """
+        if isinstance(channel, str):
+            channel = SnapChannel.from_string(channel)
+        # a channel with no risk (i.e. only a track) refers to stable
+        key = (
+            channel.track or DEFAULT_TRACK,
+            channel.risk or "stable",
+            channel.branch,
+        )
+        if architecture is None:
+            entries = self.channels.get(key)
+            return entries[0] if entries else None
+        return self.entries.get((*key, architecture)) or self.entries.get((*key, None))
+
+    def latest(
+        self, channel: SnapChannel | str, architecture: str | None = None
+    ) -> dict | None:
+        """
+        Return the entry for a channel and architecture, falling back to
+        increasingly stable risks on the same track (in the same way that
+        a closed channel follows the next more stable one), or None if
+        there is no such entry.
+        """
+        if isinstance(channel, str):
+            channel = SnapChannel.from_string(channel)
+        track = channel.track or DEFAULT_TRACK
+        risk = channel.risk or "stable"
+        candidates = [SnapChannel(track, risk, channel.branch)] + [
+            SnapChannel(track, fallback) for fallback in RISKS[RISKS.index(risk) + 1 :]
+        ]
+        for candidate in candidates:
+            entry = self.get(candidate, architecture)
+            if entry is not None:
+                return entry
+        return None
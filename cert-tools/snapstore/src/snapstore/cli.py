@@ -1,18 +1,26 @@
 from argparse import ArgumentParser, Namespace
+from collections.abc import Iterable, Iterator
 import json
+import sys
 from typing import List
 
+from craft_store.errors import CraftStoreError
+from requests import RequestException
+
+from snapstore.cache import ResponseCache
+from snapstore.channel_map import ChannelMap
 from snapstore.craft import create_base_client
 from snapstore.client import SnapstoreClient
-from snapstore.info import SnapstoreInfo
+from snapstore.info import SnapstoreInfo, group_refresh_requests
 from snapstore.snaps import SnapSpecifier, SnapChannel
+from snapstore.watch import SnapstoreWatch
 
 
 def get_info_arguments(args: List[str] | None = None) -> Namespace:
     parser = ArgumentParser(description="Retrieve snap info from the Store")
-    parser.add_argument("snap", type=str)
-    parser.add_argument("channel", type=str)
-    parser.add_argument("architecture", type=str)
+    parser.add_argument("snap", type=str, nargs="?")
+    parser.add_argument("channel", type=str, nargs="?")
+    parser.add_argument("architecture", type=str, nargs="?")
     parser.add_argument("--store", type=str)
     parser.add_argument(
         "--fields",
@@ -36,7 +44,94 @@ def get_info_arguments(args: List[str] | None = None) -> Namespace:
         default="UBUNTU_STORE_AUTH",
         help="Variable containing token returned by `snapcraft export-login`",
     )
-    return parser.parse_args(args)
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        metavar="SECONDS",
+        help="cache Store responses on disk for this many seconds",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        help="directory for cached Store responses (implies --cache-ttl 300)",
+    )
+    parser.add_argument(
+        "--batch",
+        nargs="?",
+        const="-",
+        metavar="FILE",
+        help=(
+            "read `snap=channel architecture [store]` lines (or JSON objects "
+            "with the same keys) from FILE or standard input and write one "
+            "JSON result per line"
+        ),
+    )
+    parsed_args = parser.parse_args(args)
+    positionals = (parsed_args.snap, parsed_args.channel, parsed_args.architecture)
+    if parsed_args.batch is None:
+        if not all(positionals):
+            parser.error("snap, channel and architecture are required")
+    else:
+        if any(positionals):
+            parser.error("snap, channel and architecture cannot be used with --batch")
+        if not parsed_args.refresh:
+            parser.error("--use-info cannot be used with --batch")
+    return parsed_args
+
+
+def get_watch_arguments(args: list[str] | None = None) -> Namespace:
+    parser = ArgumentParser(
+        prog="snap-info watch",
+        description=(
+            "Watch the channel maps of snaps in the Store and write one JSON "
+            "event per line for each change (added, updated or removed channel)"
+        ),
+    )
+    parser.add_argument("snaps", type=str, nargs="+", metavar="snap")
+    parser.add_argument("--architecture", type=str)
+    parser.add_argument("--store", type=str)
+    parser.add_argument(
+        "--fields",
+        nargs="+",
+        default=[],
+        help="additional fields of channel map entries to include in events",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=60.0,
+        metavar="SECONDS",
+        help="initial interval between polls of each snap",
+    )
+    parser.add_argument(
+        "--max-interval",
+        type=float,
+        default=600.0,
+        metavar="SECONDS",
+        help="interval between polls of snaps that do not change",
+    )
+    parser.add_argument(
+        "--polls",
+        type=int,
+        metavar="N",
+        help="stop after polling each snap N times (default is to poll forever)",
+    )
+    parser.add_argument(
+        "--token-environment-variable",
+        dest="variable",
+        type=str,
+        default="UBUNTU_STORE_AUTH",
+        help="Variable containing token returned by `snapcraft export-login`",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        help="directory for the responses used in conditional requests",
+    )
+    parsed_args = parser.parse_args(args)
+    if parsed_args.max_interval < parsed_args.interval:
+        parser.error("--max-interval cannot be less than --interval")
+    return parsed_args
 
 
 def _get_snap_info(info: SnapstoreInfo, args: Namespace) -> dict:
@@ -51,24 +146,27 @@ def _get_snap_info(info: SnapstoreInfo, args: Namespace) -> dict:
     store = args.store
     fields = args.fields
 
+    # when specific fields are requested, only those (and the channel)
+    # are retained from each entry of the (streamed) channel map
+    projection = None
+    if fields:
+        projection = ["channel-map.channel"] + [
+            f"channel-map.{field.strip()}" for field in fields
+        ]
+
     response = info.get_snap_info(
         snap=snap,
         architecture=architecture,
         store=store,
         fields=fields,
+        projection=projection,
     )
 
     # locate the matching channel entry in the channel map and return it
-    for entry in response["channel-map"]:
-        channel_dict = entry["channel"]
-        if (
-            channel_dict["track"] == channel.track
-            and channel_dict["risk"] == channel.risk
-        ):
-            return entry
-
-    # no matching entry
-    raise ValueError(f"No info for {snap}={channel} on {architecture}")
+    entry = ChannelMap.from_response(response).get(channel, architecture)
+    if entry is None:
+        raise ValueError(f"No info for {snap}={channel} on {architecture}")
+    return entry
 
 
 def _get_refresh_info(info: SnapstoreInfo, args: Namespace) -> dict:
@@ -92,8 +190,16 @@ def _get_refresh_info(info: SnapstoreInfo, args: Namespace) -> dict:
     # extract what should be a single result from the response
     if len(response) != 1:
         raise ValueError(f"Multiple results for {snap} on {architecture}")
-    result = response[0]
+    return _process_refresh_result(snap, architecture, response[0])
 
+
+def _process_refresh_result(
+    snap: SnapSpecifier, architecture: str, result: dict
+) -> dict:
+    """
+    Return the "snap" field of a `v2/snaps/refresh` result, along with
+    the "effective channel", or raise a ValueError if the result is an error.
+    """
     # check for errors
     if result["result"] == "error":
         raise ValueError(f"{snap}@{architecture}: {result['error']['message']}")
@@ -102,15 +208,134 @@ def _get_refresh_info(info: SnapstoreInfo, args: Namespace) -> dict:
     return {**result["snap"], **{"effective-channel": result["effective-channel"]}}
 
 
+def _read_batch(lines: Iterable[str], store: str | None = None) -> list[tuple]:
+    """
+    Parse batch input into a list of (snap specifier, architecture, store)
+    tuples. Each line is either in the form `snap=channel architecture [store]`
+    or a JSON object with `snap`, `channel`, `architecture` and (optionally)
+    `store` keys. Empty lines and lines starting with `#` are ignored.
+
+    The `store` argument is used for lines that do not specify a store.
+    """
+    entries = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("{"):
+            data = json.loads(line)
+            snap = SnapSpecifier(
+                name=data["snap"], channel=SnapChannel.from_string(data["channel"])
+            )
+            architecture = data["architecture"]
+            line_store = data.get("store")
+        else:
+            components = line.split()
+            if len(components) not in (2, 3):
+                raise ValueError(f"Cannot parse '{line}' as a batch entry")
+            snap = SnapSpecifier.from_string(components[0])
+            architecture = components[1]
+            line_store = components[2] if len(components) == 3 else None
+        entries.append((snap, architecture, line_store or store))
+    return entries
+
+
+def _get_batch_refresh_info(
+    info: SnapstoreInfo, entries: Iterable[tuple], fields: list[str] | None = None
+) -> Iterator[dict]:
+    """
+    Resolve batch entries through the `v2/snaps/refresh` endpoint, using
+    one request per (architecture, store) group, and yield a record for
+    each snap specifier containing either its result or an error.
+    """
+    for (architecture, store), batches in group_refresh_requests(entries).items():
+        for snaps in batches:
+            record = {"architecture": architecture, "store": store}
+            try:
+                response = info.get_refresh_info(
+                    snap_specifiers=snaps,
+                    architecture=architecture,
+                    store=store,
+                    fields=fields,
+                )
+            except (CraftStoreError, RequestException) as error:
+                for snap in snaps:
+                    yield {"specifier": str(snap), **record, "error": str(error)}
+                continue
+            results = {result.get("instance-key"): result for result in response}
+            for snap in snaps:
+                try:
+                    result = results.get(snap.name)
+                    if result is None:
+                        raise ValueError(f"No result for {snap} on {architecture}")
+                    yield {
+                        "specifier": str(snap),
+                        **record,
+                        "result": _process_refresh_result(snap, architecture, result),
+                    }
+                except ValueError as error:
+                    yield {"specifier": str(snap), **record, "error": str(error)}
+
+
+def _read_batch_file(path: str, store: str | None = None) -> list[tuple]:
+    """
+    Read the batch entries from a file, or from standard input if the path
+    is "-" (which is left open).
+    """
+    if path == "-":
+        return _read_batch(sys.stdin, store=store)
+    with open(path) as stream:
+        return _read_batch(stream, store=store)
+
+
+def _create_cache(args: Namespace) -> ResponseCache | None:
+    if args.cache_ttl is None and args.cache_dir is None:
+        return None
+    ttl = args.cache_ttl if args.cache_ttl is not None else 300
+    return ResponseCache(directory=args.cache_dir, ttl=ttl)
+
+
+def watch_cli(args: list[str] | None = None):
+    args = get_watch_arguments(args)
+    base_client = create_base_client(token_environment_variable=args.variable)
+    # responses are always stale, i.e. revalidated with conditional requests
+    cache = ResponseCache(directory=args.cache_dir, ttl=0)
+    with SnapstoreClient(base_client, cache=cache) as client:
+        watch = SnapstoreWatch(
+            SnapstoreInfo(client),
+            args.snaps,
+            architecture=args.architecture,
+            store=args.store,
+            fields=args.fields,
+            interval=args.interval,
+            max_interval=args.max_interval,
+        )
+        try:
+            for event in watch.watch(polls=args.polls):
+                print(json.dumps(event), flush=True)
+        except KeyboardInterrupt:
+            pass
+
+
 def info_cli():
+    # `snap-info watch ...` is a separate subcommand
+    if sys.argv[1:2] == ["watch"]:
+        return watch_cli(sys.argv[2:])
     args = get_info_arguments()
     base_client = create_base_client(token_environment_variable=args.variable)
-    client = SnapstoreClient(base_client)
-    info = SnapstoreInfo(client)
-    if args.refresh:
-        result = _get_refresh_info(info, args)
-    else:
-        result = _get_snap_info(info, args)
+    cache = _create_cache(args)
+    with SnapstoreClient(base_client, cache=cache) as client:
+        info = SnapstoreInfo(client)
+        if args.batch is not None:
+            entries = _read_batch_file(args.batch, store=args.store)
+            # stream results as newline-delimited JSON
+            for record in _get_batch_refresh_info(info, entries, args.fields):
+                print(json.dumps(record), flush=True)
+            return
+        if args.refresh:
+            result = _get_refresh_info(info, args)
+        else:
+            result = _get_snap_info(info, args)
 
     # display as JSON so that the result can be parsed with jq
     print(json.dumps(result))
@@ -4,18 +4,167 @@ A client for interacting with endpoints of the snap Store API.
 Ref: https://api.snapcraft.io/docs/
 """
 
+from collections import defaultdict
+from dataclasses import dataclass
+from threading import Lock
+
 from craft_store import BaseClient, HTTPClient
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from snapstore.cache import ResponseCache
+from snapstore.projection import Projection
+from snapstore.retry import RetryMetrics, RetryPolicy, TokenBucket
+
+
+@dataclass
+class HostStats:
+    """
+    Connection reuse statistics for a single host
+    """
+
+    requests: int = 0
+    connections: int = 0
+
+    @property
+    def reused(self) -> int:
+        return self.requests - self.connections
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    An HTTP adapter that keeps a pool of persistent (keep-alive)
+    connections and records how often connections are reused, per host.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = defaultdict(HostStats)
+        self._stats_lock = Lock()
+
+    def get_pool(self, request, verify=True, cert=None, proxies=None, **_):
+        """
+        Return the connection pool that a request is sent through (pools
+        are keyed by TLS settings as well as by host, since requests 2.32)
+        """
+        try:
+            get_connection = self.get_connection_with_tls_context
+        except AttributeError:
+            return self.get_connection(request.url, proxies)
+        return get_connection(request, verify, proxies, cert)
+
+    def send(self, request, **kwargs):
+        # the number of connections opened by the pool before and after
+        # the request reveals whether an existing connection was reused
+        pool = self.get_pool(request, **kwargs)
+        connections = pool.num_connections
+        response = super().send(request, **kwargs)
+        with self._stats_lock:
+            stats = self.stats[pool.host]
+            stats.requests += 1
+            stats.connections += pool.num_connections - connections
+        return response
 
 
 class SnapstoreClient:
     """
     Interact with endpoints of the snap Store API
+
+    All requests to the snap Store API go through a pool of persistent
+    connections, mounted on the session of the underlying craft-store
+    client, so that consecutive requests do not pay for a new connection
+    (and TLS handshake) every time.
+
+    If a `ResponseCache` is provided, responses are served from the cache
+    while they are fresh and revalidated with the Store once they are stale.
+
+    Failed requests are retried according to a `RetryPolicy` and, if a
+    `TokenBucket` is provided, requests are paced by it (it can be shared
+    by multiple clients and threads). Retries, throttled responses and
+    delays are counted in `metrics`.
+
+    If a `Projection` is provided with a request, the body of the response
+    is streamed (in chunks of `stream_chunk_size` bytes) and only the
+    selected paths are decoded and retained.
     """
 
     snapstore_url = "https://api.snapcraft.io"
+    stream_chunk_size = 64 * 1024
 
-    def __init__(self, base_client: BaseClient | HTTPClient):
+    def __init__(
+        self,
+        base_client: BaseClient | HTTPClient,
+        pool_size: int = 10,
+        cache: ResponseCache | None = None,
+        retry_policy: RetryPolicy | None = None,
+        rate_limiter: TokenBucket | None = None,
+        timeout: float = 10,
+    ):
         self.base_client = base_client
+        self.adapter = self.mount_adapter(pool_size)
+        self.cache = cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.metrics = RetryMetrics()
+
+    def get_session(self) -> Session | None:
+        """
+        Return the `requests` session used by the underlying craft-store
+        client (an `HTTPClient` or a `BaseClient` wrapping one).
+        """
+        http_client = getattr(self.base_client, "http_client", self.base_client)
+        try:
+            return http_client._session
+        except AttributeError:
+            return None
+
+    def mount_adapter(self, pool_size: int) -> PooledHTTPAdapter | None:
+        """
+        Mount a pooled adapter for the snap Store API on the session of
+        the underlying craft-store client and return it (or None if the
+        client does not expose a session).
+
+        The adapter that is being replaced retries both connection errors
+        and error responses: only the former are still retried by the
+        pooled adapter, so that error responses reach the `RetryPolicy` of
+        the client (with its backoff, `Retry-After` handling and metrics).
+        """
+        session = self.get_session()
+        if session is None:
+            return None
+        max_retries = session.get_adapter(self.snapstore_url).max_retries.new(
+            status_forcelist=None, respect_retry_after_header=False
+        )
+        adapter = PooledHTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=max_retries,
+        )
+        session.mount(self.snapstore_url, adapter)
+        return adapter
+
+    def connection_stats(self) -> dict[str, HostStats]:
+        """
+        Return connection reuse statistics for each host that has been
+        contacted through the pooled adapter.
+        """
+        if self.adapter is None:
+            return {}
+        return dict(self.adapter.stats)
+
+    def close(self):
+        """
+        Close all pooled connections
+        """
+        if self.adapter is not None:
+            self.adapter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     def get_authorization_header(self) -> str:
         try:
@@ -38,26 +187,111 @@ class SnapstoreClient:
             **({"Authorization": authorization} if authorization else {}),
         }
 
+    def request(
+        self,
+        method: str,
+        endpoint: str,
+        store: str | None = None,
+        headers: dict | None = None,
+        projection: Projection | None = None,
+        **kwargs,
+    ) -> dict:
+        """
+        Submit a request to an endpoint of the snap Store API and return
+        a dict with the contents of the response (possibly from the cache),
+        or with its projection, if a `projection` is provided.
+
+        Additional keyword arguments (i.e. `params` or `json`) are passed
+        on to the underlying craft-store client.
+        """
+        url = f"{self.snapstore_url}/{endpoint}"
+        headers = self.create_headers(store, headers)
+        if projection is not None:
+            kwargs["stream"] = True
+        key = entry = None
+        if self.cache is not None:
+            data = kwargs
+            if projection is not None:
+                # projected responses are cached separately from full ones
+                data = {**kwargs, "projection": projection.paths}
+            key = self.cache.key(method, url, headers, data)
+            entry = self.cache.get(key)
+            if entry is not None:
+                if self.cache.is_fresh(entry):
+                    return entry.body
+                if entry.etag:
+                    headers = {**headers, "If-None-Match": entry.etag}
+
+        def send():
+            if self.rate_limiter is not None:
+                delay = self.rate_limiter.acquire()
+                if delay:
+                    self.metrics.record(waits=1, wait_time=delay)
+            try:
+                response = self.base_client.request(
+                    method=method,
+                    url=url,
+                    # the underlying client may modify the headers
+                    headers=dict(headers),
+                    timeout=self.timeout,
+                    **kwargs,
+                )
+                response.raise_for_status()
+            except Exception as error:
+                # release the connection of a (streamed) error response
+                # before the request is retried
+                error_response = getattr(error, "response", None)
+                if error_response is not None:
+                    error_response.close()
+                raise
+            return response
+
+        response = self.retry_policy.call(send, self.metrics)
+        if key is not None and response.status_code == 304 and entry is not None:
+            # a streamed response holds its connection until it is closed
+            response.close()
+            self.cache.revalidated(key, entry)
+            return entry.body
+        body = self.decode(response, projection)
+        if key is not None:
+            self.cache.put(key, body, response.headers.get("ETag"))
+        return body
+
+    def decode(self, response, projection: Projection | None = None) -> dict:
+        """
+        Return the contents of a response, or their projection (decoded
+        while the response is streamed) if a `projection` is provided.
+        """
+        if projection is None:
+            return response.json()
+        try:
+            return projection.decode(
+                response.iter_content(chunk_size=self.stream_chunk_size)
+            )
+        finally:
+            # release the connection even if the body was not fully read
+            response.close()
+
     def get(
         self,
         endpoint: str,
         params: dict | None = None,
         store: str | None = None,
         headers: dict | None = None,
+        projection: Projection | None = None,
     ) -> dict:
         """
         Submit a GET request to an endpoint of the snap Store API
         and return a dict with the contents of the response.
         """
-        response = self.base_client.request(
-            method="GET",
-            url=f"{self.snapstore_url}/{endpoint}",
-            headers=self.create_headers(store, headers),
+        return self.request(
+            "GET",
+            endpoint,
+            store=store,
+            headers=headers,
+            projection=projection,
             params=(params or {}),
-            timeout=10,
         )
-        response.raise_for_status()
-        return response.json()
 
     def post(
         self,
@@ -70,12 +304,6 @@ class SnapstoreClient:
         Submit a POST request to an endpoint of the snap Store API
         and return a dict with the contents of the response.
         """
-        response = self.base_client.request(
-            method="POST",
-            url=f"{self.snapstore_url}/{endpoint}",
-            headers=self.create_headers(store, headers),
-            json=payload,
-            timeout=10,
+        return self.request(
+            "POST", endpoint, store=store, headers=headers, json=payload
         )
-        response.raise_for_status()
-        return response.json()
@@ -1,6 +1,9 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Iterable
 
 from snapstore.client import SnapstoreClient
+from snapstore.projection import Projection
 from snapstore.snaps import SnapSpecifier
 
 
@@ -11,10 +14,22 @@ class SnapstoreInfo:
     Ref:
     - https://api.snapcraft.io/docs/refresh.html
     - https://api.snapcraft.io/docs/info.html
+
+    Large `v2/snaps/refresh` requests are split into chunks of at most
+    `chunk_size` actions, which are submitted concurrently (using up to
+    `max_workers` threads). Each chunk is a separate request, retried by
+    the client according to its retry policy.
     """
 
-    def __init__(self, client: SnapstoreClient):
+    def __init__(
+        self,
+        client: SnapstoreClient,
+        chunk_size: int = 200,
+        max_workers: int = 4,
+    ):
         self.client = client
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
 
     def get_snap_info(
         self,
@@ -22,6 +37,7 @@ class SnapstoreInfo:
         architecture: str | None = None,
         store: str | None = None,
         fields: Iterable[str] | None = None,
+        projection: Projection | Iterable[str] | None = None,
     ) -> dict:
         """
         Return info for a specific snap, as retrieved from the
@@ -30,17 +46,33 @@ class SnapstoreInfo:
         The result contains a `channel-map` with information about
         the different channels on which the snap is published.
 
+        If a `projection` is provided (e.g. `["channel-map.channel",
+        "channel-map.version"]`), only the fields it selects in the channel
+        map (and the `snap` object) are requested from the Store and the
+        result only contains the selected paths, decoded while the response
+        is streamed.
+
         Ref: https://api.snapcraft.io/docs/info.html
         """
         params = {}
         if architecture:
             params["architecture"] = architecture
+        if projection is not None:
+            if not isinstance(projection, Projection):
+                projection = Projection(projection)
+            # the channel of each entry is always included by the Store
+            fields = sorted(
+                {field.strip() for field in fields or ()}
+                | {*projection.keys("channel-map"), *projection.keys("snap")}
+                - {"channel"}
+            )
         if fields:
             params["fields"] = ",".join(field.strip() for field in fields)
         return self.client.get(
             endpoint=f"v2/snaps/info/{snap}",
             params=params,
             store=store,
+            **({"projection": projection} if projection is not None else {}),
         )
 
     def get_refresh_info(
@@ -49,25 +81,53 @@ class SnapstoreInfo:
         architecture: str,
         store: str | None = None,
         fields: Iterable[str] | None = None,
-    ) -> dict:
+    ) -> list[dict]:
         """
-        Return info for a collection of snaps, as retrieved from the
+        Return a list with the info for each of a collection of snaps (in
+        the same order as the snap specifiers), as retrieved from the
         `v2/snaps/refresh` endpoint of the snap Store API.
 
         Ref: https://api.snapcraft.io/docs/refresh.html
         """
-        payload = {
-            "context": [],
-            "actions": [
-                {
-                    "name": snap.name,
-                    "channel": str(snap.channel),
-                    "action": "download",
-                    "instance-key": snap.name,
-                }
-                for snap in snap_specifiers
-            ],
-        }
+        actions = [
+            {
+                "name": snap.name,
+                "channel": str(snap.channel),
+                "action": "download",
+                "instance-key": snap.name,
+            }
+            for snap in snap_specifiers
+        ]
+        chunks = [
+            actions[start : start + self.chunk_size]
+            for start in range(0, len(actions), self.chunk_size)
+        ] or [[]]
+
+        def refresh(chunk: list) -> list:
+            return self._refresh_chunk(chunk, architecture, store, fields)
+
+        if len(chunks) == 1:
+            return refresh(chunks[0])
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # `map` returns the results of the chunks in order
+            return [
+                result
+                for results in executor.map(refresh, chunks)
+                for result in results
+            ]
+
+    def _refresh_chunk(
+        self,
+        actions: list,
+        architecture: str,
+        store: str | None = None,
+        fields: Iterable[str] | None = None,
+    ) -> list[dict]:
+        """
+        Submit a single `v2/snaps/refresh` request for a chunk of actions
+        and return its results, in the same order as the actions.
+        """
+        payload = {"context": [], "actions": actions}
         if fields:
             payload["fields"] = sorted(fields)
         response = self.client.post(
@@ -76,4 +136,37 @@ class SnapstoreInfo:
             store=store,
             headers={"Snap-Device-Architecture": architecture},
         )
-        return response["results"]
+
+        positions = {
+            action["instance-key"]: index for index, action in enumerate(actions)
+        }
+        return sorted(
+            response["results"],
+            key=lambda result: positions.get(result.get("instance-key"), len(actions)),
+        )
+
+
+def group_refresh_requests(
+    entries: Iterable[tuple[SnapSpecifier, str, str | None]],
+) -> dict[tuple[str, str | None], list[list[SnapSpecifier]]]:
+    """
+    Group (snap specifier, architecture, store) entries by (architecture,
+    store) and split each group into lists of snap specifiers that can be
+    resolved with a single `v2/snaps/refresh` request.
+
+    The snap name is used as the instance key of each refresh action, so
+    specifiers for the same snap on different channels (within a group)
+    are placed in separate requests.
+    """
+    groups = defaultdict(list)
+    for snap, architecture, store in entries:
+        batches = groups[(architecture, store)]
+        for batch in batches:
+            if snap in batch:
+                break
+            if all(other.name != snap.name for other in batch):
+                batch.append(snap)
+                break
+        else:
+            batches.append([snap])
+    return dict(groups)
@@ -0,0 +1,218 @@
+"""
+Field projections for responses of the snap Store API.
+
+A `Projection` selects (dotted) paths in a JSON document, such as
+`channel-map.version`, and decodes a response incrementally, as its
+body is streamed, keeping only the selected paths. Unselected values
+are discarded as soon as they are decoded, so that (for instance) the
+full channel map of a snap with many tracks is never held in memory
+when only a few of its fields are needed.
+
+Example:
+```
+projection = Projection(["name", "channel-map.channel", "channel-map.version"])
+document = projection.decode(response.iter_content(chunk_size=65536))
+```
+"""
+
+import codecs
+import json
+import re
+from collections.abc import Iterable, Iterator
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# the (C) scanner used by `json.loads` for a single value
+SCANNER = json.JSONDecoder().scan_once
+
+
+class _Reader:
+    """
+    A buffer over a stream of text chunks, holding only the part of the
+    document that has not been consumed yet (and the value being decoded).
+    """
+
+    def __init__(self, chunks: Iterable[str]):
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.position = 0
+        self.exhausted = False
+
+    def read(self, size: int = 1) -> bool:
+        """
+        Append (at least `size` characters of) the next chunks to the
+        buffer and return False if the stream is exhausted.
+        """
+        if self.exhausted:
+            return False
+        chunks = [self.buffer[self.position :]]
+        length = 0
+        while length < max(size, 1):
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.exhausted = True
+                break
+            chunks.append(chunk)
+            length += len(chunk)
+        self.buffer = "".join(chunks)
+        self.position = 0
+        return length > 0
+
+    def peek(self) -> str:
+        """
+        Skip any whitespace and return the next character
+        (or an empty string at the end of the stream).
+        """
+        while True:
+            self.position = WHITESPACE.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.read():
+                return ""
+
+    def expect(self, characters: str) -> str:
+        """
+        Consume and return the next character, which should be one of
+        `characters`.
+        """
+        character = self.peek()
+        if not character or character not in characters:
+            raise json.JSONDecodeError(
+                f"Expecting one of {characters!r}", self.buffer, self.position
+            )
+        self.position += 1
+        return character
+
+    def value(self):
+        """
+        Decode and consume a complete value, reading more chunks until
+        the buffer contains all of it.
+        """
+        self.peek()
+        while True:
+            pending = len(self.buffer) - self.position
+            try:
+                value, end = SCANNER(self.buffer, self.position)
+            except (StopIteration, json.JSONDecodeError) as error:
+                # the value is (probably) incomplete: read at least as much
+                # as is already buffered, so that large values are decoded
+                # a logarithmic (rather than linear) number of times
+                if self.read(pending):
+                    continue
+                if isinstance(error, json.JSONDecodeError):
+                    raise
+                raise json.JSONDecodeError(
+                    "Expecting value", self.buffer, self.position
+                ) from None
+            # a number that ends with the buffer may continue in the next chunk
+            if (
+                isinstance(value, (int, float))
+                and end == len(self.buffer)
+                and self.read()
+            ):
+                continue
+            self.position = end
+            return value
+
+
+class Projection:
+    """
+    Select (dotted) paths in a JSON document
+
+    Each path is a sequence of object keys separated by dots and arrays are
+    traversed transparently, e.g. `channel-map.channel.track` selects the
+    track of every entry in the channel map. A path selects the whole value
+    it leads to and any longer paths that share it as a prefix are redundant.
+    """
+
+    def __init__(self, paths: Iterable[str]):
+        self.paths = tuple(paths)
+        # a tree of selected keys: each node is either a dict of selected
+        # keys or True (i.e. the whole value is selected)
+        self.tree = {}
+        for path in self.paths:
+            *parents, leaf = path.split(".")
+            node = self.tree
+            for key in parents:
+                node = node.setdefault(key, {})
+                if node is True:
+                    break
+            else:
+                node[leaf] = True
+
+    def keys(self, path: str) -> list[str]:
+        """
+        Return the keys selected within a (dotted) path, e.g. the fields
+        of channel map entries to request from the Store.
+        """
+        node = self.tree
+        for key in path.split("."):
+            node = node.get(key) if isinstance(node, dict) else None
+        return sorted(node) if isinstance(node, dict) else []
+
+    def decode(self, chunks: Iterable[str | bytes]):
+        """
+        Decode a JSON document from a stream of (text or UTF-8 encoded)
+        chunks and return the projection of the document.
+        """
+        reader = _Reader(_decode_text(chunks))
+        document = _decode_node(reader, self.tree)
+        if reader.peek():
+            raise json.JSONDecodeError("Extra data", reader.buffer, reader.position)
+        return document
+
+    def loads(self, string: str | bytes):
+        """
+        Decode a JSON document from a string and return its projection.
+        """
+        return self.decode([string])
+
+
+def _decode_text(chunks: Iterable[str | bytes]) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in chunks:
+        yield decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+    yield decoder.decode(b"", final=True)
+
+
+def _decode_node(reader: _Reader, node: dict | bool):
+    """
+    Decode the next value in the stream, keeping only the keys
+    selected by a node of a projection tree.
+    """
+    if node is True:
+        return reader.value()
+    character = reader.peek()
+    if character == "{":
+        reader.position += 1
+        document = {}
+        if reader.peek() == "}":
+            reader.position += 1
+            return document
+        while True:
+            key = reader.value()
+            if not isinstance(key, str):
+                raise json.JSONDecodeError(
+                    "Expecting property name", reader.buffer, reader.position
+                )
+            reader.expect(":")
+            child = node.get(key)
+            if child is None:
+                # decoded (in C) and discarded right away
+                reader.value()
+            else:
+                document[key] = _decode_node(reader, child)
+            if reader.expect(",}") == "}":
+                return document
+    if character == "[":
+        reader.position += 1
+        document = []
+        if reader.peek() == "]":
+            reader.position += 1
+            return document
+        while True:
+            document.append(_decode_node(reader, node))
+            if reader.expect(",]") == "]":
+                return document
+    # a scalar where an object was expected is kept as is
+    return reader.value()
@@ -0,0 +1,161 @@
+"""
+Retry policies and client-side rate limiting for requests to the
+snap Store API.
+
+A `RetryPolicy` decides which errors are transient and how long to wait
+before retrying (honouring any `Retry-After` header sent by the Store),
+while a `TokenBucket` paces requests from all threads sharing it, so that
+bursts of requests slow down instead of being throttled by the Store.
+"""
+
+import random
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from threading import Lock
+
+
+@dataclass
+class RetryMetrics:
+    """
+    Counters for retried, throttled and delayed requests
+
+    `waits` is the number of times a request was delayed (by the rate
+    limiter or before a retry) and `wait_time` the total delay in seconds.
+    """
+
+    retries: int = 0
+    throttles: int = 0
+    waits: int = 0
+    wait_time: float = 0.0
+    _lock: Lock = field(default_factory=Lock, init=False, repr=False, compare=False)
+
+    def record(self, **increments):
+        with self._lock:
+            for name, increment in increments.items():
+                setattr(self, name, getattr(self, name) + increment)
+
+
+def get_status_code(error: Exception) -> int | None:
+    """
+    Return the status code of the response carried by an error raised
+    by a request (if any)
+    """
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def get_retry_after(error: Exception) -> float | None:
+    """
+    Return the delay (in seconds) requested by the `Retry-After` header of
+    the response carried by an error, or None if there is no such header.
+
+    Ref: https://www.rfc-editor.org/rfc/rfc9110#field.retry-after
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        value = headers.get("Retry-After")
+    except AttributeError:
+        return None
+    if not isinstance(value, str):
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Retry requests that fail with a transient error (by default, a 429
+    or 5xx response) up to `retries` times.
+
+    The delay before each retry is the one requested by the Store through
+    `Retry-After` or, if there is none, an exponential backoff (starting at
+    `backoff` seconds, capped at `max_backoff`) with "full" jitter.
+    """
+
+    def __init__(
+        self,
+        retries: int = 3,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        jitter: bool = True,
+        statuses: tuple[int, ...] = (429, 500, 502, 503, 504),
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = statuses
+
+    def is_retryable(self, error: Exception) -> bool:
+        return get_status_code(error) in self.statuses
+
+    def get_delay(self, attempt: int, error: Exception) -> float:
+        """
+        Return the delay (in seconds) before retrying after the `attempt`-th
+        failed attempt (counting from 0).
+        """
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        delay = min(self.backoff * 2**attempt, self.max_backoff)
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def call(self, function: Callable, metrics: RetryMetrics | None = None):
+        """
+        Call `function` (with no arguments), retrying it according to the
+        policy, and return its result or raise its last error.
+        """
+        metrics = metrics or RetryMetrics()
+        attempt = 0
+        while True:
+            try:
+                return function()
+            except Exception as error:
+                if get_status_code(error) == 429:
+                    metrics.record(throttles=1)
+                if attempt >= self.retries or not self.is_retryable(error):
+                    raise
+                delay = self.get_delay(attempt, error)
+                metrics.record(retries=1, waits=1, wait_time=delay)
+                time.sleep(delay)
+                attempt += 1
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket that allows `rate` requests per second on
+    average, with bursts of up to `capacity` requests.
+    """
+
+    def __init__(self, rate: float, capacity: int | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(int(rate), 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self) -> float:
+        """
+        Take a token from the bucket, waiting until one is available,
+        and return the time (in seconds) spent waiting.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # reserve a token: a negative balance is the queue of waiters
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+        return delay
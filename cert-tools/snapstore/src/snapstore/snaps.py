@@ -1,8 +1,19 @@
 import re
 from dataclasses import dataclass, astuple
+from functools import lru_cache
 
 
-@dataclass(frozen=True)
+# pattern for matching snap channels in the form track/risk/branch
+# (only one of the components is required)
+CHANNEL_PATTERN = re.compile(r"^(?:([\w.-]+)(?:/([\w-]+)(?:/([\w-]+))?)?)?$")
+
+# pattern for matching snap specifiers in the form snap=channel
+SPECIFIER_PATTERN = re.compile(r"^([\w-]+)=(.+)$")
+
+RISKS = frozenset({"stable", "candidate", "beta", "edge"})
+
+
+@dataclass(frozen=True, slots=True)
 class SnapChannel:
     track: str | None = None
     risk: str | None = None
@@ -14,37 +25,45 @@ class SnapChannel:
 
     @classmethod
     def from_string(cls, string):
-        # template for matching snap channels in the form track/risk/branch
-        # (only one of the components is required)
-        channel_template = r"^(?:([\w.-]+)(?:/([\w-]+)(?:/([\w-]+))?)?)?$"
-        match = re.match(channel_template, string)
-        if not match:
-            raise ValueError(f"Cannot parse '{string}' as a snap channel")
-        components = tuple(component for component in match.groups() if component)
-        if components and components[0] in {"stable", "candidate", "beta", "edge"}:
-            components = (None, *components)
-        return cls(*components)
+        # parsing is memoized: the same (immutable) instance is returned
+        # for repeated occurrences of the same string
+        return _parse_channel(cls, string)
 
     def __str__(self):
         return "/".join(component for component in astuple(self) if component)
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class SnapSpecifier:
     name: str
     channel: SnapChannel
 
     @classmethod
     def from_string(cls, string):
-        # template for matching snap specifiers in the form snap=channel
-        # (only one of the components is required)
-        specifier_template = r"^([\w-]+)=(.+)$"
-        match = re.match(specifier_template, string)
-        if not match:
-            raise ValueError(f"Cannot parse '{string}' as a snap specifier")
-        name, channel = match.groups()
-        channel = SnapChannel.from_string(channel)
-        return cls(name=name, channel=channel)
+        # parsing is memoized: the same (immutable) instance is returned
+        # for repeated occurrences of the same string
+        return _parse_specifier(cls, string)
 
     def __str__(self):
         return f"{self.name}={self.channel}"
+
+
+@lru_cache(maxsize=4096)
+def _parse_channel(cls: type[SnapChannel], string: str) -> SnapChannel:
+    match = CHANNEL_PATTERN.match(string)
+    if not match:
+        raise ValueError(f"Cannot parse '{string}' as a snap channel")
+    components = tuple(component for component in match.groups() if component)
+    if components and components[0] in RISKS:
+        components = (None, *components)
+    return cls(*components)
+
+
+@lru_cache(maxsize=4096)
+def _parse_specifier(cls: type[SnapSpecifier], string: str) -> SnapSpecifier:
+    match = SPECIFIER_PATTERN.match(string)
+    if not match:
+        raise ValueError(f"Cannot parse '{string}' as a snap specifier")
+    name, channel = match.groups()
+    channel = SnapChannel.from_string(channel)
+    return cls(name=name, channel=channel)
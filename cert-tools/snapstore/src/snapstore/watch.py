@@ -0,0 +1,182 @@
+"""
+Watch the channel maps of snaps in the snap Store and report changes.
+
+Instead of re-fetching (and re-processing) the full state of a snap on
+fixed intervals, a `SnapstoreWatch` keeps the last channel map of each
+snap in memory and yields events only for the channels that changed:
+
+- `added`: a channel (and architecture) that was not there before
+  (on the first poll of a snap, every channel is reported as added)
+- `updated`: a channel that now tracks a different revision
+- `removed`: a channel that is no longer there (e.g. it was closed)
+- `error`: a request that failed (the snap is polled again later)
+
+Example:
+```
+watch = SnapstoreWatch(SnapstoreInfo(client), ["checkbox", "checkbox22"])
+for event in watch.watch():
+    print(json.dumps(event))
+```
+"""
+
+import heapq
+import time
+from collections.abc import Iterable, Iterator
+
+from craft_store.errors import CraftStoreError
+from requests import RequestException
+
+from snapstore.channel_map import ChannelMap
+from snapstore.info import SnapstoreInfo
+from snapstore.projection import Projection
+from snapstore.snaps import SnapChannel
+
+# fields of channel map entries that are always retrieved and reported
+WATCHED_FIELDS = ("revision", "version")
+
+
+def _create_event(
+    event: str,
+    snap: str,
+    key: tuple,
+    entry: dict | None = None,
+    previous: dict | None = None,
+    fields: Iterable[str] = WATCHED_FIELDS,
+) -> dict:
+    track, risk, branch, architecture = key
+    record = {
+        "event": event,
+        "snap": snap,
+        "channel": str(SnapChannel(track, risk, branch)),
+        "architecture": architecture,
+    }
+    if entry is not None:
+        record.update({field: entry.get(field) for field in fields})
+    if previous is not None:
+        record.update({f"previous-{field}": previous.get(field) for field in fields})
+    return record
+
+
+def diff_channel_maps(
+    snap: str,
+    previous: dict[tuple, dict],
+    current: dict[tuple, dict],
+    fields: Iterable[str] = WATCHED_FIELDS,
+) -> list[dict]:
+    """
+    Return the events that turn one channel map of a snap into another,
+    where each channel map is a dict of entries keyed by (track, risk,
+    branch, architecture), i.e. the `entries` of a `ChannelMap`.
+
+    An entry is considered updated if its revision or version changed.
+    """
+    fields = tuple(fields)
+    events = []
+    for key, entry in current.items():
+        before = previous.get(key)
+        if before is None:
+            events.append(_create_event("added", snap, key, entry, fields=fields))
+        elif any(before.get(field) != entry.get(field) for field in WATCHED_FIELDS):
+            events.append(
+                _create_event("updated", snap, key, entry, before, fields=fields)
+            )
+    for key, before in previous.items():
+        if key not in current:
+            events.append(
+                _create_event("removed", snap, key, previous=before, fields=fields)
+            )
+    return events
+
+
+class SnapstoreWatch:
+    """
+    Poll the channel maps of snaps and report changes as events
+
+    Each snap is polled on its own adaptive interval: it starts at
+    `interval` seconds, it is multiplied by `backoff` after every poll
+    that reveals no changes (or fails), up to `max_interval`, and it is
+    reset as soon as a change is observed.
+
+    Only the channel, revision and version (and any additional `fields`)
+    of each channel map entry are requested from the Store. If the client
+    has a `ResponseCache`, unchanged channel maps are revalidated with
+    conditional requests rather than downloaded again.
+    """
+
+    def __init__(
+        self,
+        info: SnapstoreInfo,
+        snaps: Iterable[str],
+        architecture: str | None = None,
+        store: str | None = None,
+        fields: Iterable[str] | None = None,
+        interval: float = 60.0,
+        max_interval: float = 600.0,
+        backoff: float = 2.0,
+    ):
+        self.info = info
+        self.snaps = list(dict.fromkeys(snaps))
+        self.architecture = architecture
+        self.store = store
+        self.fields = tuple(dict.fromkeys((*WATCHED_FIELDS, *(fields or ()))))
+        self.projection = Projection(
+            ["channel-map.channel"] + [f"channel-map.{field}" for field in self.fields]
+        )
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        # the last channel map and the current interval of each snap
+        self.channel_maps = {}
+        self.intervals = {snap: interval for snap in self.snaps}
+
+    def poll(self, snap: str) -> list[dict]:
+        """
+        Retrieve the channel map of a snap, return the events for any
+        changes since the previous poll and adapt the polling interval.
+        """
+        response = self.info.get_snap_info(
+            snap=snap,
+            architecture=self.architecture,
+            store=self.store,
+            projection=self.projection,
+        )
+        current = ChannelMap.from_response(response).entries
+        previous = self.channel_maps.get(snap, {})
+        self.channel_maps[snap] = current
+        events = diff_channel_maps(snap, previous, current, self.fields)
+        if events:
+            self.intervals[snap] = self.interval
+        else:
+            self.slow_down(snap)
+        return events
+
+    def slow_down(self, snap: str):
+        self.intervals[snap] = min(
+            self.intervals.get(snap, self.interval) * self.backoff, self.max_interval
+        )
+
+    def watch(self, polls: int | None = None) -> Iterator[dict]:
+        """
+        Poll each snap when its interval expires and yield events as
+        they occur, indefinitely (or until each snap has been polled
+        `polls` times).
+        """
+        counts = dict.fromkeys(self.snaps, 0)
+        now = time.monotonic()
+        schedule = [(now, index, snap) for index, snap in enumerate(self.snaps)]
+        while schedule:
+            due, index, snap = heapq.heappop(schedule)
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                events = self.poll(snap)
+            except (CraftStoreError, RequestException, ValueError) as error:
+                self.slow_down(snap)
+                events = [{"event": "error", "snap": snap, "error": str(error)}]
+            yield from events
+            counts[snap] += 1
+            if polls is None or counts[snap] < polls:
+                heapq.heappush(
+                    schedule, (time.monotonic() + self.intervals[snap], index, snap)
+                )
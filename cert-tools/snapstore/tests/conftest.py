@@ -0,0 +1,92 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+from pytest import fixture
+
+from snapstore.client import SnapstoreClient
+from snapstore.craft import HTTPClient
+
+
+class StoreServer(ThreadingHTTPServer):
+    """
+    A local stand-in for the snap Store API that answers the first
+    `failures` requests with 503 Service Unavailable (all of them, if
+    `failures` is None) and the rest with a snap info document (GET) or
+    with a refresh result for each action (POST)
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StoreHandler)
+        self.failures = None
+        self.requests = 0
+        # (requests are handled concurrently)
+        self.lock = Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def client(self, **kwargs) -> SnapstoreClient:
+        """
+        Return a client of this server that submits its requests through
+        a real craft-store `HTTPClient` (and its session and adapters)
+        """
+        local_client = type(
+            "LocalSnapstoreClient", (SnapstoreClient,), {"snapstore_url": self.url}
+        )
+        return local_client(HTTPClient(user_agent="test"), **kwargs)
+
+
+class StoreHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def fail(self) -> bool:
+        with self.server.lock:
+            self.server.requests += 1
+            failures = self.server.failures
+            if failures is None:
+                return True
+            self.server.failures = max(failures - 1, 0)
+            return failures > 0
+
+    def respond(self, document: dict):
+        if self.fail():
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        content = json.dumps(document).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self.respond({"name": "snap"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+        self.respond(
+            {
+                "results": [
+                    {"instance-key": action["instance-key"], "result": "refresh"}
+                    for action in payload["actions"]
+                ]
+            }
+        )
+
+    def log_message(self, *args):
+        pass
+
+
+@fixture
+def store_server():
+    server = StoreServer()
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
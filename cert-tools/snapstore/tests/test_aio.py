@@ -0,0 +1,199 @@
+import asyncio
+import threading
+import time
+
+from pytest import fixture, raises
+
+from snapstore.aio import AsyncSnapstoreClient, AsyncSnapstoreInfo
+from snapstore.client import SnapstoreClient
+from snapstore.snaps import SnapSpecifier
+
+
+def refresh_results(snap_specifiers, architecture, store=None, fields=None):
+    """Emulate the results of a `v2/snaps/refresh` request."""
+    return [
+        {
+            "result": "download",
+            "instance-key": snap.name,
+            "snap": {"name": snap.name, "architecture": architecture},
+            "effective-channel": str(snap.channel),
+        }
+        for snap in snap_specifiers
+    ]
+
+
+class TestAsyncSnapstoreClient:
+    """Test cases for AsyncSnapstoreClient"""
+
+    @fixture
+    def mock_client(self, mocker):
+        """Create a mock SnapstoreClient."""
+        return mocker.create_autospec(SnapstoreClient, instance=True)
+
+    def test_get(self, mock_client):
+        """Test that GET requests are delegated to the wrapped client"""
+        mock_client.get.return_value = {"result": "success"}
+        client = AsyncSnapstoreClient(mock_client)
+
+        result = asyncio.run(client.get("v2/snaps/info/snap", store="ubuntu"))
+
+        assert result == {"result": "success"}
+        mock_client.get.assert_called_once_with(
+            "v2/snaps/info/snap", params=None, store="ubuntu", headers=None
+        )
+
+    def test_post(self, mock_client):
+        """Test that POST requests are delegated to the wrapped client"""
+        mock_client.post.return_value = {"result": "success"}
+        client = AsyncSnapstoreClient(mock_client)
+
+        result = asyncio.run(client.post("v2/snaps/refresh", payload={}))
+
+        assert result == {"result": "success"}
+        mock_client.post.assert_called_once_with(
+            "v2/snaps/refresh", payload={}, store=None, headers=None
+        )
+
+    def test_timeout(self, mock_client):
+        """Test that slow requests raise a TimeoutError"""
+        mock_client.get.side_effect = lambda *args, **kwargs: time.sleep(0.5)
+        client = AsyncSnapstoreClient(mock_client, timeout=0.01)
+
+        with raises(asyncio.TimeoutError):
+            asyncio.run(client.get("v2/snaps/info/snap"))
+
+    def test_timed_out_request_holds_slot(self, mock_client):
+        """Test that an abandoned request is still bounded by `concurrency`"""
+        started = []
+
+        def get(endpoint, **kwargs):
+            started.append((endpoint, time.monotonic()))
+            time.sleep(0.3)
+            if endpoint == "first":
+                raise ValueError("abandoned")
+            return {}
+
+        mock_client.get.side_effect = get
+        client = AsyncSnapstoreClient(mock_client, concurrency=1, timeout=0.05)
+
+        async def requests():
+            with raises(asyncio.TimeoutError):
+                await client.get("first")
+            client.timeout = None
+            return await client.get("second")
+
+        assert asyncio.run(requests()) == {}
+        (_, first), (_, second) = started
+        # the second request waited for the thread of the first one
+        assert second - first >= 0.3
+
+    def test_bounded_concurrency(self, mock_client):
+        """Test that no more than `concurrency` requests run at once"""
+        lock = threading.Lock()
+        running = []
+        peak = []
+
+        def get(*args, **kwargs):
+            with lock:
+                running.append(None)
+                peak.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.pop()
+            return {}
+
+        mock_client.get.side_effect = get
+        client = AsyncSnapstoreClient(mock_client, concurrency=2)
+
+        async def fan_out():
+            await asyncio.gather(*(client.get("endpoint") for _ in range(6)))
+
+        asyncio.run(fan_out())
+        assert max(peak) == 2
+
+    def test_consecutive_event_loops(self, mock_client):
+        """Test that a client can be reused by consecutive event loops"""
+
+        def get(*args, **kwargs):
+            time.sleep(0.01)
+            return {}
+
+        mock_client.get.side_effect = get
+        client = AsyncSnapstoreClient(mock_client, concurrency=1)
+
+        async def fan_out():
+            return await asyncio.gather(*(client.get("endpoint") for _ in range(3)))
+
+        # requests wait for the semaphore in both event loops
+        assert asyncio.run(fan_out()) == [{}] * 3
+        assert asyncio.run(fan_out()) == [{}] * 3
+
+
+class TestAsyncSnapstoreInfo:
+    """Test cases for AsyncSnapstoreInfo"""
+
+    @fixture
+    def info(self, mocker):
+        """Create AsyncSnapstoreInfo around a mock SnapstoreClient."""
+        mock_client = mocker.create_autospec(SnapstoreClient, instance=True)
+        return AsyncSnapstoreInfo(AsyncSnapstoreClient(mock_client))
+
+    def test_get_snap_info(self, info):
+        """Test that get_snap_info is delegated to SnapstoreInfo"""
+        info.client.client.get.return_value = {"channel-map": []}
+
+        result = asyncio.run(info.get_snap_info("snap", architecture="amd64"))
+
+        assert result == {"channel-map": []}
+        info.client.client.get.assert_called_once_with(
+            endpoint="v2/snaps/info/snap",
+            params={"architecture": "amd64"},
+            store=None,
+        )
+
+    def test_get_refresh_info(self, info):
+        """Test that get_refresh_info is delegated to SnapstoreInfo"""
+        info.client.client.post.return_value = {"results": [{"name": "snap"}]}
+        snaps = [SnapSpecifier.from_string("snap=edge")]
+
+        result = asyncio.run(info.get_refresh_info(snaps, architecture="amd64"))
+
+        assert result == [{"name": "snap"}]
+
+    def test_gather_info(self, info, mocker):
+        """Test one request per (architecture, store) and results in order"""
+        mock_refresh = mocker.patch.object(
+            info.info, "get_refresh_info", side_effect=refresh_results
+        )
+        entries = [
+            (SnapSpecifier.from_string(f"snap-{index}=edge"), architecture, store)
+            for index in range(3)
+            for architecture in ["amd64", "arm64"]
+            for store in [None, "store"]
+        ]
+
+        results = asyncio.run(info.gather_info(entries))
+
+        assert mock_refresh.call_count == 4
+        assert [
+            (result["snap"]["name"], result["snap"]["architecture"])
+            for result in results
+        ] == [(snap.name, architecture) for snap, architecture, _ in entries]
+
+    def test_gather_info_errors(self, info, mocker):
+        """Test that failed requests are reported for their entries only"""
+
+        def get_refresh_info(snap_specifiers, architecture, store=None, fields=None):
+            if architecture == "arm64":
+                raise RuntimeError("Store error")
+            return refresh_results(snap_specifiers, architecture)
+
+        mocker.patch.object(info.info, "get_refresh_info", side_effect=get_refresh_info)
+        snap = SnapSpecifier.from_string("snap=edge")
+
+        results = asyncio.run(
+            info.gather_info([(snap, "amd64", None), (snap, "arm64", None)])
+        )
+
+        assert results[0]["snap"]["architecture"] == "amd64"
+        assert isinstance(results[1], RuntimeError)
@@ -0,0 +1,83 @@
+import os
+import time
+
+from pytest import fixture
+
+from snapstore.cache import CacheStats, ResponseCache
+
+
+class TestResponseCache:
+    """Test cases for ResponseCache"""
+
+    @fixture
+    def cache(self, tmp_path):
+        """Create a ResponseCache in a temporary directory"""
+        return ResponseCache(directory=tmp_path, ttl=60, max_entries=3)
+
+    def test_key(self):
+        """Test that keys depend on every component of a request"""
+        key = ResponseCache.key("GET", "url", {"Snap-Device-Store": "a"}, {})
+        assert key == ResponseCache.key("GET", "url", {"Snap-Device-Store": "a"}, {})
+        assert key != ResponseCache.key("GET", "url", {"Snap-Device-Store": "b"}, {})
+        assert key != ResponseCache.key("POST", "url", {"Snap-Device-Store": "a"}, {})
+        assert key != ResponseCache.key(
+            "GET", "url", {"Snap-Device-Store": "a"}, {"params": {"x": 1}}
+        )
+
+    def test_miss(self, cache):
+        """Test getting a key that is not in the cache"""
+        assert cache.get("key") is None
+        assert cache.stats == CacheStats(hits=0, misses=1)
+
+    def test_hit(self, cache):
+        """Test getting a fresh entry"""
+        cache.put("key", {"name": "snap"}, etag='"tag"')
+        entry = cache.get("key")
+        assert entry.body == {"name": "snap"}
+        assert entry.etag == '"tag"'
+        assert cache.is_fresh(entry)
+        assert cache.stats == CacheStats(hits=1, misses=0)
+
+    def test_stale(self, cache, mocker):
+        """Test that stale entries are returned but counted as misses"""
+        cache.put("key", {"name": "snap"})
+        mocker.patch("snapstore.cache.time.time", return_value=time.time() + 120)
+        entry = cache.get("key")
+        assert entry.body == {"name": "snap"}
+        assert not cache.is_fresh(entry)
+        assert cache.stats.misses == 1
+
+    def test_revalidated(self, cache, mocker):
+        """Test that revalidating a stale entry makes it fresh"""
+        cache.put("key", {"name": "snap"}, etag='"tag"')
+        later = time.time() + 120
+        mocker.patch("snapstore.cache.time.time", return_value=later)
+        entry = cache.get("key")
+        cache.revalidated("key", entry)
+        entry = cache.get("key")
+        assert cache.is_fresh(entry)
+        assert entry.etag == '"tag"'
+        assert cache.stats.revalidations == 1
+
+    def test_corrupt_entry(self, cache):
+        """Test that unreadable entries are treated as missing"""
+        cache.path("key").write_text("not json")
+        assert cache.get("key") is None
+
+    def test_lru_eviction(self, cache):
+        """Test that the least recently used entries are evicted"""
+        past = time.time() - 100
+        for index, key in enumerate(["a", "b", "c"]):
+            cache.put(key, {})
+            os.utime(cache.path(key), (past + index, past + index))
+        # use "a" so that "b" becomes the least recently used entry
+        cache.get("a")
+        cache.put("d", {})
+        assert cache.get("b") is None
+        assert all(cache.get(key) is not None for key in ["a", "c", "d"])
+
+    def test_clear(self, cache):
+        """Test clearing the cache"""
+        cache.put("key", {})
+        cache.clear()
+        assert cache.get("key") is None
@@ -0,0 +1,104 @@
+from pytest import fixture, mark
+
+from snapstore.channel_map import ChannelMap
+from snapstore.snaps import SnapChannel
+
+
+def entry(name, architecture, revision, track="latest", risk=None, branch=None):
+    """Create a channel map entry, as returned by the snap Store API."""
+    channel = {
+        "name": name,
+        "architecture": architecture,
+        "track": track,
+        "risk": risk or name.split("/")[-1],
+    }
+    if branch:
+        channel["branch"] = branch
+    return {"channel": channel, "revision": revision}
+
+
+class TestChannelMap:
+    """Test cases for ChannelMap"""
+
+    @fixture
+    def channel_map(self):
+        return ChannelMap.from_response(
+            {
+                "channel-map": [
+                    entry("stable", "amd64", 1),
+                    entry("stable", "arm64", 2),
+                    entry("edge", "amd64", 3),
+                    entry("uc22/beta", "amd64", 4, track="uc22"),
+                    entry("uc22/stable", "amd64", 5, track="uc22"),
+                    entry(
+                        "uc22/edge/fix",
+                        "amd64",
+                        6,
+                        track="uc22",
+                        risk="edge",
+                        branch="fix",
+                    ),
+                ]
+            }
+        )
+
+    @mark.parametrize(
+        "channel, architecture, revision",
+        [
+            ("stable", "amd64", 1),
+            ("latest/stable", "arm64", 2),
+            ("latest/edge", "amd64", 3),
+            ("uc22/beta", "amd64", 4),
+            ("uc22/edge/fix", "amd64", 6),
+            ("uc22", "amd64", 5),
+        ],
+    )
+    def test_get(self, channel_map, channel, architecture, revision):
+        """Test exact lookups by channel and architecture"""
+        assert channel_map.get(channel, architecture)["revision"] == revision
+
+    @mark.parametrize(
+        "channel, architecture",
+        [("edge", "arm64"), ("beta", "amd64"), ("uc22/edge", "amd64")],
+    )
+    def test_get_missing(self, channel_map, channel, architecture):
+        """Test lookups for channels that are not in the channel map"""
+        assert channel_map.get(channel, architecture) is None
+
+    def test_get_any_architecture(self, channel_map):
+        """Test lookups that do not specify an architecture"""
+        assert channel_map.get(SnapChannel("latest", "stable"))["revision"] == 1
+
+    def test_entries_without_architecture(self):
+        """Test that entries without an architecture match any architecture"""
+        channel_map = ChannelMap(
+            [{"channel": {"track": "latest", "risk": "beta"}, "revision": 7}]
+        )
+        assert channel_map.get("latest/beta", "arm64")["revision"] == 7
+
+    def test_entries_with_name_only(self):
+        """Test that channels are derived from names when necessary"""
+        channel_map = ChannelMap([{"channel": {"name": "beta"}, "revision": 8}])
+        assert channel_map.get("latest/beta")["revision"] == 8
+
+    @mark.parametrize(
+        "channel, architecture, revision",
+        [
+            ("edge", "amd64", 3),
+            ("edge", "arm64", 2),
+            ("candidate", "amd64", 1),
+            ("uc22/edge", "amd64", 4),
+            ("uc22/edge/fix", "amd64", 6),
+        ],
+    )
+    def test_latest(self, channel_map, channel, architecture, revision):
+        """Test lookups falling back to more stable risks"""
+        assert channel_map.latest(channel, architecture)["revision"] == revision
+
+    def test_latest_missing(self, channel_map):
+        """Test fallback lookups for tracks that are not in the channel map"""
+        assert channel_map.latest("uc24/edge", "amd64") is None
+
+    def test_empty_response(self):
+        """Test an index over a response without a channel map"""
+        assert ChannelMap.from_response({}).get("stable") is None
@@ -1,7 +1,19 @@
+from io import StringIO
+
 from pytest import mark, raises
+from requests import HTTPError
 
 from snapstore.info import SnapstoreInfo
-from snapstore.cli import get_info_arguments, _get_snap_info, _get_refresh_info
+from snapstore.cli import (
+    get_info_arguments,
+    get_watch_arguments,
+    _get_snap_info,
+    _get_refresh_info,
+    _read_batch,
+    _read_batch_file,
+    _get_batch_refresh_info,
+)
+from snapstore.snaps import SnapSpecifier
 
 
 class TestGetInfoArguments:
@@ -18,6 +30,8 @@ class TestGetInfoArguments:
         assert args.store is None
         assert args.refresh is True
         assert args.variable == "UBUNTU_STORE_AUTH"
+        assert args.cache_ttl is None
+        assert args.cache_dir is None
 
     def test_optional_store_argument(self):
         """Test parsing of optional --store argument."""
@@ -60,6 +74,40 @@ class TestGetInfoArguments:
         args = get_info_arguments(command_line)
         assert args.variable == token_environmnent_variable
 
+    def test_cache_arguments(self):
+        """Test parsing of the optional cache arguments."""
+        command_line = ["test-snap", "stable", "amd64", "--cache-ttl", "60"]
+        args = get_info_arguments(command_line + ["--cache-dir", "/tmp/cache"])
+        assert args.cache_ttl == 60
+        assert args.cache_dir == "/tmp/cache"
+
+    def test_missing_positional_arguments(self):
+        """Test that positional arguments are required without --batch."""
+        with raises(SystemExit):
+            get_info_arguments(["test-snap", "stable"])
+
+    @mark.parametrize(
+        "command_line, expected",
+        [(["--batch"], "-"), (["--batch", "specs.txt"], "specs.txt")],
+    )
+    def test_batch_argument(self, command_line, expected):
+        """Test parsing of the optional --batch argument."""
+        args = get_info_arguments(command_line)
+        assert args.batch == expected
+        assert args.snap is None
+
+    @mark.parametrize(
+        "command_line",
+        [
+            ["test-snap", "stable", "amd64", "--batch"],
+            ["--batch", "--use-info"],
+        ],
+    )
+    def test_batch_invalid_combinations(self, command_line):
+        """Test that --batch rejects positional arguments and --use-info."""
+        with raises(SystemExit):
+            get_info_arguments(command_line)
+
 
 class TestGetSnapInfo:
     """Test the get_snap_info function."""
@@ -116,6 +164,23 @@ class TestGetSnapInfo:
         with raises(ValueError):
             _get_snap_info(info, args)
 
+    def test_fields_projection(self, mocker):
+        """Test that requested fields are projected from the channel map."""
+        command_line = ["test-snap", "stable", "amd64", "--use-info"]
+        args = get_info_arguments(command_line + ["--fields", "version"])
+        info = mocker.create_autospec(SnapstoreInfo, instance=True)
+        info.get_snap_info.return_value = {
+            "channel-map": [
+                {"channel": {"track": "latest", "risk": "stable"}, "version": "1"}
+            ]
+        }
+
+        result = _get_snap_info(info, args)
+
+        assert result["version"] == "1"
+        _, kwargs = info.get_snap_info.call_args
+        assert kwargs["projection"] == ["channel-map.channel", "channel-map.version"]
+
 
 class TestGetRefreshInfo:
     """Test the get_refresh_info function."""
@@ -155,3 +220,133 @@ class TestGetRefreshInfo:
 
         with raises(ValueError, match=error_message):
             _get_refresh_info(info, args)
+
+
+class TestReadBatch:
+    """Test the parsing of batch input."""
+
+    def test_text_lines(self):
+        """Test parsing of `snap=channel architecture [store]` lines."""
+        lines = [
+            "checkbox=uc22/edge amd64",
+            "",
+            "# a comment",
+            "checkbox22=latest/beta arm64 custom-store",
+        ]
+        entries = _read_batch(lines)
+        assert entries == [
+            (SnapSpecifier.from_string("checkbox=uc22/edge"), "amd64", None),
+            (
+                SnapSpecifier.from_string("checkbox22=latest/beta"),
+                "arm64",
+                "custom-store",
+            ),
+        ]
+
+    def test_json_lines(self):
+        """Test parsing of JSON lines."""
+        lines = [
+            '{"snap": "checkbox", "channel": "uc22/edge", "architecture": "amd64"}'
+        ]
+        entries = _read_batch(lines, store="default-store")
+        assert entries == [
+            (SnapSpecifier.from_string("checkbox=uc22/edge"), "amd64", "default-store")
+        ]
+
+    @mark.parametrize("line", ["checkbox=uc22/edge", "checkbox=edge a b c"])
+    def test_invalid_line(self, line):
+        """Test ValueError for lines with a wrong number of components."""
+        with raises(ValueError):
+            _read_batch([line])
+
+    def test_file(self, tmp_path):
+        """Test reading the batch entries from a file."""
+        path = tmp_path / "specs.txt"
+        path.write_text("checkbox=uc22/edge amd64\n")
+        entries = _read_batch_file(str(path), store="default-store")
+        assert entries == [
+            (SnapSpecifier.from_string("checkbox=uc22/edge"), "amd64", "default-store")
+        ]
+
+    def test_standard_input(self, mocker):
+        """Test that standard input is read but not closed."""
+        stdin = mocker.patch("sys.stdin", StringIO("checkbox=uc22/edge amd64\n"))
+        entries = _read_batch_file("-")
+        assert entries == [
+            (SnapSpecifier.from_string("checkbox=uc22/edge"), "amd64", None)
+        ]
+        assert not stdin.closed
+
+
+class TestGetBatchRefreshInfo:
+    """Test the get_batch_refresh_info function."""
+
+    def test_results_and_errors(self, mocker):
+        """Test one request per group and a record per snap specifier."""
+        entries = _read_batch(["snap-1=edge amd64", "snap-2=edge amd64"])
+        info = mocker.create_autospec(SnapstoreInfo, instance=True)
+        info.get_refresh_info.return_value = [
+            {
+                "result": "error",
+                "instance-key": "snap-2",
+                "error": {"message": "Not found"},
+            },
+            {
+                "result": "download",
+                "instance-key": "snap-1",
+                "snap": {"revision": 1},
+                "effective-channel": "latest/edge",
+            },
+        ]
+
+        records = list(_get_batch_refresh_info(info, entries, ["revision"]))
+
+        info.get_refresh_info.assert_called_once()
+        assert records[0] == {
+            "specifier": "snap-1=edge",
+            "architecture": "amd64",
+            "store": None,
+            "result": {"revision": 1, "effective-channel": "latest/edge"},
+        }
+        assert records[1]["specifier"] == "snap-2=edge"
+        assert "Not found" in records[1]["error"]
+
+    def test_request_error(self, mocker):
+        """Test that a failed request produces error records for its group."""
+        entries = _read_batch(["snap-1=edge amd64", "snap-2=edge arm64"])
+        info = mocker.create_autospec(SnapstoreInfo, instance=True)
+        info.get_refresh_info.side_effect = [
+            HTTPError("Service Unavailable"),
+            [
+                {
+                    "result": "download",
+                    "instance-key": "snap-2",
+                    "snap": {"revision": 2},
+                    "effective-channel": "latest/edge",
+                }
+            ],
+        ]
+
+        records = list(_get_batch_refresh_info(info, entries))
+
+        assert records[0]["error"] == "Service Unavailable"
+        assert records[1]["result"]["revision"] == 2
+
+
+class TestGetWatchArguments:
+    """Test the watch argument parsing function."""
+
+    def test_defaults(self):
+        """Test parsing of snaps with default options."""
+        args = get_watch_arguments(["snap-1", "snap-2"])
+
+        assert args.snaps == ["snap-1", "snap-2"]
+        assert args.fields == []
+        assert args.interval == 60
+        assert args.max_interval == 600
+        assert args.polls is None
+
+    def test_invalid_intervals(self):
+        """Test that the maximum interval cannot be less than the initial one."""
+        with raises(SystemExit):
+            get_watch_arguments(["snap", "--interval", "60", "--max-interval", "30"])
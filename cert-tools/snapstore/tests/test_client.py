@@ -1,7 +1,48 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
 from pytest import raises, fixture
-from snapstore.client import SnapstoreClient
+from snapstore.cache import ResponseCache
+from snapstore.client import HostStats, PooledHTTPAdapter, SnapstoreClient
+from snapstore.projection import Projection
+from craft_store.errors import StoreServerError
 from snapstore.craft import HTTPClient, UbuntuOneStoreClient
-from requests import HTTPError
+from snapstore.retry import RetryMetrics, RetryPolicy, TokenBucket
+from requests import HTTPError, Session
+
+
+@fixture
+def server():
+    """
+    Serve the same JSON document (with an ETag, so that conditional requests
+    are answered with 304 Not Modified) over HTTP/1.1 on a local port
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == '"1"':
+                self.send_response(304)
+                self.send_header("ETag", '"1"')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", "16")
+            self.send_header("ETag", '"1"')
+            self.end_headers()
+            self.wfile.write(b'{"name": "snap"}')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
 
 
 class TestSnapstoreClient:
@@ -135,3 +176,332 @@ class TestSnapstoreClient:
         with raises(HTTPError):
             authorized_snapstore_client.post("v2/snaps/test", payload={})
         mock_response.raise_for_status.assert_called_once()
+
+
+class TestPooledConnections:
+    """Test cases for the pooled connections of SnapstoreClient"""
+
+    @fixture
+    def http_client(self):
+        """Create a real HTTPClient (with a real session)"""
+        return HTTPClient(user_agent="test")
+
+    def test_adapter_mounted_on_http_client(self, http_client):
+        """Test that the pooled adapter is mounted on the HTTPClient session"""
+        client = SnapstoreClient(base_client=http_client, pool_size=4)
+        session = http_client._session
+        adapter = session.get_adapter(f"{SnapstoreClient.snapstore_url}/v2")
+        assert isinstance(adapter, PooledHTTPAdapter)
+        assert adapter is client.adapter
+        assert adapter._pool_connections == 4
+        assert adapter._pool_maxsize == 4
+        # other hosts are still served by the original adapter
+        assert session.get_adapter("https://login.ubuntu.com") is not adapter
+
+    def test_adapter_retains_connection_retries(self, http_client):
+        """Test that only connection errors are still retried by the adapter"""
+        retries = http_client._session.get_adapter("https://").max_retries
+        client = SnapstoreClient(base_client=http_client)
+        max_retries = client.adapter.max_retries
+        assert max_retries.total == retries.total
+        assert max_retries.backoff_factor == retries.backoff_factor
+        assert not max_retries.status_forcelist
+        assert not max_retries.respect_retry_after_header
+
+    def test_adapter_mounted_on_ubuntu_one_client(self, mocker, http_client):
+        """Test that the adapter is mounted on the session of a BaseClient"""
+        base_client = mocker.create_autospec(UbuntuOneStoreClient, instance=True)
+        base_client.http_client = http_client
+        client = SnapstoreClient(base_client=base_client)
+        adapter = http_client._session.get_adapter(SnapstoreClient.snapstore_url)
+        assert adapter is client.adapter
+
+    def test_no_session(self, mocker):
+        """Test a base client that does not expose a session"""
+        base_client = mocker.create_autospec(HTTPClient, instance=True)
+        client = SnapstoreClient(base_client=base_client)
+        assert client.adapter is None
+        assert client.connection_stats() == {}
+        client.close()
+
+    def test_connection_stats(self, server):
+        """Test that connection reuse is recorded per host"""
+        session = Session()
+        adapter = PooledHTTPAdapter()
+        session.mount(server, adapter)
+        for _ in range(3):
+            session.get(server).raise_for_status()
+        stats = adapter.stats["127.0.0.1"]
+        assert stats == HostStats(requests=3, connections=1)
+        assert stats.reused == 2
+        adapter.close()
+
+    def test_context_manager_closes_adapter(self, http_client):
+        """Test that leaving the context closes the pooled connections"""
+        with SnapstoreClient(base_client=http_client) as client:
+            adapter = client.adapter
+        assert len(adapter.poolmanager.pools) == 0
+
+
+class TestCachedRequests:
+    """Test cases for SnapstoreClient requests with a ResponseCache"""
+
+    @fixture
+    def cached_client(self, mocker, tmp_path):
+        """Create SnapstoreClient with a mock base client and a cache"""
+        base_client = mocker.create_autospec(HTTPClient, instance=True)
+        cache = ResponseCache(directory=tmp_path, ttl=60)
+        return SnapstoreClient(base_client=base_client, cache=cache)
+
+    @staticmethod
+    def create_response(mocker, status_code=200, body=None, etag=None):
+        response = mocker.Mock()
+        response.status_code = status_code
+        response.json.return_value = body
+        response.headers = {"ETag": etag} if etag else {}
+        return response
+
+    def test_fresh_response_from_cache(self, mocker, cached_client):
+        """Test that a fresh cached response is returned without a request"""
+        response = self.create_response(mocker, body={"name": "snap"})
+        cached_client.base_client.request.return_value = response
+
+        first = cached_client.get("v2/snaps/info/snap", params={"x": "1"})
+        second = cached_client.get("v2/snaps/info/snap", params={"x": "1"})
+
+        assert first == second == {"name": "snap"}
+        cached_client.base_client.request.assert_called_once()
+        assert cached_client.cache.stats.hits == 1
+
+    def test_different_store_not_shared(self, mocker, cached_client):
+        """Test that requests to different stores are cached separately"""
+        response = self.create_response(mocker, body={"name": "snap"})
+        cached_client.base_client.request.return_value = response
+
+        cached_client.post("v2/snaps/refresh", payload={}, store="a")
+        cached_client.post("v2/snaps/refresh", payload={}, store="b")
+
+        assert cached_client.base_client.request.call_count == 2
+
+    def test_stale_response_revalidated(self, mocker, cached_client):
+        """Test that stale responses are revalidated with their ETag"""
+        cached_client.cache.ttl = 0
+        cached_client.base_client.request.side_effect = [
+            self.create_response(mocker, body={"name": "snap"}, etag='"v1"'),
+            self.create_response(mocker, status_code=304),
+        ]
+
+        cached_client.get("v2/snaps/info/snap")
+        result = cached_client.get("v2/snaps/info/snap")
+
+        assert result == {"name": "snap"}
+        _, kwargs = cached_client.base_client.request.call_args
+        assert kwargs["headers"]["If-None-Match"] == '"v1"'
+        assert cached_client.cache.stats.revalidations == 1
+
+    def test_stale_response_replaced(self, mocker, cached_client):
+        """Test that modified responses replace stale cached ones"""
+        cached_client.cache.ttl = 0
+        cached_client.base_client.request.side_effect = [
+            self.create_response(mocker, body={"revision": 1}),
+            self.create_response(mocker, body={"revision": 2}),
+        ]
+
+        cached_client.get("v2/snaps/info/snap")
+        result = cached_client.get("v2/snaps/info/snap")
+
+        assert result == {"revision": 2}
+        _, kwargs = cached_client.base_client.request.call_args
+        assert "If-None-Match" not in kwargs["headers"]
+
+
+class TestRetriedRequests:
+    """Test cases for SnapstoreClient retries and rate limiting"""
+
+    @fixture
+    def base_client(self, mocker):
+        """Create a mock HTTPClient"""
+        return mocker.create_autospec(HTTPClient, instance=True)
+
+    @staticmethod
+    def create_response(mocker, status_code, headers=None):
+        response = mocker.Mock(status_code=status_code, headers=headers or {})
+        if status_code >= 400:
+            response.raise_for_status.side_effect = HTTPError(response=response)
+        response.json.return_value = {"status": status_code}
+        return response
+
+    def test_retry_after_throttling(self, mocker, base_client):
+        """Test that throttled requests are retried after Retry-After"""
+        mock_sleep = mocker.patch("snapstore.retry.time.sleep")
+        base_client.request.side_effect = [
+            self.create_response(mocker, 429, {"Retry-After": "4"}),
+            self.create_response(mocker, 200),
+        ]
+        client = SnapstoreClient(base_client=base_client)
+
+        assert client.get("v2/snaps/info/snap") == {"status": 200}
+
+        mock_sleep.assert_called_once_with(4.0)
+        assert client.metrics == RetryMetrics(
+            retries=1, throttles=1, waits=1, wait_time=4.0
+        )
+
+    def test_disabled_retries(self, mocker, base_client):
+        """Test that a policy with no retries raises the first error"""
+        base_client.request.return_value = self.create_response(mocker, 503)
+        client = SnapstoreClient(
+            base_client=base_client, retry_policy=RetryPolicy(retries=0)
+        )
+
+        with raises(HTTPError):
+            client.get("v2/snaps/info/snap")
+        base_client.request.assert_called_once()
+
+    def test_server_errors_retried_by_policy(self, mocker, store_server):
+        """Test that error responses of a real adapter reach the policy"""
+        mocker.patch("snapstore.retry.time.sleep")
+        store_server.failures = 2
+        with store_server.client() as client:
+            assert client.get("v2/snaps/info/snap") == {"name": "snap"}
+        assert store_server.requests == 3
+        assert client.metrics.retries == 2
+
+    def test_server_errors_exhaust_policy(self, store_server):
+        """Test that the last error response is raised with its status"""
+        policy = RetryPolicy(retries=2, backoff=0)
+        client = store_server.client(retry_policy=policy)
+        with client, raises(StoreServerError) as error:
+            client.get("v2/snaps/info/snap")
+        assert error.value.response.status_code == 503
+        assert store_server.requests == 3
+        assert client.metrics.retries == 2
+
+    def test_rate_limiter(self, mocker, base_client):
+        """Test that requests are paced by a shared rate limiter"""
+        rate_limiter = mocker.create_autospec(TokenBucket, instance=True)
+        rate_limiter.acquire.side_effect = [0.0, 0.25]
+        base_client.request.return_value = self.create_response(mocker, 200)
+        client = SnapstoreClient(base_client=base_client, rate_limiter=rate_limiter)
+
+        client.get("v2/snaps/info/snap")
+        client.get("v2/snaps/info/snap")
+
+        assert rate_limiter.acquire.call_count == 2
+        assert client.metrics.waits == 1
+        assert client.metrics.wait_time == 0.25
+
+    def test_configurable_timeout(self, mocker, base_client):
+        """Test that the request timeout can be configured"""
+        base_client.request.return_value = self.create_response(mocker, 200)
+        client = SnapstoreClient(base_client=base_client, timeout=30)
+
+        client.get("v2/snaps/info/snap")
+
+        _, kwargs = base_client.request.call_args
+        assert kwargs["timeout"] == 30
+
+
+class TestProjectedRequests:
+    """Test cases for SnapstoreClient requests with a Projection"""
+
+    @fixture
+    def base_client(self, mocker):
+        """Create a mock HTTPClient"""
+        return mocker.create_autospec(HTTPClient, instance=True)
+
+    @staticmethod
+    def create_response(mocker, data):
+        response = mocker.Mock(status_code=200, headers={})
+        response.iter_content.return_value = [data[:5], data[5:]]
+        return response
+
+    def test_streamed_projection(self, mocker, base_client):
+        """Test that the response is streamed and projected"""
+        response = self.create_response(
+            mocker, b'{"name": "snap", "channel-map": [{"version": "1", "x": 2}]}'
+        )
+        base_client.request.return_value = response
+        client = SnapstoreClient(base_client=base_client)
+
+        result = client.get(
+            "v2/snaps/info/snap", projection=Projection(["channel-map.version"])
+        )
+
+        assert result == {"channel-map": [{"version": "1"}]}
+        _, kwargs = base_client.request.call_args
+        assert kwargs["stream"] is True
+        response.iter_content.assert_called_once_with(
+            chunk_size=SnapstoreClient.stream_chunk_size
+        )
+        response.json.assert_not_called()
+        response.close.assert_called_once()
+
+    def test_projections_cached_separately(self, mocker, base_client, tmp_path):
+        """Test that projected and full responses are cached separately"""
+        base_client.request.side_effect = [
+            self.create_response(mocker, b'{"name": "snap", "version": "1"}'),
+            self.create_response(mocker, b'{"name": "snap", "version": "1"}'),
+        ]
+        client = SnapstoreClient(
+            base_client=base_client, cache=ResponseCache(directory=tmp_path)
+        )
+
+        first = client.get("v2/snaps/info/snap", projection=Projection(["name"]))
+        second = client.get("v2/snaps/info/snap", projection=Projection(["version"]))
+        cached = client.get("v2/snaps/info/snap", projection=Projection(["name"]))
+
+        assert first == cached == {"name": "snap"}
+        assert second == {"version": "1"}
+        assert base_client.request.call_count == 2
+
+    def test_revalidated_projection_closed(self, mocker, base_client, tmp_path):
+        """Test that a 304 response to a projected request is closed"""
+        base_client.request.return_value = mocker.Mock(status_code=304, headers={})
+        cache = ResponseCache(directory=tmp_path, ttl=0)
+        client = SnapstoreClient(base_client=base_client, cache=cache)
+        key = cache.key(
+            "GET",
+            f"{client.snapstore_url}/v2/snaps/info/snap",
+            client.create_headers(),
+            {"params": {}, "stream": True, "projection": ["name"]},
+        )
+        cache.put(key, {"name": "snap"}, '"1"')
+
+        result = client.get("v2/snaps/info/snap", projection=Projection(["name"]))
+
+        assert result == {"name": "snap"}
+        base_client.request.return_value.close.assert_called_once()
+
+    def test_error_response_closed(self, mocker, base_client):
+        """Test that error responses are closed before a retry"""
+        error_response = mocker.Mock(status_code=503, headers={})
+        error_response.raise_for_status.side_effect = HTTPError(response=error_response)
+        base_client.request.side_effect = [
+            error_response,
+            self.create_response(mocker, b'{"name": "snap"}'),
+        ]
+        client = SnapstoreClient(
+            base_client=base_client,
+            retry_policy=RetryPolicy(retries=1, backoff=0),
+        )
+
+        result = client.get("v2/snaps/info/snap", projection=Projection(["name"]))
+
+        assert result == {"name": "snap"}
+        error_response.close.assert_called_once()
+
+    def test_conditional_polls_reuse_connection(self, server, tmp_path):
+        """Test that polling with conditional requests reuses a connection"""
+        local_client = type(
+            "LocalSnapstoreClient", (SnapstoreClient,), {"snapstore_url": server}
+        )
+        cache = ResponseCache(directory=tmp_path, ttl=0)
+        with local_client(HTTPClient(user_agent="test"), cache=cache) as client:
+            for _ in range(5):
+                result = client.get(
+                    "v2/snaps/info/snap", projection=Projection(["name"])
+                )
+                assert result == {"name": "snap"}
+            stats = client.connection_stats()["127.0.0.1"]
+        assert stats == HostStats(requests=5, connections=1)
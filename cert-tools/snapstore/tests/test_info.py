@@ -1,7 +1,9 @@
 from pytest import fixture, mark, raises
+from requests import HTTPError
 
 from snapstore.client import SnapstoreClient
-from snapstore.info import SnapstoreInfo
+from snapstore.craft import HTTPClient
+from snapstore.info import SnapstoreInfo, group_refresh_requests
 from snapstore.snaps import SnapSpecifier
 
 
@@ -64,6 +66,24 @@ class TestSnapstoreInfo:
             )
             assert result == expected_response
 
+        def test_get_snap_info_with_projection(self, snapstore_info):
+            """Test that only the fields selected by a projection are requested"""
+            snapstore_info.client.get.return_value = {"channel-map": []}
+
+            snapstore_info.get_snap_info(
+                snap="test-snap",
+                fields=["base"],
+                projection=["name", "channel-map.channel", "channel-map.version"],
+            )
+
+            _, kwargs = snapstore_info.client.get.call_args
+            assert kwargs["params"] == {"fields": "base,version"}
+            assert kwargs["projection"].paths == (
+                "name",
+                "channel-map.channel",
+                "channel-map.version",
+            )
+
     class TestGetRefreshInfo:
         """Test cases for get_refresh_info method."""
 
@@ -120,3 +140,100 @@ class TestSnapstoreInfo:
                 headers={"Snap-Device-Architecture": "amd64"},
             )
             assert result == expected_response["results"]
+
+    class TestChunkedRefreshInfo:
+        """Test cases for chunked `v2/snaps/refresh` requests."""
+
+        @staticmethod
+        def refresh(endpoint, payload, store, headers):
+            """Emulate the Store, returning results in reverse order."""
+            return {
+                "results": [
+                    {"instance-key": action["instance-key"], "result": "download"}
+                    for action in reversed(payload["actions"])
+                ]
+            }
+
+        def test_chunks_merged_in_order(self, mock_client):
+            """Test that large requests are split and results kept in order."""
+            info = SnapstoreInfo(mock_client, chunk_size=3)
+            mock_client.post.side_effect = self.refresh
+            snaps = [SnapSpecifier.from_string(f"snap-{i}=edge") for i in range(8)]
+
+            result = info.get_refresh_info(snaps, architecture="amd64")
+
+            assert mock_client.post.call_count == 3
+            chunk_sizes = sorted(
+                len(call.kwargs["payload"]["actions"])
+                for call in mock_client.post.call_args_list
+            )
+            assert chunk_sizes == [2, 3, 3]
+            assert [item["instance-key"] for item in result] == [
+                snap.name for snap in snaps
+            ]
+
+        def test_chunks_retried_by_client(self, mocker):
+            """Test that each chunk is a separate request retried by the client."""
+            mocker.patch("snapstore.retry.time.sleep")
+            base_client = mocker.create_autospec(HTTPClient, instance=True)
+            info = SnapstoreInfo(SnapstoreClient(base_client), chunk_size=1)
+            throttled = mocker.Mock(status_code=429, headers={})
+            throttled.raise_for_status.side_effect = HTTPError(response=throttled)
+            succeeded = mocker.Mock(status_code=200)
+            succeeded.json.side_effect = [
+                {"results": [{"instance-key": "snap-1"}]},
+                {"results": [{"instance-key": "snap-2"}]},
+            ]
+            base_client.request.side_effect = [throttled, succeeded, succeeded]
+            snaps = [
+                SnapSpecifier.from_string("snap-1=edge"),
+                SnapSpecifier.from_string("snap-2=edge"),
+            ]
+
+            result = info.get_refresh_info(snaps, architecture="amd64")
+
+            assert base_client.request.call_count == 3
+            assert sorted(item["instance-key"] for item in result) == [
+                "snap-1",
+                "snap-2",
+            ]
+            assert info.client.metrics.retries == 1
+
+        def test_chunk_server_error_retried(self, mocker, store_server):
+            """Test that a chunk answered with 503 by a real adapter is retried."""
+            mocker.patch("snapstore.retry.time.sleep")
+            store_server.failures = 1
+            snaps = [SnapSpecifier.from_string(f"snap-{i}=edge") for i in range(4)]
+
+            with store_server.client() as client:
+                info = SnapstoreInfo(client, chunk_size=2)
+                result = info.get_refresh_info(snaps, architecture="amd64")
+
+            assert [item["instance-key"] for item in result] == [
+                snap.name for snap in snaps
+            ]
+            assert store_server.requests == 3
+            assert client.metrics.retries == 1
+
+
+class TestGroupRefreshRequests:
+    """Test the grouping of snap specifiers into refresh requests."""
+
+    def test_grouping(self):
+        """Test grouping by architecture and store, splitting repeated names."""
+        snap_1 = SnapSpecifier.from_string("snap-1=edge")
+        snap_1_beta = SnapSpecifier.from_string("snap-1=beta")
+        snap_2 = SnapSpecifier.from_string("snap-2=edge")
+        entries = [
+            (snap_1, "amd64", None),
+            (snap_2, "amd64", None),
+            (snap_1_beta, "amd64", None),
+            (snap_1, "amd64", None),
+            (snap_1, "arm64", None),
+            (snap_1, "amd64", "store"),
+        ]
+        assert group_refresh_requests(entries) == {
+            ("amd64", None): [[snap_1, snap_2], [snap_1_beta]],
+            ("arm64", None): [[snap_1]],
+            ("amd64", "store"): [[snap_1]],
+        }
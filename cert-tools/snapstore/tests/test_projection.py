@@ -0,0 +1,122 @@
+import json
+
+from pytest import mark, raises
+
+from snapstore.projection import Projection
+
+DOCUMENT = {
+    "name": "snap",
+    "snap-id": "id",
+    "channel-map": [
+        {
+            "channel": {"track": "latest", "risk": "stable", "architecture": "amd64"},
+            "version": "1.0",
+            "revision": 12345678901234567890,
+            "snap-yaml": "name: snap\ngrade: stable\n" * 100,
+            "download": {"size": 1.5e6, "url": None},
+        },
+        {
+            "channel": {"track": "2.0", "risk": "edge", "architecture": "arm64"},
+            "version": "2.0 ☃",
+            "revision": -7,
+            "snap-yaml": "",
+            "download": {"size": 0, "url": "https://example.com"},
+        },
+    ],
+    "snap": {"title": "Snap", "publisher": {"id": "x"}, "private": False},
+}
+
+
+def chunked(data, size):
+    return [data[start : start + size] for start in range(0, len(data), size)]
+
+
+class TestProjection:
+    """Test cases for Projection"""
+
+    def test_tree(self):
+        """Test that paths are merged into a tree of selected keys"""
+        projection = Projection(
+            ["name", "channel-map.version", "channel-map", "snap.publisher.id"]
+        )
+
+        assert projection.tree == {
+            "name": True,
+            "channel-map": True,
+            "snap": {"publisher": {"id": True}},
+        }
+
+    def test_keys(self):
+        """Test the keys selected within a path"""
+        projection = Projection(
+            ["name", "channel-map.version", "channel-map.channel.track"]
+        )
+
+        assert projection.keys("channel-map") == ["channel", "version"]
+        assert projection.keys("channel-map.channel") == ["track"]
+        assert projection.keys("name") == []
+        assert projection.keys("snap") == []
+
+    @mark.parametrize("size", [1, 3, 64, 100000])
+    def test_decode(self, size):
+        """Test that streamed documents are projected, for any chunk size"""
+        projection = Projection(
+            [
+                "name",
+                "channel-map.channel.track",
+                "channel-map.revision",
+                "channel-map.download",
+                "snap.publisher.id",
+                "missing",
+            ]
+        )
+        data = json.dumps(DOCUMENT, indent=2).encode()
+
+        result = projection.decode(chunked(data, size))
+
+        assert result == {
+            "name": "snap",
+            "channel-map": [
+                {
+                    "channel": {"track": "latest"},
+                    "revision": 12345678901234567890,
+                    "download": {"size": 1.5e6, "url": None},
+                },
+                {
+                    "channel": {"track": "2.0"},
+                    "revision": -7,
+                    "download": {"size": 0, "url": "https://example.com"},
+                },
+            ],
+            "snap": {"publisher": {"id": "x"}},
+        }
+
+    def test_decode_multibyte_characters(self):
+        """Test that UTF-8 characters split across chunks are decoded"""
+        projection = Projection(["channel-map.version"])
+        data = json.dumps(DOCUMENT, ensure_ascii=False).encode()
+
+        result = projection.decode(chunked(data, 1))
+
+        assert result["channel-map"][1] == {"version": "2.0 ☃"}
+
+    def test_whole_document(self):
+        """Test that a selected container is decoded as a whole"""
+        projection = Projection(["channel-map"])
+
+        result = projection.loads(json.dumps(DOCUMENT))
+
+        assert result == {"channel-map": DOCUMENT["channel-map"]}
+
+    @mark.parametrize("data", ["[]", "{}", '"string"', "42"])
+    def test_other_documents(self, data):
+        """Test documents that do not match the projection"""
+        assert Projection(["name"]).loads(data) == json.loads(data)
+
+    @mark.parametrize(
+        "data", ["", '{"name": "snap"', '{"name" "snap"}', "{1: 2}", '{"a": 1} x']
+    )
+    def test_invalid_documents(self, data):
+        """Test that invalid documents raise a JSONDecodeError"""
+        with raises(json.JSONDecodeError):
+            Projection(["name"]).loads(data)
@@ -0,0 +1,146 @@
+import time
+from email.utils import formatdate
+
+from pytest import fixture, mark, raises
+from requests import HTTPError, Response
+
+from snapstore.retry import (
+    RetryMetrics,
+    RetryPolicy,
+    TokenBucket,
+    get_retry_after,
+    get_status_code,
+)
+
+
+def http_error(status_code: int, headers: dict | None = None) -> HTTPError:
+    """Create an HTTPError carrying a response with a status code."""
+    response = Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return HTTPError(response=response)
+
+
+class TestHelpers:
+    """Test cases for the helper functions"""
+
+    def test_status_code(self):
+        assert get_status_code(http_error(429)) == 429
+        assert get_status_code(HTTPError()) is None
+        assert get_status_code(ValueError()) is None
+
+    @mark.parametrize(
+        "headers, expected",
+        [
+            ({}, None),
+            ({"Retry-After": "5"}, 5.0),
+            ({"Retry-After": "-1"}, 0.0),
+            ({"Retry-After": "soon"}, None),
+        ],
+    )
+    def test_retry_after_seconds(self, headers, expected):
+        assert get_retry_after(http_error(429, headers)) == expected
+
+    def test_retry_after_date(self):
+        date = formatdate(time.time() + 30, usegmt=True)
+        delay = get_retry_after(http_error(503, {"Retry-After": date}))
+        assert 25 < delay <= 30
+
+    def test_retry_after_no_response(self):
+        assert get_retry_after(ValueError()) is None
+
+
+class TestRetryPolicy:
+    """Test cases for RetryPolicy"""
+
+    @fixture
+    def mock_sleep(self, mocker):
+        return mocker.patch("snapstore.retry.time.sleep")
+
+    @mark.parametrize("status_code, expected", [(429, True), (503, True), (404, False)])
+    def test_is_retryable(self, status_code, expected):
+        assert RetryPolicy().is_retryable(http_error(status_code)) is expected
+
+    def test_exponential_backoff(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5, jitter=False)
+        delays = [policy.get_delay(attempt, http_error(503)) for attempt in range(4)]
+        assert delays == [1, 2, 4, 5]
+
+    def test_jitter(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5)
+        for attempt in range(4):
+            assert 0 <= policy.get_delay(attempt, http_error(503)) <= 5
+
+    def test_retry_after_honoured(self):
+        policy = RetryPolicy(max_backoff=60)
+        error = http_error(429, {"Retry-After": "7"})
+        assert policy.get_delay(0, error) == 7
+        error = http_error(429, {"Retry-After": "600"})
+        assert policy.get_delay(0, error) == 60
+
+    def test_call_retries_and_records(self, mocker, mock_sleep):
+        function = mocker.Mock(
+            side_effect=[
+                http_error(429, {"Retry-After": "2"}),
+                http_error(503, {"Retry-After": "3"}),
+                "result",
+            ]
+        )
+        metrics = RetryMetrics()
+
+        assert RetryPolicy().call(function, metrics) == "result"
+
+        assert function.call_count == 3
+        assert [call.args[0] for call in mock_sleep.call_args_list] == [2, 3]
+        assert metrics == RetryMetrics(retries=2, throttles=1, waits=2, wait_time=5)
+
+    def test_call_gives_up(self, mocker, mock_sleep):
+        function = mocker.Mock(side_effect=http_error(429))
+        metrics = RetryMetrics()
+
+        with raises(HTTPError):
+            RetryPolicy(retries=2).call(function, metrics)
+
+        assert function.call_count == 3
+        assert metrics.retries == 2
+        assert metrics.throttles == 3
+
+    def test_call_not_retryable(self, mocker, mock_sleep):
+        function = mocker.Mock(side_effect=http_error(404))
+
+        with raises(HTTPError):
+            RetryPolicy().call(function)
+
+        function.assert_called_once()
+        mock_sleep.assert_not_called()
+
+
+class TestTokenBucket:
+    """Test cases for TokenBucket"""
+
+    def test_burst_within_capacity(self, mocker):
+        mock_sleep = mocker.patch("snapstore.retry.time.sleep")
+        bucket = TokenBucket(rate=10, capacity=3)
+        assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+        mock_sleep.assert_not_called()
+
+    def test_wait_when_empty(self, mocker):
+        mocker.patch("snapstore.retry.time.monotonic", return_value=100.0)
+        mock_sleep = mocker.patch("snapstore.retry.time.sleep")
+        bucket = TokenBucket(rate=2, capacity=1)
+
+        assert bucket.acquire() == 0
+        assert bucket.acquire() == 0.5
+        # waiters queue up behind each other
+        assert bucket.acquire() == 1.0
+        assert [call.args[0] for call in mock_sleep.call_args_list] == [0.5, 1.0]
+
+    def test_refill(self, mocker):
+        mock_monotonic = mocker.patch(
+            "snapstore.retry.time.monotonic", return_value=100.0
+        )
+        mocker.patch("snapstore.retry.time.sleep")
+        bucket = TokenBucket(rate=2, capacity=1)
+        bucket.acquire()
+        mock_monotonic.return_value = 101.0
+        assert bucket.acquire() == 0
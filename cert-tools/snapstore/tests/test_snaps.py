@@ -1,6 +1,14 @@
+import re
+import time
+
 from pytest import raises, mark
 
-from snapstore.snaps import SnapChannel, SnapSpecifier
+from snapstore.snaps import (
+    SPECIFIER_PATTERN,
+    SnapChannel,
+    SnapSpecifier,
+    _parse_channel,
+)
 
 
 class TestSnapChannel:
@@ -120,3 +128,63 @@ class TestSnapSpecifier:
         """Test that invalid specifier formats raise ValueError."""
         with raises(ValueError):
             SnapSpecifier.from_string(specifier_str)
+
+
+class TestMemoizedParsing:
+    """Test cases for the memoization of snap channel/specifier parsing."""
+
+    def test_interned_channels(self):
+        """Test that parsing the same channel returns the same instance."""
+        channel = SnapChannel.from_string("latest/edge")
+        assert SnapChannel.from_string("latest/edge") is channel
+
+    def test_interned_specifiers(self):
+        """Test that parsing the same specifier returns the same instance."""
+        specifier = SnapSpecifier.from_string("checkbox=uc22/edge")
+        assert SnapSpecifier.from_string("checkbox=uc22/edge") is specifier
+        assert SnapSpecifier.from_string("checkbox24=uc22/edge").channel is (
+            specifier.channel
+        )
+
+    def test_slots(self):
+        """Test that instances do not carry a per-instance `__dict__`."""
+        specifier = SnapSpecifier.from_string("checkbox=uc22/edge")
+        assert not hasattr(specifier, "__dict__")
+        assert not hasattr(specifier.channel, "__dict__")
+
+    def test_invalid_strings_not_cached(self):
+        """Test that parsing errors are raised on every call."""
+        for _ in range(2):
+            with raises(ValueError):
+                SnapSpecifier.from_string("no-equals-sign")
+
+    @mark.benchmark
+    def test_benchmark(self):
+        """
+        Compare memoized parsing of 100k specifiers (drawn from a small set
+        of distinct strings, as is typical) with uncached parsing.
+        """
+        strings = [
+            f"checkbox{base}={track}/{risk}"
+            for base in ["", "16", "18", "20", "22", "24"]
+            for track in ["latest", "uc22", "24.04"]
+            for risk in ["stable", "candidate", "beta", "edge"]
+        ]
+        inputs = [strings[index % len(strings)] for index in range(100_000)]
+
+        def parse_uncached(string):
+            # parse without memoization, creating new instances every time
+            name, channel = re.match(SPECIFIER_PATTERN.pattern, string).groups()
+            return SnapSpecifier(name, _parse_channel.__wrapped__(SnapChannel, channel))
+
+        start = time.perf_counter()
+        uncached = [parse_uncached(string) for string in inputs]
+        uncached_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cached = [SnapSpecifier.from_string(string) for string in inputs]
+        cached_time = time.perf_counter() - start
+
+        assert cached == uncached
+        assert len({id(specifier) for specifier in cached}) == len(strings)
+        assert cached_time < uncached_time
@@ -0,0 +1,165 @@
+from pytest import fixture
+from requests import HTTPError
+
+from snapstore.info import SnapstoreInfo
+from snapstore.watch import SnapstoreWatch, diff_channel_maps
+
+
+def channel_map(*entries):
+    """Create a `v2/snaps/info` response from (channel, revision) pairs."""
+    return {
+        "channel-map": [
+            {
+                "channel": {
+                    "name": channel,
+                    "track": "latest",
+                    "risk": channel,
+                    "architecture": "amd64",
+                },
+                "revision": revision,
+                "version": f"1.{revision}",
+            }
+            for channel, revision in entries
+        ]
+    }
+
+
+def key(risk):
+    return ("latest", risk, None, "amd64")
+
+
+class TestDiffChannelMaps:
+    """Test cases for diff_channel_maps"""
+
+    def test_no_changes(self):
+        """Test that identical channel maps produce no events"""
+        entries = {key("stable"): {"revision": 1, "version": "1.1"}}
+
+        assert diff_channel_maps("snap", entries, dict(entries)) == []
+
+    def test_changes(self):
+        """Test added, updated and removed channels"""
+        previous = {
+            key("stable"): {"revision": 1, "version": "1.1"},
+            key("beta"): {"revision": 2, "version": "1.2"},
+        }
+        current = {
+            key("stable"): {"revision": 2, "version": "1.2"},
+            key("edge"): {"revision": 3, "version": "1.3"},
+        }
+
+        events = diff_channel_maps("snap", previous, current)
+
+        assert events == [
+            {
+                "event": "updated",
+                "snap": "snap",
+                "channel": "latest/stable",
+                "architecture": "amd64",
+                "revision": 2,
+                "version": "1.2",
+                "previous-revision": 1,
+                "previous-version": "1.1",
+            },
+            {
+                "event": "added",
+                "snap": "snap",
+                "channel": "latest/edge",
+                "architecture": "amd64",
+                "revision": 3,
+                "version": "1.3",
+            },
+            {
+                "event": "removed",
+                "snap": "snap",
+                "channel": "latest/beta",
+                "architecture": "amd64",
+                "previous-revision": 2,
+                "previous-version": "1.2",
+            },
+        ]
+
+    def test_additional_fields(self):
+        """Test that additional fields are reported but not compared"""
+        previous = {key("stable"): {"revision": 1, "base": "core22"}}
+        current = {key("stable"): {"revision": 2, "base": "core24"}}
+
+        (event,) = diff_channel_maps("snap", previous, current, ["base"])
+
+        assert event["base"] == "core24"
+        assert event["previous-base"] == "core22"
+        assert diff_channel_maps("snap", previous, previous, ["base"]) == []
+
+
+class TestSnapstoreWatch:
+    """Test cases for SnapstoreWatch"""
+
+    @fixture
+    def info(self, mocker):
+        """Create a mock SnapstoreInfo."""
+        return mocker.create_autospec(SnapstoreInfo, instance=True)
+
+    @fixture
+    def mock_sleep(self, mocker):
+        return mocker.patch("snapstore.watch.time.sleep")
+
+    def test_poll_requests_projection(self, info):
+        """Test that only the watched fields are requested"""
+        info.get_snap_info.return_value = channel_map()
+        watch = SnapstoreWatch(info, ["snap"], architecture="amd64", fields=["base"])
+
+        watch.poll("snap")
+
+        _, kwargs = info.get_snap_info.call_args
+        assert kwargs["architecture"] == "amd64"
+        assert kwargs["projection"].paths == (
+            "channel-map.channel",
+            "channel-map.revision",
+            "channel-map.version",
+            "channel-map.base",
+        )
+
+    def test_poll_adapts_interval(self, info):
+        """Test that the interval grows while nothing changes"""
+        info.get_snap_info.side_effect = [
+            channel_map(("stable", 1)),
+            channel_map(("stable", 1)),
+            channel_map(("stable", 1)),
+            channel_map(("stable", 2)),
+        ]
+        watch = SnapstoreWatch(info, ["snap"], interval=10, max_interval=30)
+
+        intervals = []
+        for _ in range(4):
+            watch.poll("snap")
+            intervals.append(watch.intervals["snap"])
+
+        assert intervals == [10, 20, 30, 10]
+
+    def test_watch(self, info, mock_sleep):
+        """Test that only changes are yielded, for each snap in turn"""
+        responses = {
+            "a": [channel_map(("stable", 1)), channel_map(("stable", 2))],
+            "b": [channel_map(("edge", 5)), channel_map(("edge", 5))],
+        }
+        info.get_snap_info.side_effect = lambda snap, **kwargs: responses[snap].pop(0)
+        watch = SnapstoreWatch(info, ["a", "b"], interval=10)
+
+        events = list(watch.watch(polls=2))
+
+        assert [(event["event"], event["snap"]) for event in events] == [
+            ("added", "a"),
+            ("added", "b"),
+            ("updated", "a"),
+        ]
+        assert mock_sleep.call_count == 2
+
+    def test_watch_errors(self, info, mock_sleep):
+        """Test that failed polls are reported and retried later"""
+        info.get_snap_info.side_effect = [HTTPError("Error"), channel_map()]
+        watch = SnapstoreWatch(info, ["snap"], interval=10)
+
+        events = list(watch.watch(polls=2))
+
+        assert events == [{"event": "error", "snap": "snap", "error": "Error"}]
+        assert 19 < mock_sleep.call_args.args[0] <= 20
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Sessions with a device over SSH, for running commands and transferring
+files without paying the cost of a connection for each of them.
+
+A session is a persistent OpenSSH master connection to the device (the
+same one that the `_run`, `_put` and `_get` scriptlets use, see
+`scriptlets/defs/ssh_options`): commands and transfers are multiplexed
+over it as separate channels, so they can also run concurrently.
+
+The device is specified by the same environment variables as for the
+scriptlets, i.e. DEVICE_IP, DEVICE_USER, DEVICE_PWD, SSH_OPTS,
+SSH_CONTROL_OPTS and TOOLS_PATH_DEVICE. For example:
+```
+with Device.from_environment() as device:
+    device.run("sudo snap refresh --no-wait", check=True)
+    device.reboot()
+    for line in device.stream("snap changes"):
+        print(line)
+```
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import time
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+
+# the same options as `defs/ssh_options` in the scriptlets, used when
+# SSH_OPTS and SSH_CONTROL_OPTS are not set in the environment
+SSH_OPTS = (
+    "-o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null "
+    "-o ConnectTimeout=10 -o ConnectionAttempts=3 "
+    "-o ServerAliveInterval=30 -o ServerAliveCountMax=3"
+)
+SSH_CONTROL_OPTS = (
+    "-o ControlMaster=auto -o ControlPath={directory}/ssh-%C "
+    "-o ControlPersist={persist}"
+)
+
+# sshd accepts up to 10 sessions per connection by default (MaxSessions)
+MAX_SESSIONS = 8
+
+# identifies the current boot of the device
+BOOT_ID = "/proc/sys/kernel/random/boot_id"
+
+# interval (in seconds) between probes of the SSH port of a device that
+# isn't reachable yet, and the timeout of each probe: probes only open a
+# TCP connection, so they are cheap enough to be frequent
+PROBE_INTERVAL = 0.2
+PROBE_TIMEOUT = 1
+
+# delay (in seconds) before checking again the state of a device that is
+# reachable but not ready (e.g. degraded, when that isn't acceptable)
+STATE_DELAY = 2
+
+
+class Device:
+    """
+    An SSH session with a device.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        ssh_options: Optional[Sequence[str]] = None,
+        control_options: Optional[Sequence[str]] = None,
+        tools_path: Optional[str] = None,
+        port: int = 22,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.ssh_options = list(
+            shlex.split(SSH_OPTS) if ssh_options is None else ssh_options
+        )
+        if control_options is None:
+            control_options = shlex.split(
+                SSH_CONTROL_OPTS.format(directory="/tmp", persist=60)
+            )
+        self.control_options = list(control_options)
+        self.tools_path = tools_path
+
+    @classmethod
+    def from_environment(cls) -> "Device":
+        try:
+            host = os.environ["DEVICE_IP"]
+        except KeyError:
+            raise SystemExit("Error: DEVICE_IP is not set")
+        control_options = os.environ.get("SSH_CONTROL_OPTS")
+        if control_options is None:
+            control_options = SSH_CONTROL_OPTS.format(
+                directory=os.environ.get("SSH_CONTROL_DIR", "/tmp"),
+                persist=os.environ.get("SSH_CONTROL_PERSIST", 60),
+            )
+        return cls(
+            host,
+            user=os.environ.get("DEVICE_USER", "ubuntu"),
+            password=os.environ.get("DEVICE_PWD") or None,
+            ssh_options=shlex.split(os.environ.get("SSH_OPTS") or SSH_OPTS),
+            control_options=shlex.split(control_options),
+            tools_path=os.environ.get("TOOLS_PATH_DEVICE"),
+        )
+
+    @property
+    def destination(self) -> str:
+        return f"{self.user}@{self.host}" if self.user else self.host
+
+    @property
+    def multiplexed(self) -> bool:
+        return bool(self.control_options)
+
+    def __enter__(self) -> "Device":
+        self.open()
+        return self
+
+    def __exit__(self, *_):
+        # the master connection is left to expire (after ControlPersist),
+        # so that it can be reused by the scriptlets or other sessions
+        pass
+
+    def _command(
+        self, program: str, *args: str, multiplexed: bool = True
+    ) -> List[str]:
+        command = ["sshpass", "-p", self.password] if self.password else []
+        command += [program, *self.ssh_options]
+        if multiplexed:
+            command += self.control_options
+        else:
+            command += ["-o", "ControlMaster=no", "-o", "ControlPath=none"]
+        return command + list(args)
+
+    def remote_shell(self) -> List[str]:
+        """
+        Return the ssh command line that connects to the device, without
+        the destination and the command (e.g. for `rsync -e`).
+        """
+        return self._command("ssh")
+
+    def ssh_command(self, command: str, multiplexed: bool = True) -> List[str]:
+        """
+        Return the ssh command line that runs a command on the device
+        (with the tools directory in the path, as `_run` does).
+        """
+        if self.tools_path:
+            path = f"$PATH:$HOME/{self.tools_path}"
+            command = f'export PATH="{path}"; {command}'
+        return self._command(
+            "ssh", self.destination, command, multiplexed=multiplexed
+        )
+
+    def _control(self, operation: str) -> bool:
+        # control commands are handled locally by the master connection
+        result = subprocess.run(
+            ["ssh", *self.ssh_options, *self.control_options,
+             "-O", operation, self.destination],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        return result.returncode == 0
+
+    def is_open(self) -> bool:
+        """
+        Return True if the master connection to the device is running.
+        """
+        return self.multiplexed and self._control("check")
+
+    def open(self):
+        """
+        Open the master connection to the device, unless it is running.
+        """
+        if not self.multiplexed or self.is_open():
+            return
+        # with ControlMaster=auto, the connection becomes the master and
+        # it keeps running in the background (for ControlPersist)
+        subprocess.run(
+            self._command("ssh", "-f", "-N", self.destination),
+            check=True,
+            stdin=subprocess.DEVNULL,
+        )
+
+    def close(self):
+        """
+        Stop the master connection to the device (if it is running),
+        letting the sessions in progress complete.
+        """
+        if self.multiplexed:
+            self._control("stop")
+
+    def run(
+        self, command: str, check: bool = False, **kwargs
+    ) -> subprocess.CompletedProcess:
+        """
+        Run a command on the device, accepting the same keyword arguments
+        as `subprocess.run` (e.g. `capture_output` or `input`).
+
+        The output of the command is passed through unless captured.
+        """
+        return subprocess.run(self.ssh_command(command), check=check, **kwargs)
+
+    def popen(self, command: str, **kwargs) -> subprocess.Popen:
+        return subprocess.Popen(self.ssh_command(command), **kwargs)
+
+    def stream(self, command: str, check: bool = True) -> Iterator[str]:
+        """
+        Run a command on the device, yielding the lines of its output
+        (standard output and error, interleaved) as they arrive.
+        """
+        process = self.popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+        )
+        with process:
+            for line in process.stdout:
+                yield line.rstrip("\n")
+        if check and process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command)
+
+    def run_concurrently(
+        self, commands: Sequence[str], workers: int = MAX_SESSIONS
+    ) -> List[subprocess.CompletedProcess]:
+        """
+        Run commands on the device concurrently (as separate channels of
+        the master connection), returning their results (with captured
+        output) in order.
+        """
+        self.open()
+
+        def run(command):
+            return self.run(
+                command, capture_output=True, text=True,
+                stdin=subprocess.DEVNULL,
+            )
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(run, commands))
+
+    def put(self, sources: Sequence[str], target: str = "", check=True):
+        """
+        Copy local files to the target (a path on the device, or the home
+        directory by default).
+        """
+        return subprocess.run(
+            self._command(
+                "scp", *sources, f"{self.destination}:{target.lstrip(':')}"
+            ),
+            check=check,
+        )
+
+    def get(self, sources: Sequence[str], target: str, check=True):
+        """
+        Copy files from the device to the (local) target.
+        """
+        return subprocess.run(
+            self._command(
+                "scp",
+                *(f"{self.destination}:{source.lstrip(':')}"
+                  for source in sources),
+                target,
+            ),
+            check=check,
+        )
+
+    def boot_id(self, multiplexed: bool = True) -> Optional[str]:
+        """
+        Return the identifier of the current boot of the device, or None
+        if the device is unreachable.
+        """
+        result = subprocess.run(
+            self.ssh_command(f"cat {BOOT_ID}", multiplexed=multiplexed),
+            capture_output=True, text=True, stdin=subprocess.DEVNULL,
+        )
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    def probe(self, timeout: float = PROBE_TIMEOUT) -> bool:
+        """
+        Return True if the SSH server of the device accepts connections,
+        i.e. if it sends its identification string, without opening an
+        SSH session.
+        """
+        try:
+            with socket.create_connection(
+                (self.host, self.port), timeout=timeout
+            ) as connection:
+                banner = b""
+                while len(banner) < len(b"SSH-"):
+                    data = connection.recv(len(b"SSH-") - len(banner))
+                    if not data:
+                        return False
+                    banner += data
+                return banner == b"SSH-"
+        except OSError:
+            return False
+
+    def wait_until_ready(
+        self,
+        timeout: float = 600,
+        states: Sequence[str] = ("running",),
+        wait: bool = True,
+    ) -> Tuple[str, float]:
+        """
+        Wait until the device is up and its system is in one of the
+        accepted states (as reported by `systemctl is-system-running`),
+        returning the state and the seconds that it took.
+
+        The SSH port is probed until it accepts connections and then a
+        single SSH session waits for the system to finish starting up
+        (unless `wait` is False, e.g. when the "starting" state is also
+        accepted).
+
+        Raises `TimeoutError` if the device isn't ready after the timeout.
+        """
+        start = time.monotonic()
+        deadline = start + timeout
+        reported = None
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(
+                    f"{self.host} not ready after {timeout} seconds"
+                    + (f" ({reported})" if reported else "")
+                )
+            if not self.probe(min(PROBE_TIMEOUT, remaining)):
+                time.sleep(min(PROBE_INTERVAL, remaining))
+                continue
+            command = "systemctl is-system-running"
+            try:
+                # without the master connection, which wouldn't be usable
+                # if the device went down after it was opened
+                result = subprocess.run(
+                    self.ssh_command(
+                        command + (" --wait" if wait else ""),
+                        multiplexed=False
+                    ),
+                    capture_output=True, text=True,
+                    stdin=subprocess.DEVNULL, timeout=remaining,
+                )
+            except subprocess.TimeoutExpired:
+                continue
+            state = result.stdout.strip()
+            if state in states:
+                return state, time.monotonic() - start
+            if state != reported and state:
+                print(f"{self.host} is {state}", file=sys.stderr)
+                reported = state
+            if result.returncode == 255:
+                # the SSH session failed (e.g. the device is going down)
+                delay = PROBE_INTERVAL
+            elif not state and wait:
+                # `--wait` is not supported (before systemd 240)
+                wait = False
+                delay = 0
+            else:
+                delay = STATE_DELAY
+            time.sleep(max(0, min(delay, deadline - time.monotonic())))
+
+    def reboot(self, timeout: float = 600) -> float:
+        """
+        Reboot the device and reconnect to it once it has booted again,
+        returning the seconds that the reboot took.
+
+        Raises `TimeoutError` if the device is unreachable after the
+        timeout.
+        """
+        start = time.monotonic()
+        previous_boot = self.boot_id()
+        self.run("sudo reboot", stdin=subprocess.DEVNULL)
+        # the master connection is unusable after the reboot
+        self.close()
+        # the device is reached without a master connection until it has
+        # booted again, so that a master isn't opened while it goes down
+        # (and only after its SSH port accepts connections)
+        while True:
+            if self.probe():
+                boot = self.boot_id(multiplexed=False)
+                if boot and boot != previous_boot:
+                    break
+            if time.monotonic() - start > timeout:
+                raise TimeoutError(
+                    f"{self.host} unreachable {timeout} seconds after reboot"
+                )
+            time.sleep(PROBE_INTERVAL)
+        self.open()
+        return time.monotonic() - start
+
+
+def main(args: Optional[List[str]] = None):
+    parser = ArgumentParser(
+        description="Manage the SSH session with the device"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser(
+        "open", help="Open the master connection to the device"
+    )
+    commands.add_parser(
+        "close", help="Stop the master connection to the device"
+    )
+    commands.add_parser(
+        "check", help="Check if the master connection is running"
+    )
+    reboot_parser = commands.add_parser(
+        "reboot", help="Reboot the device and reconnect to it"
+    )
+    reboot_parser.add_argument(
+        "--timeout", type=float, default=600,
+        help="Seconds to wait for the device to boot again"
+    )
+    wait_parser = commands.add_parser(
+        "wait", help="Wait until the device is up and running"
+    )
+    wait_parser.add_argument(
+        "--timeout", type=float, default=600,
+        help="Seconds to wait for the device to be ready"
+    )
+    allow = wait_parser.add_mutually_exclusive_group()
+    allow.add_argument(
+        "--allow-degraded", action="store_true",
+        help="Also accept a degraded system (some services failed)"
+    )
+    allow.add_argument(
+        "--allow-starting", action="store_true",
+        help="Also accept a system that is still starting up"
+    )
+    args = parser.parse_args(args)
+
+    device = Device.from_environment()
+    if args.command == "open":
+        device.open()
+    elif args.command == "close":
+        device.close()
+    elif args.command == "check":
+        sys.exit(0 if device.is_open() else 1)
+    elif args.command == "wait":
+        states = ["running"]
+        if args.allow_degraded:
+            states.append("degraded")
+        if args.allow_starting:
+            states.append("starting")
+        print(f"Waiting for {device.host} to be up and running")
+        try:
+            state, elapsed = device.wait_until_ready(
+                args.timeout, states, wait=not args.allow_starting
+            )
+        except TimeoutError as error:
+            raise SystemExit(f"Error: {error}")
+        print(f"{device.host} is {state} (ready in {elapsed:.1f}s)")
+    else:
+        try:
+            elapsed = device.reboot(args.timeout)
+        except TimeoutError as error:
+            raise SystemExit(f"Error: {error}")
+        print(f"Rebooted {device.host} in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,20 +6,29 @@ connections to standard output.
 
 Ref: https://snapcraft.io/docs/snapd-api#heading--connections
 
+The input can be either the JSON document or the raw HTTP response
+(including chunked responses), which is processed as it arrives.
 As an aid, here's one way of retrieving this data from the endpoint:
 ```
-printf 'GET /v2/connections?select=all HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n' | \
-nc -U /run/snapd.socket | \
-grep -o '{.*}'
+printf 'GET /v2/connections?select=all HTTP/1.1\r\n'\
+'Host: localhost\r\nConnection: close\r\n\r\n' | nc -U /run/snapd.socket
 ```
 """
 
 from argparse import ArgumentParser
 from collections import defaultdict
-import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
 import re
+import shlex
 import sys
-from typing import Callable, Dict, List, NamedTuple, Optional, Set
+from typing import (
+    Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set,
+    Tuple
+)
+
+from toolbox.snapd import SnapdError
+from toolbox.streams import JSONStream, decode, read_response_body
 
 
 # dicts that describe snap plugs and slots
@@ -109,20 +118,80 @@ class Connection(NamedTuple):
 ConnectionPredicate = Callable[[PlugDict, SlotDict], bool]
 
 
+class InterfaceIndex:
+    """
+    The unconnected plugs for a single interface, bucketed by the value of
+    their `content` attribute so that a slot is only paired with the plugs
+    that can possibly have matching attributes (see
+    `Connector.matching_attributes`) instead of with every plug.
+    """
+
+    # the attribute used to bucket the plugs
+    attribute = "content"
+
+    def __init__(self):
+        # plugs with a (hashable) value for the attribute, by that value
+        self.buckets = defaultdict(list)  # type: Dict[object, List[PlugDict]]
+        # plugs that may match a slot with any value for the attribute
+        self.wildcards = []  # type: List[PlugDict]
+
+    def add(self, plug: PlugDict):
+        value = plug.get("attrs", {}).get(self.attribute)
+        if value is None:
+            # a plug without the attribute may connect to any slot
+            self.wildcards.append(plug)
+            return
+        try:
+            self.buckets[value].append(plug)
+        except TypeError:
+            # unhashable values are left to the predicates
+            self.wildcards.append(plug)
+
+    def candidates(self, slot: SlotDict) -> Iterable[PlugDict]:
+        """
+        Return the plugs that may connect to the slot, i.e. all the plugs
+        whose attribute (if any) doesn't contradict that of the slot.
+        """
+        value = slot.get("attrs", {}).get(self.attribute)
+        try:
+            bucket = self.buckets.get(value, []) if value is not None else None
+        except TypeError:
+            bucket = None
+        if bucket is None:
+            # a slot without a (hashable) value for the attribute may
+            # connect to any plug
+            for plugs in self.buckets.values():
+                yield from plugs
+        else:
+            yield from bucket
+        yield from self.wildcards
+
+
 class Connector:
 
-    def __init__(self, predicates: Optional[List[ConnectionPredicate]] = None):
+    def __init__(
+        self,
+        predicates: Optional[List[ConnectionPredicate]] = None,
+        snaps: Optional[Iterable[str]] = None
+    ):
         # specify the predicate functions that will be used to select or
         # filter out possible connections between plus and slots
         self.predicates = [
             # select connections where the interface attributes match
             self.matching_attributes,
             # select connections only on different snaps
-            lambda plug, slot: plug["snap"] != slot["snap"]
+            self.different_snaps
         ]
         # additional user-provided filtering predicates
         if predicates:
             self.predicates.extend(predicates)
+        # only consider the plugs of these snaps (if specified); unlike a
+        # predicate, the other plugs are discarded before any pairing
+        self.snaps = set(snaps) if snaps is not None else None
+
+    @staticmethod
+    def different_snaps(plug: PlugDict, slot: SlotDict) -> bool:
+        return plug["snap"] != slot["snap"]
 
     @staticmethod
     def matching_attributes(plug: PlugDict, slot: SlotDict) -> bool:
@@ -152,13 +221,52 @@ class Connector:
             slot_attributes = slot["attrs"]
         except KeyError:
             return True
-        common_attributes = set(plug_attributes.keys()) & set(slot_attributes.keys())
+        common_attributes = (
+            set(plug_attributes.keys()) & set(slot_attributes.keys())
+        )
         return all(
             plug_attributes[attribute] == slot_attributes[attribute]
             for attribute in common_attributes
         )
 
-    def process(self, snap_connection_data) -> Set[Connection]:
+    def index_plugs(
+        self, plugs: Iterable[PlugDict]
+    ) -> Dict[str, InterfaceIndex]:
+        """
+        Create an index for each interface, holding the *unconnected* plugs
+        (of the selected snaps, if any) for that interface.
+        """
+        interface_plugs = defaultdict(InterfaceIndex)
+        for plug in plugs:
+            self.index_plug(interface_plugs, plug)
+        return interface_plugs
+
+    def index_plug(
+        self, interface_plugs: Dict[str, InterfaceIndex], plug: PlugDict
+    ):
+        if "connections" in plug:
+            return
+        if self.snaps is not None and plug["snap"] not in self.snaps:
+            return
+        interface_plugs[plug["interface"]].add(plug)
+
+    def connect_interface(
+        self, plugs: InterfaceIndex, slots: List[SlotDict]
+    ) -> Set[Connection]:
+        """
+        Return the possible connections between the plugs and slots of a
+        single interface, i.e. the pairs that satisfy all the predicates.
+        """
+        return {
+            Connection.from_dicts(plug, slot)
+            for slot in slots
+            for plug in plugs.candidates(slot)
+            if all(predicate(plug, slot) for predicate in self.predicates)
+        }
+
+    def process(
+        self, snap_connection_data, workers: Optional[int] = None
+    ) -> Set[Connection]:
         """
         Process the output of the `connections` endpoint of the snapd API
         and return a set of possible connections (`Connection` objects).
@@ -166,25 +274,180 @@ class Connector:
         Note: the output will not include possible connections for plugs
         that are already connected but it will connect a plug to multiple
         slots if that plug is originally unconnected.
+
+        If more than one worker is specified, the interfaces are sharded
+        across a pool of processes (so the predicates must be picklable).
         """
-        # iterate over all *unconnected* plugs and create a map that
-        # associates each interface to a list of plugs for that interface
-        interface_plugs = defaultdict(list)
-        for plug in snap_connection_data["result"]["plugs"]:
-            if "connections" not in plug:
-                interface = plug["interface"]
-                interface_plugs[interface].append(plug)
-
-        # iterate over all slots and check for plugs that satisfy all the
-        # filtering predicates to form the set of possible connections
-        return {
-            Connection.from_dicts(plug, slot)
-            for slot in snap_connection_data["result"]["slots"]
-            if (interface := slot["interface"]) in interface_plugs
-            for plug in interface_plugs[interface]
-            if all(predicate(plug, slot) for predicate in self.predicates)
+        result = snap_connection_data["result"]
+        return self.process_stream(
+            chain(
+                (("plugs", plug) for plug in result["plugs"]),
+                (("slots", slot) for slot in result["slots"])
+            ),
+            workers
+        )
+
+    def process_stream(
+        self,
+        endpoints: Iterable[Tuple[str, Dict]],
+        workers: Optional[int] = None
+    ) -> Set[Connection]:
+        """
+        Same as `process` but for a stream of ("plugs", plug dict) and
+        ("slots", slot dict) tuples (see `iter_endpoints`), so that each
+        plug and slot is indexed (or discarded) as soon as it arrives.
+        """
+        interface_plugs = defaultdict(InterfaceIndex)
+        interface_slots = defaultdict(list)
+        plugs_seen = False
+        for kind, endpoint in endpoints:
+            if kind == "plugs":
+                plugs_seen = True
+                self.index_plug(interface_plugs, endpoint)
+                continue
+            # once a slot follows the plugs, all the plugs have been seen
+            # and the slots for interfaces without plugs can be discarded
+            interface = endpoint["interface"]
+            if plugs_seen and interface not in interface_plugs:
+                continue
+            interface_slots[interface].append(endpoint)
+
+        # ignore the interfaces without plugs
+        interface_slots = {
+            interface: slots
+            for interface, slots in interface_slots.items()
+            if interface in interface_plugs
         }
 
+        if workers is not None and workers > 1 and len(interface_slots) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(
+                    self.connect_interface,
+                    [interface_plugs[name] for name in interface_slots],
+                    interface_slots.values(),
+                    chunksize=max(1, len(interface_slots) // (4 * workers))
+                )
+                return set().union(*results)
+        return set().union(*(
+            self.connect_interface(interface_plugs[interface], slots)
+            for interface, slots in interface_slots.items()
+        ))
+
+
+def iter_endpoints(pieces: Iterable[str]) -> Iterator[Tuple[str, Dict]]:
+    """
+    Parse the output of the `connections` endpoint of the snapd API as it
+    arrives (in pieces of text) and yield a ("plugs", plug dict) or
+    ("slots", slot dict) tuple for each plug and slot, skipping the rest
+    of the document without decoding it.
+
+    Raises `SnapdError` if the document is an error response.
+    """
+    stream = JSONStream(pieces)
+    status = 200
+    error = False
+    result = None
+    for key in stream.members():
+        if key == "type":
+            error = stream.value() == "error"
+        elif key == "status-code":
+            status = stream.value()
+            error = error or status != 200
+        elif key != "result":
+            stream.skip()
+        elif error:
+            result = stream.value()
+        else:
+            for kind in stream.members():
+                if kind not in ("plugs", "slots"):
+                    stream.skip()
+                    continue
+                for _ in stream.elements():
+                    yield kind, stream.value()
+    # (snapd sends the type and status of the response before its result,
+    # but the error is reported even if they follow the result)
+    if error:
+        if not isinstance(result, dict):
+            result = {}
+        raise SnapdError(
+            status, result.get("message", "Unknown error"), result.get("kind")
+        )
+
+
+# bash script that performs all the connections in a single session on the
+# device: each connection is submitted as a separate change (retrying while
+# it conflicts with a change in progress for the same snaps, since snapd
+# doesn't allow those to run concurrently) and all the changes are waited
+# for concurrently, reporting the time that each connection took
+APPLY_SCRIPT = r"""
+CONNECT_TIMEOUT={timeout}
+
+now() {{
+    date +%s%N
+}}
+
+connect() {{
+    local plug="$1" slot="$2" start output result status change
+    start=$(now)
+    local deadline=$((start + CONNECT_TIMEOUT * 1000000000))
+    while true; do
+        output=$(sudo snap connect --no-wait "$plug" "$slot" 2>&1)
+        result=$?
+        if [ "$result" -eq 0 ] || \
+           [[ "$output" != *"change in progress"* ]] || \
+           [ "$(now)" -gt "$deadline" ]; then
+            break
+        fi
+        sleep 0.2
+    done
+    status="Failed to connect"
+    if [ "$result" -eq 0 ]; then
+        # the output is the id of the change, or empty if no change was
+        # needed because the plug is already connected
+        change="$output"
+        if [ -z "$change" ] || sudo snap watch "$change" > /dev/null 2>&1; then
+            status="Connected"
+        fi
+    fi
+    local elapsed=$((($(now) - start) / 1000000))
+    printf '%s %s to %s (%d.%03ds)\n' "$status" "$plug" "$slot" \
+        $((elapsed / 1000)) $((elapsed % 1000))
+    if [ "$status" != "Connected" ]; then
+        echo "$output"
+        return 1
+    fi
+}}
+
+PIDS=()
+{connections}
+FAILED=0
+for PID in "${{PIDS[@]}}"; do
+    wait "$PID" || FAILED=$((FAILED + 1))
+done
+if [ "$FAILED" -gt 0 ]; then
+    echo "$FAILED connection(s) failed"
+    exit 1
+fi
+"""
+
+
+def apply_script(connections: Iterable[Connection], timeout: int = 120) -> str:
+    """
+    Return a bash script that performs all the connections on a device in
+    a single session (see `APPLY_SCRIPT`).
+    """
+    lines = []
+    for connection in connections:
+        plug = f"{connection.plug_snap}:{connection.plug_name}"
+        slot = f"{connection.slot_snap}:{connection.slot_name}"
+        lines.append(f"connect {shlex.quote(plug)} {shlex.quote(slot)} &")
+        lines.append("PIDS+=($!)")
+    if not lines:
+        lines.append('echo "No possible connections detected"')
+    return APPLY_SCRIPT.format(
+        timeout=timeout, connections="\n".join(lines)
+    ).lstrip()
+
 
 def main(args: Optional[List[str]] = None):
     parser = ArgumentParser()
@@ -196,19 +459,30 @@ def main(args: Optional[List[str]] = None):
         '--force', nargs='+', type=Connection.from_string,
         help='Force additional connections'
     )
+    parser.add_argument(
+        '--apply', action='store_true',
+        help=(
+            'Instead of the connections, write a bash script that performs '
+            'them all on the device in a single session'
+        )
+    )
     args = parser.parse_args(args)
 
-    # parse standard input as JSON
-    snap_connection_data = json.load(sys.stdin)
-
-    # create a predicate function for the provided snaps
-    def snap_select(plug: PlugDict, _) -> bool:
-        return plug["snap"] in set(args.snaps)
-    predicates = [snap_select]
-    connector = Connector(predicates)
+    # only the plugs of the provided snaps are considered
+    connector = Connector(snaps=args.snaps)
 
-    snap_connections = connector.process(snap_connection_data)
-    for connection in sorted(snap_connections) + (args.force or []):
+    # parse standard input (a JSON document or raw HTTP response) as it
+    # arrives
+    endpoints = iter_endpoints(decode(read_response_body(sys.stdin.buffer)))
+    try:
+        snap_connections = connector.process_stream(endpoints)
+    except SnapdError as error:
+        raise SystemExit(f"Unable to retrieve the connections: {error}")
+    connections = sorted(snap_connections) + (args.force or [])
+    if args.apply:
+        print(apply_script(connections))
+        return
+    for connection in connections:
         print(connection)
 
 
@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+"""
+Client for the snapd REST API on a device, providing structured access to
+snapd (e.g. to its changes) instead of scraping the output of the `snap`
+CLI.
+
+Ref: https://snapcraft.io/docs/snapd-api
+
+The API is accessed over `/run/snapd.socket`, either directly (or through
+a forwarded unix socket, e.g. `ssh -L /tmp/snapd.socket:/run/snapd.socket`)
+or over a single persistent SSH channel to the device, relayed to the
+socket by `nc -U`. In both cases all the requests of a client are sent
+over the same (keep-alive) connection.
+
+The `wait` command replaces polling `snap changes` on the device:
+```
+snapd_api wait --timeout 5400
+```
+"""
+
+from abc import ABC, abstractmethod
+from argparse import ArgumentParser
+from dataclasses import dataclass, field
+import json
+import shlex
+import socket
+import subprocess
+import sys
+import time
+from typing import (
+    Any, BinaryIO, Callable, Dict, List, Optional, Sequence, Tuple
+)
+
+from toolbox.device import Device
+from toolbox.streams import read_http_body, read_http_headers
+
+
+SNAPD_SOCKET = "/run/snapd.socket"
+
+# snapd has no endpoint that blocks until changes are ready, so they are
+# polled (over the same connection, which makes polling cheap) at this
+# interval, in seconds
+POLL_INTERVAL = 0.5
+
+# time (in seconds) allowed for snapd to respond to each request
+RESPONSE_TIMEOUT = 30
+
+# delay (in seconds) before reconnecting when snapd is unreachable,
+# e.g. while the device reboots
+RECONNECT_DELAY = 5
+
+# the statuses of changes (and tasks) that are not complete
+# https://snapcraft.io/docs/snapd-api#heading--changes
+IN_PROGRESS = {"Do", "Doing", "Undo", "Undoing", "Wait"}
+
+# the status of a change (or task) that is waiting, e.g. for a reboot
+WAIT = "Wait"
+
+
+class SnapdError(Exception):
+    """
+    An error response of the snapd API.
+    """
+
+    def __init__(self, status: int, message: str, kind: Optional[str] = None):
+        super().__init__(f"{message} (status {status})")
+        self.status = status
+        self.message = message
+        self.kind = kind
+
+
+# dicts that describe changes and tasks
+# (they follow the schema of the snapd API `changes` endpoint)
+#
+# example of a change dict:
+# ```
+# {
+#   "id": "12",
+#   "kind": "install-snap",
+#   "summary": "Install \"checkbox\" snap",
+#   "status": "Doing",
+#   "tasks": [
+#     {
+#       "id": "123",
+#       "kind": "download-snap",
+#       "summary": "Download snap \"checkbox\" from channel \"stable\"",
+#       "status": "Doing",
+#       "progress": {"label": "checkbox", "done": 1024, "total": 4096},
+#       "spawn-time": "2024-03-05T11:10:00.000000000Z"
+#     }
+#   ],
+#   "ready": false,
+#   "spawn-time": "2024-03-05T11:10:00.000000000Z"
+# }
+# ```
+ChangeDict = Dict
+TaskDict = Dict
+
+
+@dataclass(frozen=True)
+class Task:
+    id: str
+    kind: str
+    summary: str
+    status: str
+    # bytes (or steps) done and total
+    progress: Tuple[int, int] = (0, 0)
+    spawn_time: Optional[str] = None
+    ready_time: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, task: TaskDict) -> "Task":
+        progress = task.get("progress", {})
+        return cls(
+            id=task["id"],
+            kind=task["kind"],
+            summary=task["summary"],
+            status=task["status"],
+            progress=(progress.get("done", 0), progress.get("total", 0)),
+            spawn_time=task.get("spawn-time"),
+            ready_time=task.get("ready-time"),
+        )
+
+    def __str__(self):
+        return f"{self.status}\t{self.summary}"
+
+
+@dataclass(frozen=True)
+class Change:
+    id: str
+    kind: str
+    summary: str
+    status: str
+    ready: bool
+    tasks: List[Task] = field(default_factory=list)
+    err: Optional[str] = None
+    spawn_time: Optional[str] = None
+    ready_time: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, change: ChangeDict) -> "Change":
+        return cls(
+            id=change["id"],
+            kind=change["kind"],
+            summary=change["summary"],
+            status=change["status"],
+            ready=change["ready"],
+            tasks=[Task.from_dict(task) for task in change.get("tasks", [])],
+            err=change.get("err"),
+            spawn_time=change.get("spawn-time"),
+            ready_time=change.get("ready-time"),
+        )
+
+    @property
+    def waiting(self) -> bool:
+        """
+        Return True if the change can't proceed without intervention,
+        e.g. because it is waiting for a (manual) reboot.
+        """
+        return not self.ready and self.status == WAIT
+
+    def __str__(self):
+        return f"{self.id}\t{self.status}\t{self.summary}"
+
+
+class Transport(ABC):
+    """
+    A way to open connections to the snapd socket, as a pair of streams:
+    one for reading responses and one for writing requests.
+    """
+
+    @abstractmethod
+    def connect(self) -> Tuple[BinaryIO, BinaryIO]:
+        """
+        Open a connection (closing the previous one, if any) and return
+        its (reader, writer) streams.
+        """
+
+    @abstractmethod
+    def settimeout(self, timeout: Optional[float]):
+        """
+        Set the timeout (in seconds) of operations on the open connection,
+        after which they raise `socket.timeout`.
+        """
+
+    @abstractmethod
+    def close(self):
+        """
+        Close the open connection, if any.
+        """
+
+
+class UnixSocketTransport(Transport):
+    """
+    Connections to a unix socket: the snapd socket itself or one that is
+    forwarded to it.
+    """
+
+    def __init__(self, path: str = SNAPD_SOCKET):
+        self.path = path
+        self.streams = []
+
+    def connect(self) -> Tuple[BinaryIO, BinaryIO]:
+        self.close()
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(self.path)
+        # the socket is closed once the streams are closed as well
+        self.streams = [connection, connection.makefile("rb")]
+        self.streams.append(connection.makefile("wb"))
+        return self.streams[1], self.streams[2]
+
+    def settimeout(self, timeout: Optional[float]):
+        if self.streams:
+            self.streams[0].settimeout(timeout)
+
+    def close(self):
+        for stream in self.streams:
+            stream.close()
+        self.streams = []
+
+
+class CommandTransport(Transport):
+    """
+    Connections through a command that relays its standard input and
+    output to the snapd socket, e.g. `nc -U /run/snapd.socket` over SSH.
+    """
+
+    def __init__(self, command: Sequence[str]):
+        self.command = list(command)
+        self.process = None
+        self.streams = []
+
+    def connect(self) -> Tuple[BinaryIO, BinaryIO]:
+        self.close()
+        # the command is attached to a socket rather than to pipes, so that
+        # reading its output can time out
+        connection, relay = socket.socketpair()
+        with relay:
+            self.process = subprocess.Popen(
+                self.command, stdin=relay, stdout=relay
+            )
+        self.streams = [connection, connection.makefile("rb")]
+        self.streams.append(connection.makefile("wb"))
+        return self.streams[1], self.streams[2]
+
+    def settimeout(self, timeout: Optional[float]):
+        if self.streams:
+            self.streams[0].settimeout(timeout)
+
+    def close(self):
+        if not self.process:
+            return
+        # the relay (e.g. `nc`) doesn't necessarily exit when its input
+        # is closed, so it is terminated
+        self.process.terminate()
+        self.process.wait()
+        for stream in self.streams:
+            try:
+                stream.close()
+            except (BrokenPipeError, socket.timeout):
+                pass
+        self.streams = []
+        self.process = None
+
+
+def ssh_transport(
+    device: Optional[Device] = None, socket_path: str = SNAPD_SOCKET
+) -> CommandTransport:
+    """
+    Return a transport over an SSH channel to the snapd socket on the
+    device (by default, the one specified by the environment, as for the
+    `_run` scriptlet), multiplexed over the master connection to it.
+    """
+    device = device or Device.from_environment()
+    return CommandTransport(
+        device.ssh_command(f"nc -U {shlex.quote(socket_path)}")
+    )
+
+
+class SnapdClient:
+    """
+    Client for the snapd REST API, sending all requests over a single
+    connection through the transport (which is reopened when it is
+    closed, e.g. by snapd after a period of inactivity).
+
+    Raises `TimeoutError` if snapd doesn't respond to a request within
+    `timeout` seconds (or before the deadline of `wait_for_changes`).
+    """
+
+    def __init__(
+        self, transport: Transport, timeout: float = RESPONSE_TIMEOUT
+    ):
+        self.transport = transport
+        self.timeout = timeout
+        # (monotonic) time by which `wait_for_changes` has to return
+        self.deadline = None
+        self.streams = None
+
+    def __enter__(self) -> "SnapdClient":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self.transport.close()
+        self.streams = None
+
+    def response_timeout(self) -> float:
+        """
+        Return the time allowed for the response to a request: `timeout`,
+        but no later than the deadline (while still allowing a poll
+        interval for the request, so that the changes are checked at least
+        once).
+        """
+        if self.deadline is None:
+            return self.timeout
+        remaining = self.deadline - time.monotonic()
+        return min(self.timeout, max(remaining, POLL_INTERVAL))
+
+    def _exchange(
+        self, method: str, path: str, payload: bytes
+    ) -> Tuple[int, Dict, bytes]:
+        reader, writer = self.streams
+        head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+        if payload:
+            head += (
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+            )
+        writer.write(head.encode("latin-1") + b"\r\n" + payload)
+        writer.flush()
+        status_line = reader.readline()
+        if not status_line:
+            raise EOFError("Connection to snapd closed")
+        status = int(status_line.split()[1])
+        headers = read_http_headers(reader)
+        content = b"".join(read_http_body(reader, headers))
+        return status, headers, content
+
+    def request(self, method: str, path: str, body: Any = None) -> Any:
+        """
+        Send a request to the API and return the result in its response.
+
+        Raises `SnapdError` for error responses.
+        """
+        payload = b"" if body is None else json.dumps(body).encode()
+        while True:
+            reused = self.streams is not None
+            if not reused:
+                self.streams = self.transport.connect()
+            timeout = self.response_timeout()
+            try:
+                self.transport.settimeout(timeout)
+                status, headers, content = self._exchange(
+                    method, path, payload
+                )
+            except socket.timeout:
+                self.close()
+                raise TimeoutError(
+                    f"No response from snapd after {timeout:g} seconds"
+                ) from None
+            except (BrokenPipeError, ConnectionResetError, EOFError):
+                self.close()
+                if reused:
+                    # the connection may have been closed while idle,
+                    # before the request was received: retry once
+                    continue
+                raise
+            except Exception:
+                self.close()
+                raise
+            break
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        document = json.loads(content)
+        if document.get("type") == "error":
+            result = document.get("result") or {}
+            raise SnapdError(
+                status, result.get("message", "Unknown error"),
+                result.get("kind")
+            )
+        return document.get("result")
+
+    def changes(
+        self, select: str = "in-progress", snap: Optional[str] = None
+    ) -> List[Change]:
+        """
+        Return the changes selected by status (`in-progress`, `ready` or
+        `all`), optionally only the ones that affect a snap.
+        """
+        path = f"/v2/changes?select={select}"
+        if snap:
+            path += f"&for={snap}"
+        return [Change.from_dict(change) for change in self.get(path)]
+
+    def change(self, change_id: str) -> Change:
+        return Change.from_dict(self.get(f"/v2/changes/{change_id}"))
+
+    def get(self, path: str) -> Any:
+        return self.request("GET", path)
+
+    def pending_changes(
+        self, change_ids: Optional[Sequence[str]] = None
+    ) -> List[Change]:
+        """
+        Return the changes with the given ids (or all the changes) that
+        are not ready yet.
+        """
+        if change_ids is None:
+            changes = self.changes("in-progress")
+        else:
+            changes = [self.change(change_id) for change_id in change_ids]
+        return [change for change in changes if not change.ready]
+
+    def wait_for_changes(
+        self,
+        change_ids: Optional[Sequence[str]] = None,
+        timeout: Optional[float] = None,
+        interval: float = POLL_INTERVAL,
+        report: Optional[Callable[[List[Change]], None]] = None,
+    ) -> List[Change]:
+        """
+        Wait until the changes with the given ids (or all the changes in
+        progress) are ready or waiting (e.g. for a manual reboot),
+        returning the ones that are waiting.
+
+        Whenever the status of the changes that are not ready is updated,
+        they are passed to `report`. Connection errors (e.g. while the
+        device reboots) are tolerated until the timeout expires.
+
+        Raises `TimeoutError` if the changes aren't ready in time
+        (a timeout of 0 checks the changes only once).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        reported = None
+        while True:
+            self.deadline = deadline
+            try:
+                pending = self.pending_changes(change_ids)
+            except (OSError, EOFError) as error:
+                self.close()
+                print(f"Unable to reach snapd: {error}", file=sys.stderr)
+                delay = RECONNECT_DELAY
+            else:
+                if all(change.waiting for change in pending):
+                    return pending
+                statuses = [
+                    (change.id, [task.status for task in change.tasks])
+                    for change in pending
+                ]
+                if report and statuses != reported:
+                    report(pending)
+                reported = statuses
+                delay = interval
+            finally:
+                self.deadline = None
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise TimeoutError(
+                    f"Snap changes not complete after {timeout} seconds"
+                )
+            time.sleep(delay)
+
+
+def print_changes(changes: List[Change]):
+    for change in changes:
+        print(change)
+        for task in change.tasks:
+            if task.status in IN_PROGRESS:
+                print(f"  {task}")
+    sys.stdout.flush()
+
+
+def main(args: Optional[List[str]] = None):
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--socket",
+        help=(
+            "Path to the snapd socket (or a socket forwarded to it), "
+            "instead of connecting to the device over SSH"
+        )
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    changes_parser = commands.add_parser(
+        "changes", help="List the snap changes"
+    )
+    changes_parser.add_argument(
+        "--all", action="store_true",
+        help="Include the changes that are ready"
+    )
+    change_parser = commands.add_parser(
+        "change", help="Show the tasks of a snap change"
+    )
+    change_parser.add_argument("id")
+    wait_parser = commands.add_parser(
+        "wait",
+        help=(
+            "Wait for the snap changes to complete. Exits with 0 when they "
+            "are complete, 1 on timeout and 2 when changes are waiting "
+            "(e.g. for a manual reboot)"
+        )
+    )
+    wait_parser.add_argument(
+        "ids", nargs="*",
+        help="Snap changes to wait for (all the changes by default)"
+    )
+    wait_parser.add_argument(
+        "--timeout", type=float,
+        help="Seconds to wait for (0 checks the changes only once)"
+    )
+    wait_parser.add_argument(
+        "--interval", type=float, default=POLL_INTERVAL,
+        help="Seconds between checks"
+    )
+    args = parser.parse_args(args)
+
+    transport = (
+        UnixSocketTransport(args.socket) if args.socket else ssh_transport()
+    )
+    with SnapdClient(transport) as client:
+        try:
+            run_command(client, args)
+        except (SnapdError, TimeoutError) as error:
+            raise SystemExit(f"Error: {error}")
+
+
+def run_command(client: SnapdClient, args):
+    if args.command == "changes":
+        for change in client.changes("all" if args.all else "in-progress"):
+            print(change)
+    elif args.command == "change":
+        change = client.change(args.id)
+        print(change)
+        for task in change.tasks:
+            print(f"  {task}")
+    else:
+        try:
+            waiting = client.wait_for_changes(
+                args.ids or None,
+                timeout=args.timeout,
+                interval=args.interval,
+                report=print_changes,
+            )
+        except TimeoutError as error:
+            print(error)
+            sys.exit(1)
+        if waiting:
+            print("Snap changes are waiting:")
+            print_changes(waiting)
+            sys.exit(2)
+        print("No ongoing or pending snap changes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Incremental readers for HTTP responses and JSON documents, so that large
+responses (e.g. from the snapd API) can be processed as they arrive,
+without reading or decoding the whole document first.
+"""
+
+import codecs
+import json
+import re
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+
+# size of the blocks read from a stream
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+
+# runs of characters that can be skipped while looking for the end of a
+# value: within a string, within an object or array (outside strings) and
+# within a number or literal
+_STRING_RUN = re.compile(r'[^"\\]*')
+_STRUCTURE_RUN = re.compile(r'[^"{}\[\]]*')
+_SCALAR_RUN = re.compile(r"[^\s,:\]}]*")
+
+
+def read_chunks(
+    stream: BinaryIO, size: Optional[int] = None
+) -> Iterator[bytes]:
+    """
+    Read a stream in blocks, up to `size` bytes (if specified) or until
+    the end of the stream.
+    """
+    while size is None or size > 0:
+        block = stream.read(
+            CHUNK_SIZE if size is None else min(size, CHUNK_SIZE)
+        )
+        if not block:
+            if size:
+                raise EOFError("Truncated HTTP response body")
+            return
+        if size is not None:
+            size -= len(block)
+        yield block
+
+
+def read_http_headers(stream: BinaryIO) -> dict:
+    """
+    Read the headers of an HTTP message (following the start line),
+    returning them with lowercase names and leaving the stream at the body.
+    """
+    headers = {}
+    while True:
+        line = stream.readline()
+        if not line:
+            raise EOFError("Truncated HTTP headers")
+        if line in (b"\r\n", b"\n"):
+            return headers
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+
+def read_chunked(stream: BinaryIO) -> Iterator[bytes]:
+    """
+    Read a body with chunked transfer encoding, yielding the chunks.
+    """
+    while True:
+        size_line = stream.readline()
+        if not size_line:
+            raise EOFError("Truncated chunked HTTP response body")
+        # chunk extensions (after ";") are ignored
+        size = int(size_line.split(b";")[0].strip(), 16)
+        if size == 0:
+            # skip the trailer
+            while stream.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            return
+        yield from read_chunks(stream, size)
+        stream.readline()
+
+
+def read_http_body(stream: BinaryIO, headers: dict) -> Iterator[bytes]:
+    """
+    Read the body of an HTTP message with the given headers, in blocks.
+    """
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        yield from read_chunked(stream)
+    elif "content-length" in headers:
+        yield from read_chunks(stream, int(headers["content-length"]))
+    else:
+        yield from read_chunks(stream)
+
+
+def read_response_body(stream: BinaryIO) -> Iterator[bytes]:
+    """
+    Read the body of the raw HTTP response in the stream, in blocks.
+
+    Streams that don't start with an HTTP status line are assumed to be
+    the body alone, so that both raw responses and bare documents are
+    accepted.
+    """
+    prefix = stream.read(len(b"HTTP/"))
+    if prefix != b"HTTP/":
+        if prefix:
+            yield prefix
+        yield from read_chunks(stream)
+        return
+    # the rest of the status line
+    stream.readline()
+    headers = read_http_headers(stream)
+    yield from read_http_body(stream, headers)
+
+
+def decode(blocks: Iterable[bytes], encoding: str = "utf-8") -> Iterator[str]:
+    """
+    Decode blocks of bytes into text, handling characters that are split
+    across blocks.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for block in blocks:
+        text = decoder.decode(block)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+class _ValueScanner:
+    """
+    Locate the end of a JSON value that arrives in pieces, keeping track
+    of where the scan is (in a string, an escape sequence, a number or
+    literal, or in nested objects and arrays) between pieces.
+
+    The value is not validated: that is left to the decoder.
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.in_scalar = False
+
+    def scan(self, text: str, index: int) -> Optional[int]:
+        """
+        Scan the text from the index and return the index right after the
+        end of the value, or None if the value continues after the text.
+        """
+        length = len(text)
+        while index < length:
+            if self.escaped:
+                self.escaped = False
+                index += 1
+            elif self.in_string:
+                index = _STRING_RUN.match(text, index).end()
+                if index == length:
+                    return None
+                index += 1
+                if text[index - 1] == "\\":
+                    self.escaped = True
+                    continue
+                self.in_string = False
+                if not self.depth:
+                    return index
+            elif self.in_scalar:
+                index = _SCALAR_RUN.match(text, index).end()
+                if index < length:
+                    return index
+            elif self.depth:
+                index = _STRUCTURE_RUN.match(text, index).end()
+                if index == length:
+                    return None
+                character = text[index]
+                index += 1
+                if character == '"':
+                    self.in_string = True
+                elif character in "{[":
+                    self.depth += 1
+                else:
+                    self.depth -= 1
+                    if not self.depth:
+                        return index
+            else:
+                # the first character of the value
+                character = text[index]
+                if character == '"':
+                    self.in_string = True
+                    index += 1
+                elif character in "{[":
+                    self.depth = 1
+                    index += 1
+                else:
+                    self.in_scalar = True
+        return None
+
+
+class JSONStream:
+    """
+    Incremental reader of a JSON document that arrives in pieces.
+
+    The structure of the document is navigated with `members` (for
+    objects) and `elements` (for arrays); only the values that are
+    explicitly requested with `value` are decoded into Python objects,
+    while `skip` discards a value of any size without decoding it.
+
+    For example, printing the name of every plug in a response of the
+    `connections` endpoint of the snapd API:
+    ```
+    stream = JSONStream(pieces)
+    for key in stream.members():
+        if key != "result":
+            stream.skip()
+            continue
+        for key in stream.members():
+            if key != "plugs":
+                stream.skip()
+                continue
+            for _ in stream.elements():
+                print(stream.value()["plug"])
+    ```
+    """
+
+    def __init__(self, pieces: Iterable[str]):
+        self.pieces = iter(pieces)
+        self.buffer = ""
+        self.position = 0
+        self.exhausted = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """
+        Append the next piece of the document to the buffer (dropping the
+        part that was already read), returning False at the end.
+        """
+        for piece in self.pieces:
+            self.buffer = self.buffer[self.position :] + piece
+            self.position = 0
+            return True
+        self.exhausted = True
+        return False
+
+    def peek(self) -> str:
+        """
+        Return the next (non-whitespace) character without consuming it,
+        or an empty string at the end of the document.
+        """
+        while True:
+            while (
+                self.position < len(self.buffer)
+                and self.buffer[self.position] in _WHITESPACE
+            ):
+                self.position += 1
+            if self.position < len(self.buffer) or not self._fill():
+                return self.buffer[self.position : self.position + 1]
+
+    def expect(self, character: str):
+        if self.peek() != character:
+            context = self.buffer[self.position : self.position + 20]
+            raise ValueError(f"Expected {character!r} at {context!r}")
+        self.position += 1
+
+    def value(self):
+        """
+        Decode and return the next value.
+
+        The end of the value is located first, scanning each piece only
+        once, so that the value is decoded once even if it spans many
+        pieces.
+        """
+        self.peek()
+        scanner = _ValueScanner()
+        if scanner.scan(self.buffer, self.position) is not None:
+            value, self.position = self.decoder.raw_decode(
+                self.buffer, self.position
+            )
+            return value
+        # the value continues in the next pieces
+        parts = [self.buffer[self.position :]]
+        self.buffer, self.position = "", 0
+        for piece in self.pieces:
+            end = scanner.scan(piece, 0)
+            if end is not None:
+                parts.append(piece[:end])
+                self.buffer, self.position = piece, end
+                break
+            parts.append(piece)
+        else:
+            # (a number or literal can end with the document)
+            self.exhausted = True
+        text = "".join(parts)
+        value, end = self.decoder.raw_decode(text)
+        if end != len(text):
+            raise json.JSONDecodeError("Extra data", text, end)
+        return value
+
+    def members(self) -> Iterator[str]:
+        """
+        Iterate over the keys of the next value (an object); the value of
+        each key must be read (with `value`, `members` or `elements`) or
+        skipped before proceeding to the next key.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.position += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.position += 1
+            else:
+                self.expect("}")
+                return
+
+    def elements(self) -> Iterator[None]:
+        """
+        Iterate over the elements of the next value (an array); each
+        element must be read or skipped before proceeding to the next.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.position += 1
+            return
+        while True:
+            yield
+            if self.peek() == ",":
+                self.position += 1
+            else:
+                self.expect("]")
+                return
+
+    def skip(self):
+        """
+        Skip the next value, without decoding objects or arrays as a whole.
+        """
+        character = self.peek()
+        if character == "{":
+            for _ in self.members():
+                self.skip()
+        elif character == "[":
+            for _ in self.elements():
+                self.skip()
+        else:
+            self.value()
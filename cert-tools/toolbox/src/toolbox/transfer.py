@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+"""
+Synchronize files and directories with a device, transferring only what
+has changed.
+
+When `rsync` is available both locally and on the device, it is used
+(comparing files by checksum, since the modification times of e.g. a
+fresh clone of a repository are always new) and it transfers the
+differences within changed files. Otherwise, the files are compared
+through manifests of their SHA-256 hashes (computed on each side) and the
+changed files are streamed as tar archives, split across concurrent
+channels of the SSH session (see `toolbox.device`).
+
+The transfers can be compressed (for slow links) and each one is
+reported with the number of files and bytes transferred and the time it
+took, e.g.:
+```
+device_transfer put --compress scriptlets/retry scriptlets/log :.scriptlets
+device_transfer get :/var/log/syslog artifacts
+```
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import re
+import shlex
+import subprocess
+import tempfile
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from toolbox.device import MAX_SESSIONS, Device
+
+
+# relative paths of files, grouped by the (local or remote) directory that
+# they are relative to
+FileGroups = Dict[str, List[str]]
+
+# hashes of files, by their relative paths
+Manifest = Dict[str, str]
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# exit status of the listing of a source on the device that doesn't exist
+# (distinct from the statuses of ssh and of the listing commands)
+MISSING_SOURCE = 66
+
+
+class TransferReport(NamedTuple):
+    method: str
+    # files (and bytes) transferred, out of the files considered
+    files: int
+    total: int
+    bytes: int
+    seconds: float
+
+    def __str__(self):
+        return (
+            f"Transferred {self.files} of {self.total} files "
+            f"({self.bytes} bytes) in {self.seconds:.2f}s ({self.method})"
+        )
+
+
+def remote_path(path: str) -> str:
+    """
+    Return a path on the device, without the `:` prefix that denotes it
+    (as for `_put` and `_get`); an empty path is the home directory.
+    """
+    path = path[1:] if path.startswith(":") else path
+    return path or "."
+
+
+def split_source(source: str) -> Tuple[str, str]:
+    """
+    Return the parent directory and the name of a source; the name is
+    what the source is transferred as into the target directory.
+    """
+    source = source.rstrip("/") or "/"
+    parent, name = os.path.split(source)
+    return parent or ".", name
+
+
+def list_local_files(sources: Iterable[str]) -> FileGroups:
+    """
+    Return the files of the (local) sources, i.e. the sources themselves
+    or the files in them for directories.
+    """
+    groups = {}
+    for source in sources:
+        parent, name = split_source(source)
+        files = groups.setdefault(parent, [])
+        if not os.path.isdir(source):
+            files.append(name)
+            continue
+        for directory, _, filenames in os.walk(source):
+            relative = os.path.relpath(directory, parent)
+            files.extend(
+                os.path.join(relative, filename) for filename in filenames
+            )
+    return groups
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def local_manifest(root: str, paths: Iterable[str]) -> Manifest:
+    """
+    Return the hashes of the files (that exist) under the local root.
+    """
+    manifest = {}
+    for path in paths:
+        try:
+            manifest[path] = hash_file(os.path.join(root, path))
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            pass
+    return manifest
+
+
+def parse_manifest(output: str) -> Manifest:
+    """
+    Parse the output of `sha256sum` into a manifest.
+    """
+    manifest = {}
+    for line in output.splitlines():
+        digest, separator, path = line.partition("  ")
+        # (names with special characters are escaped and start with "\",
+        # so they are always transferred)
+        if separator and re.fullmatch(r"[0-9a-f]{64}", digest):
+            manifest[path] = digest
+    return manifest
+
+
+def remote_manifest(device: Device, root: str, paths: List[str]) -> Manifest:
+    """
+    Return the hashes of the files (that exist) under the root on the
+    device.
+    """
+    if not paths:
+        return {}
+    result = device.run(
+        f"cd {shlex.quote(root)} 2>/dev/null && "
+        "xargs -0 -r sha256sum -- 2>/dev/null; true",
+        input="\0".join(paths),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_manifest(result.stdout)
+
+
+def list_remote_files(
+    device: Device, sources: Iterable[str]
+) -> Tuple[FileGroups, Dict[str, Manifest]]:
+    """
+    Return the files of the sources on the device and their hashes.
+
+    Exits (as scp does) if a source doesn't exist.
+    """
+    groups = {}
+    manifests = {}
+    for source in sources:
+        parent, name = split_source(remote_path(source))
+        result = device.run(
+            f"cd {shlex.quote(parent)} 2>/dev/null && "
+            f"test -e {shlex.quote(name)} || exit {MISSING_SOURCE}; "
+            f"find {shlex.quote(name)} -type f -print0 | "
+            "xargs -0 -r sha256sum --",
+            capture_output=True,
+            text=True,
+            stdin=subprocess.DEVNULL,
+        )
+        if result.returncode == MISSING_SOURCE:
+            raise SystemExit(
+                f"{remote_path(source)}: No such file or directory"
+            )
+        result.check_returncode()
+        manifest = parse_manifest(result.stdout)
+        groups.setdefault(parent, []).extend(manifest)
+        manifests.setdefault(parent, {}).update(manifest)
+    return groups, manifests
+
+
+def partition(
+    paths: List[str], sizes: Dict[str, int], count: int
+) -> List[List[str]]:
+    """
+    Split the paths into (at most) `count` batches of similar total size.
+    """
+    batches = [[] for _ in range(max(1, min(count, len(paths))))]
+    totals = [0] * len(batches)
+    for path in sorted(paths, key=lambda path: -sizes.get(path, 0)):
+        index = totals.index(min(totals))
+        batches[index].append(path)
+        totals[index] += sizes.get(path, 0)
+    return [batch for batch in batches if batch]
+
+
+def pipe(
+    producer: List[str], consumer: List[str], paths: List[str]
+) -> None:
+    """
+    Run the producer with the (NUL-separated) paths as its input and its
+    output piped to the consumer.
+    """
+    source = subprocess.Popen(
+        producer, stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+    sink = subprocess.Popen(consumer, stdin=source.stdout)
+    # the sink holds the only reference to the pipe
+    source.stdout.close()
+    source.stdin.write("\0".join(paths).encode())
+    source.stdin.close()
+    source.wait()
+    sink.wait()
+    for process, command in ((source, producer), (sink, consumer)):
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def tar_command(create: bool, directory: str, compress: bool) -> List[str]:
+    """
+    Return a tar command that creates an archive (to standard output) of
+    the NUL-separated paths in its input, or that extracts an archive
+    (from standard input), in the directory.
+    """
+    operation = ("-c" if create else "-x") + ("z" if compress else "")
+    command = ["tar", operation + "f", "-", "-C", directory]
+    if create:
+        command += ["--null", "-T", "-"]
+    return command
+
+
+def manifest_put_file(
+    device: Device, source: str, target: str, compress: bool = False
+) -> TransferReport:
+    """
+    Copy a (local) file to a path on the device, unless the file there is
+    the same.
+    """
+    start = time.monotonic()
+    parent, name = split_source(target)
+    if remote_manifest(device, parent, [name]).get(name) == hash_file(source):
+        return TransferReport("manifest", 0, 1, 0, time.monotonic() - start)
+
+    source_parent, source_name = split_source(source)
+    # the file is extracted into a temporary directory next to the target
+    # and then renamed
+    extract = shlex.join(tar_command(False, ".", compress))
+    command = (
+        f"mkdir -p {shlex.quote(parent)} && "
+        f"directory=$(mktemp -d -p {shlex.quote(parent)}) && "
+        f'(cd "$directory" && {extract}) && '
+        f'mv -f -- "$directory"/{shlex.quote(source_name)} '
+        f"{shlex.quote(target)}; "
+        'status=$?; rm -rf "$directory"; exit $status'
+    )
+    device.open()
+    pipe(
+        tar_command(True, source_parent, compress),
+        device.ssh_command(command),
+        [source_name],
+    )
+    return TransferReport(
+        "manifest", 1, 1, os.path.getsize(source), time.monotonic() - start
+    )
+
+
+def manifest_put(
+    device: Device,
+    sources: List[str],
+    target: str,
+    workers: int = MAX_SESSIONS,
+    compress: bool = False,
+) -> TransferReport:
+    start = time.monotonic()
+    target = remote_path(target)
+    # as with scp, a single file is copied to the target path itself,
+    # unless the target is a directory
+    if (
+        len(sources) == 1
+        and os.path.isfile(sources[0])
+        and not target.endswith("/")
+        and device.run(
+            f"test -d {shlex.quote(target)}", stdin=subprocess.DEVNULL
+        ).returncode
+    ):
+        return manifest_put_file(device, sources[0], target, compress)
+    groups = list_local_files(sources)
+    batches = []
+    total = transferred = size = 0
+    for parent, paths in groups.items():
+        total += len(paths)
+        remote = remote_manifest(device, target, paths)
+        changed = [
+            path for path in paths
+            if remote.get(path) != hash_file(os.path.join(parent, path))
+        ]
+        sizes = {
+            path: os.path.getsize(os.path.join(parent, path))
+            for path in changed
+        }
+        transferred += len(changed)
+        size += sum(sizes.values())
+        batches.extend(
+            (parent, batch) for batch in partition(changed, sizes, workers)
+        )
+
+    extract = shlex.join(tar_command(False, target, compress))
+    command = f"mkdir -p {shlex.quote(target)} && {extract}"
+
+    def put(batch):
+        parent, paths = batch
+        pipe(
+            tar_command(True, parent, compress),
+            device.ssh_command(command),
+            paths,
+        )
+
+    if batches:
+        device.open()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(put, batches))
+    return TransferReport(
+        "manifest", transferred, total, size, time.monotonic() - start
+    )
+
+
+def manifest_get_file(
+    device: Device,
+    parent: str,
+    name: str,
+    digest: str,
+    target: str,
+    compress: bool = False,
+) -> TransferReport:
+    """
+    Copy a file (with the given hash) in a directory on the device to a
+    local path, unless the file there is the same.
+    """
+    start = time.monotonic()
+    directory, target_name = split_source(target)
+    if local_manifest(directory, [target_name]).get(target_name) == digest:
+        return TransferReport("manifest", 0, 1, 0, time.monotonic() - start)
+
+    os.makedirs(directory, exist_ok=True)
+    create = shlex.join(tar_command(True, parent, compress))
+    device.open()
+    # the file is extracted into a temporary directory next to the target
+    # and then renamed
+    with tempfile.TemporaryDirectory(dir=directory) as temporary:
+        pipe(
+            device.ssh_command(create),
+            tar_command(False, temporary, compress),
+            [name],
+        )
+        os.replace(os.path.join(temporary, name), target)
+    return TransferReport(
+        "manifest", 1, 1, os.path.getsize(target), time.monotonic() - start
+    )
+
+
+def manifest_get(
+    device: Device,
+    sources: List[str],
+    target: str,
+    workers: int = MAX_SESSIONS,
+    compress: bool = False,
+) -> TransferReport:
+    start = time.monotonic()
+    groups, manifests = list_remote_files(device, sources)
+    # as with scp, a single file is copied to the target path itself,
+    # unless the target is a directory
+    if (
+        len(sources) == 1
+        and not os.path.isdir(target)
+        and not target.endswith(os.sep)
+    ):
+        _, name = split_source(remote_path(sources[0]))
+        [(parent, paths)] = groups.items()
+        if paths == [name]:
+            return manifest_get_file(
+                device, parent, name, manifests[parent][name], target,
+                compress
+            )
+    batches = []
+    total = transferred = 0
+    for parent, paths in groups.items():
+        total += len(paths)
+        local = local_manifest(target, paths)
+        changed = [
+            path for path in paths
+            if local.get(path) != manifests[parent][path]
+        ]
+        transferred += len(changed)
+        # sizes are not known in advance: the batches are split by count
+        batches.extend(
+            (parent, batch) for batch in partition(changed, {}, workers)
+        )
+
+    def get(batch):
+        parent, paths = batch
+        create = shlex.join(tar_command(True, parent, compress))
+        pipe(
+            device.ssh_command(create),
+            tar_command(False, target, compress),
+            paths,
+        )
+
+    if batches:
+        os.makedirs(target, exist_ok=True)
+        device.open()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(get, batches))
+    size = sum(
+        os.path.getsize(os.path.join(target, path))
+        for _, paths in batches for path in paths
+    )
+    return TransferReport(
+        "manifest", transferred, total, size, time.monotonic() - start
+    )
+
+
+def rsync_available(device: Device) -> bool:
+    """
+    Return True if rsync is available both locally and on the device.
+    """
+    if not any(
+        os.access(os.path.join(directory, "rsync"), os.X_OK)
+        for directory in os.environ.get("PATH", "").split(os.pathsep)
+    ):
+        return False
+    result = device.run(
+        "command -v rsync", capture_output=True, stdin=subprocess.DEVNULL
+    )
+    return result.returncode == 0
+
+
+def parse_rsync_stats(output: str) -> Tuple[int, int, int]:
+    """
+    Return the number of files considered and transferred and the bytes
+    transferred (sent and received) from the `--stats` output of rsync.
+    """
+    def number(label):
+        # newer versions also count directories in some of the numbers,
+        # e.g. "Number of files: 2 (reg: 1, dir: 1)"
+        match = re.search(
+            rf"^{label}: ([\d,]+)(?: \(reg: ([\d,]+))?", output, re.MULTILINE
+        )
+        if not match:
+            return 0
+        return int((match.group(2) or match.group(1)).replace(",", ""))
+
+    # (older versions only count the files transferred)
+    return (
+        number("Number of regular files transferred")
+        or number("Number of files transferred"),
+        number("Number of files"),
+        number("Total bytes sent") + number("Total bytes received"),
+    )
+
+
+def rsync(
+    device: Device,
+    sources: List[str],
+    target: str,
+    put: bool,
+    compress: bool = False,
+) -> TransferReport:
+    start = time.monotonic()
+    command = [
+        "rsync", "--recursive", "--links", "--perms", "--times",
+        "--checksum", "--stats",
+        "-e", shlex.join(device.remote_shell()),
+    ]
+    if compress:
+        command.append("--compress")
+    if put:
+        command += [source.rstrip("/") for source in sources]
+        command.append(f"{device.destination}:{remote_path(target)}")
+    else:
+        command += [
+            f"{device.destination}:{remote_path(source).rstrip('/')}"
+            for source in sources
+        ]
+        command.append(target)
+    # (only the statistics are captured: the errors of rsync, e.g. for a
+    # missing source, are shown as they are, as with scp)
+    result = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+    if result.returncode:
+        raise SystemExit(result.returncode)
+    files, total, size = parse_rsync_stats(result.stdout)
+    return TransferReport(
+        "rsync", files, max(files, total), size, time.monotonic() - start
+    )
+
+
+def transfer(
+    device: Device,
+    put: bool,
+    sources: List[str],
+    target: str,
+    workers: int = MAX_SESSIONS,
+    compress: bool = False,
+    method: str = "auto",
+) -> TransferReport:
+    """
+    Synchronize the sources to the target (on the device when `put`,
+    locally otherwise) with the specified method (`rsync`, `manifest` or
+    `auto`, i.e. rsync when it is available).
+    """
+    if method == "rsync" or (method == "auto" and rsync_available(device)):
+        return rsync(device, sources, target, put, compress)
+    function = manifest_put if put else manifest_get
+    return function(device, sources, target, workers, compress)
+
+
+def main(args: Optional[List[str]] = None):
+    parser = ArgumentParser(
+        description="Transfer files to or from the device, skipping the "
+        "ones that are unchanged"
+    )
+    parser.add_argument("direction", choices=["put", "get"])
+    parser.add_argument(
+        "paths", nargs="+", metavar="path",
+        help="Sources followed by the target (device paths may start with :)"
+    )
+    parser.add_argument(
+        "--compress", action="store_true",
+        help="Compress the transferred data (for slow links)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=MAX_SESSIONS,
+        help="Maximum number of concurrent transfers (manifest method)"
+    )
+    parser.add_argument(
+        "--method", choices=["auto", "rsync", "manifest"], default="auto",
+        help="Use rsync or hash manifests (default: rsync if available)"
+    )
+    args = parser.parse_args(args)
+    if len(args.paths) < 2:
+        parser.error("both sources and a target are required")
+
+    device = Device.from_environment()
+    report = transfer(
+        device,
+        args.direction == "put",
+        args.paths[:-1],
+        args.paths[-1],
+        workers=args.workers,
+        compress=args.compress,
+        method=args.method,
+    )
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from toolbox.device import Device
+
+
+# a fake `ssh` that runs commands locally and keeps track of the master
+# connection in $STATE/master (and of the command lines in $STATE/ssh.log)
+FAKE_SSH = """#!/bin/bash
+echo "$*" >> "$STATE/ssh.log"
+CONTROL=
+MASTER=
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -o)
+            [ "$2" = "ControlMaster=auto" ] && MASTER=auto
+            shift 2 ;;
+        -O) CONTROL=$2; shift 2 ;;
+        -f|-N) shift ;;
+        *) break ;;
+    esac
+done
+shift
+case "$CONTROL" in
+    check) [ -e "$STATE/master" ]; exit ;;
+    stop) rm -f "$STATE/master"; exit ;;
+esac
+[ -n "$MASTER" ] && touch "$STATE/master"
+[ $# -eq 0 ] && exit 0
+exec bash -c "$*"
+"""
+
+# a fake `scp` that copies files locally (stripping the destination)
+FAKE_SCP = """#!/bin/bash
+ARGS=()
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -o) shift 2 ;;
+        *) ARGS+=("${1#*:}"); shift ;;
+    esac
+done
+exec cp "${ARGS[@]}"
+"""
+
+# a fake `sudo` on which `reboot` changes the boot id
+FAKE_SUDO = """#!/bin/bash
+if [ "$1" = reboot ]; then
+    (sleep 0.2; echo "$RANDOM$RANDOM" > "$STATE/boot_id") &
+    exit 255
+fi
+exec "$@"
+"""
+
+
+@pytest.fixture
+def device(tmp_path):
+    bin_path = tmp_path / "bin"
+    bin_path.mkdir()
+    for name, content in (
+        ("ssh", FAKE_SSH), ("scp", FAKE_SCP), ("sudo", FAKE_SUDO)
+    ):
+        (bin_path / name).write_text(content)
+        (bin_path / name).chmod(0o755)
+    (tmp_path / "boot_id").write_text("1\n")
+    environment = {
+        "PATH": f"{bin_path}:{os.environ['PATH']}",
+        "STATE": str(tmp_path),
+    }
+    with patch.dict("os.environ", environment):
+        yield Device("10.0.0.1", user="ubuntu")
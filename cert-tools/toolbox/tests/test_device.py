@@ -0,0 +1,254 @@
+import socket
+import subprocess
+import threading
+import time
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+from toolbox import device as device_module
+from toolbox.device import Device
+
+
+def ssh_log(tmp_path):
+    return (tmp_path / "ssh.log").read_text().splitlines()
+
+
+class TestDeviceCommands:
+
+    def test_from_environment(self):
+        environment = {
+            "DEVICE_IP": "10.0.0.1",
+            "DEVICE_USER": "user",
+            "DEVICE_PWD": "secret",
+            "SSH_OPTS": "-o ConnectTimeout=5",
+            "SSH_CONTROL_DIR": "/run/ssh",
+            "SSH_CONTROL_PERSIST": "30",
+            "TOOLS_PATH_DEVICE": "tools",
+        }
+        with patch.dict("os.environ", environment, clear=True):
+            device = Device.from_environment()
+        assert device.ssh_command("true") == [
+            "sshpass", "-p", "secret", "ssh", "-o", "ConnectTimeout=5",
+            "-o", "ControlMaster=auto", "-o", "ControlPath=/run/ssh/ssh-%C",
+            "-o", "ControlPersist=30",
+            "user@10.0.0.1", 'export PATH="$PATH:$HOME/tools"; true',
+        ]
+
+    def test_not_multiplexed(self):
+        environment = {"DEVICE_IP": "10.0.0.1", "SSH_CONTROL_OPTS": ""}
+        with patch.dict("os.environ", environment, clear=True):
+            device = Device.from_environment()
+        assert not device.multiplexed
+        assert "ControlMaster=auto" not in device.ssh_command("true")
+
+    def test_no_device(self):
+        with patch.dict("os.environ", {}, clear=True):
+            with pytest.raises(SystemExit):
+                Device.from_environment()
+
+    def test_unmultiplexed_command(self):
+        device = Device("10.0.0.1", ssh_options=[])
+        assert device.ssh_command("true", multiplexed=False) == [
+            "ssh", "-o", "ControlMaster=no", "-o", "ControlPath=none",
+            "10.0.0.1", "true",
+        ]
+
+
+class TestDeviceSession:
+
+    def test_open_close(self, device, tmp_path):
+        assert not device.is_open()
+        device.open()
+        assert device.is_open()
+        # an open master connection is reused
+        device.open()
+        assert sum("-f -N" in line for line in ssh_log(tmp_path)) == 1
+        device.close()
+        assert not device.is_open()
+
+    def test_run(self, device):
+        result = device.run("echo hello; exit 3", capture_output=True)
+        assert result.returncode == 3
+        assert result.stdout == b"hello\n"
+        with pytest.raises(subprocess.CalledProcessError):
+            device.run("false", check=True)
+
+    def test_stream(self, device):
+        lines = device.stream("echo one; echo two >&2; echo three")
+        assert list(lines) == ["one", "two", "three"]
+        with pytest.raises(subprocess.CalledProcessError):
+            list(device.stream("echo one; false"))
+
+    def test_run_concurrently(self, device):
+        start = time.perf_counter()
+        results = device.run_concurrently(
+            [f"sleep 0.5; echo {index}" for index in range(8)]
+        )
+        elapsed = time.perf_counter() - start
+        assert [result.stdout for result in results] == [
+            f"{index}\n" for index in range(8)
+        ]
+        assert elapsed < 2
+        assert device.is_open()
+
+    def test_put_get(self, device, tmp_path):
+        source = tmp_path / "source"
+        source.write_text("content")
+        device.put([str(source)], f":{tmp_path / 'remote'}")
+        device.get([str(tmp_path / "remote")], str(tmp_path / "local"))
+        assert (tmp_path / "local").read_text() == "content"
+
+    def test_reboot(self, device, tmp_path):
+        device.open()
+        with patch.object(device_module, "BOOT_ID", tmp_path / "boot_id"), \
+             patch.object(device_module, "PROBE_INTERVAL", 0.05), \
+             patch.object(device, "probe", return_value=True):
+            elapsed = device.reboot(timeout=10)
+        assert elapsed >= 0.2
+        assert (tmp_path / "boot_id").read_text() != "1\n"
+        # the device was probed without the master connection until it had
+        # booted again, and the master connection was then reopened
+        assert any("ControlPath=none" in line for line in ssh_log(tmp_path))
+        assert device.is_open()
+
+    def test_reboot_timeout(self, device, tmp_path):
+        with patch.object(device_module, "BOOT_ID", tmp_path / "boot_id"), \
+             patch.object(device_module, "PROBE_INTERVAL", 0.05), \
+             patch.object(device, "probe", return_value=False), \
+             patch.object(device, "run"):
+            with pytest.raises(TimeoutError):
+                device.reboot(timeout=0.2)
+
+
+# a fake `systemctl` that reports the state in $STATE/system_state (and,
+# with --wait, waits until the state is no longer "starting")
+FAKE_SYSTEMCTL = """#!/bin/bash
+echo "$*" >> "$STATE/systemctl.log"
+if [ "$2" = "--wait" ] && [ -e "$STATE/no_wait" ]; then
+    echo "systemctl: unrecognized option '--wait'" >&2
+    exit 1
+fi
+while [ "$2" = "--wait" ] && [ "$(cat "$STATE/system_state")" = starting ]; do
+    sleep 0.05
+done
+cat "$STATE/system_state"
+"""
+
+
+class SSHServer:
+    """
+    A server that only sends the identification string of an SSH server,
+    accepting connections after a delay (as if the device was booting).
+    """
+
+    def __init__(self, delay=0):
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+        self.delay = delay
+
+    def serve(self):
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+                self.listener.listen()
+            while True:
+                connection, _ = self.listener.accept()
+                with connection:
+                    connection.sendall(b"SSH-2.0-OpenSSH\r\n")
+        except OSError:
+            # the server was closed
+            return
+
+    def __enter__(self):
+        if not self.delay:
+            self.listener.listen()
+        threading.Thread(target=self.serve, daemon=True).start()
+        return self
+
+    def __exit__(self, *_):
+        # (shutting down the listener interrupts `accept`)
+        try:
+            self.listener.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.listener.close()
+
+
+@pytest.fixture
+def booting_device(device, tmp_path):
+    systemctl = tmp_path / "bin" / "systemctl"
+    systemctl.write_text(FAKE_SYSTEMCTL)
+    systemctl.chmod(0o755)
+    (tmp_path / "system_state").write_text("starting\n")
+    with SSHServer(delay=0.3) as server, \
+         patch.object(device_module, "PROBE_INTERVAL", 0.05), \
+         patch.object(device_module, "STATE_DELAY", 0.05):
+        yield Device("127.0.0.1", port=server.port)
+
+
+def set_state_later(tmp_path, state, delay):
+    def set_state():
+        time.sleep(delay)
+        (tmp_path / "system_state").write_text(f"{state}\n")
+    threading.Thread(target=set_state, daemon=True).start()
+
+
+class TestWaitUntilReady:
+
+    def test_probe(self):
+        with SSHServer() as server:
+            assert Device("127.0.0.1", port=server.port).probe()
+        assert not Device("127.0.0.1", port=server.port).probe()
+
+    def test_wait_until_ready(self, booting_device, tmp_path):
+        set_state_later(tmp_path, "running", 0.6)
+        state, elapsed = booting_device.wait_until_ready(timeout=10)
+        assert state == "running"
+        # ready as soon as the system is running
+        assert 0.6 <= elapsed < 1.5
+        # a single session waited for the system to start up
+        assert (tmp_path / "systemctl.log").read_text().splitlines() == [
+            "is-system-running --wait"
+        ]
+
+    def test_wait_without_wait_option(self, booting_device, tmp_path):
+        (tmp_path / "no_wait").touch()
+        set_state_later(tmp_path, "running", 0.6)
+        state, _ = booting_device.wait_until_ready(timeout=10)
+        assert state == "running"
+
+    def test_starting_allowed(self, booting_device):
+        state, elapsed = booting_device.wait_until_ready(
+            timeout=10, states=("running", "starting"), wait=False
+        )
+        assert state == "starting"
+        assert elapsed < 1
+
+    def test_degraded(self, booting_device, tmp_path):
+        set_state_later(tmp_path, "degraded", 0.3)
+        with pytest.raises(TimeoutError) as error:
+            booting_device.wait_until_ready(timeout=1)
+        assert "degraded" in str(error.value)
+        state, _ = booting_device.wait_until_ready(
+            timeout=1, states=("running", "degraded")
+        )
+        assert state == "degraded"
+
+    def test_unreachable(self, booting_device):
+        start = time.perf_counter()
+        with pytest.raises(TimeoutError):
+            booting_device.wait_until_ready(timeout=0.2)
+        assert time.perf_counter() - start < 1
+
+    def test_main(self, booting_device, tmp_path):
+        (tmp_path / "system_state").write_text("degraded\n")
+        environment = {"DEVICE_IP": "127.0.0.1"}
+        with patch.dict("os.environ", environment), \
+             patch.object(Device, "from_environment",
+                          return_value=booting_device), \
+             patch("sys.stdout", new_callable=StringIO) as stdout:
+            device_module.main(["wait", "--allow-degraded", "--timeout", "5"])
+        assert "127.0.0.1 is degraded (ready in" in stdout.getvalue()
@@ -1,11 +1,36 @@
 import json
+import os
 import pytest
-from io import StringIO
+import random
+import subprocess
+import time
+from collections import defaultdict
+from io import BytesIO, StringIO, TextIOWrapper
 from unittest.mock import patch
 
 # Import the module
 from toolbox import snap_connections
-from toolbox.snap_connections import Connection, Connector
+from toolbox.snap_connections import (
+    Connection, Connector, InterfaceIndex, apply_script, iter_endpoints
+)
+from toolbox.snapd import SnapdError
+
+
+def stdin(content: bytes) -> TextIOWrapper:
+    return TextIOWrapper(BytesIO(content))
+
+
+def chunked_http_response(body: bytes, chunk_size: int = 100) -> bytes:
+    chunks = b"".join(
+        b"%x\r\n%s\r\n" % (len(body[i:i + chunk_size]), body[i:i + chunk_size])
+        for i in range(0, len(body), chunk_size)
+    )
+    return (
+        b"HTTP/1.1 200 OK\r\n"
+        b"Content-Type: application/json\r\n"
+        b"Transfer-Encoding: chunked\r\n"
+        b"\r\n" + chunks + b"0\r\n\r\n"
+    )
 
 
 class TestConnection:
@@ -33,14 +58,18 @@ class TestConnection:
             "checkbox-mir", "graphics-core22", "mesa-core22", "graphics-core22"
         )
 
-    def test_from_string(self): 
-        connection = Connection.from_string("checkbox:checkbox-runtime/checkbox24:checkbox-runtime")
+    def test_from_string(self):
+        connection = Connection.from_string(
+            "checkbox:checkbox-runtime/checkbox24:checkbox-runtime"
+        )
         assert connection == Connection(
             "checkbox", "checkbox-runtime", "checkbox24", "checkbox-runtime"
         )
 
     def test_from_string_empty_slot_snap(self):
-        connection = Connection.from_string("console-conf:snapd-control/:snapd-control")
+        connection = Connection.from_string(
+            "console-conf:snapd-control/:snapd-control"
+        )
         assert connection == Connection(
             "console-conf", "snapd-control", "snapd", "snapd-control"
         )
@@ -62,7 +91,9 @@ class TestConnection:
             slot_snap="checkbox24",
             slot_name="checkbox-runtime"
         )
-        assert str(connection) == "checkbox:checkbox-runtime/checkbox24:checkbox-runtime"
+        assert str(connection) == (
+            "checkbox:checkbox-runtime/checkbox24:checkbox-runtime"
+        )
 
 
 class TestConnector:
@@ -150,7 +181,9 @@ class TestConnector:
         connections = sorted(connector.process(data))
 
         assert len(connections) == 1
-        assert str(connections[0]) == "disconnected-plug-snap:plug/slot-snap:slot"
+        assert str(connections[0]) == (
+            "disconnected-plug-snap:plug/slot-snap:slot"
+        )
 
     def test_process_same_snap_rejection(self):
         data = {
@@ -281,15 +314,129 @@ class TestConnector:
         assert len(connections) == 0
 
 
+class TestInterfaceIndex:
+
+    def test_candidates_matching_content(self):
+        index = InterfaceIndex()
+        plugs = [
+            {"snap": "a", "plug": "p1", "attrs": {"content": "x"}},
+            {"snap": "a", "plug": "p2", "attrs": {"content": "y"}},
+            {"snap": "a", "plug": "p3", "attrs": {"other": "z"}},
+            {"snap": "a", "plug": "p4"},
+            {"snap": "a", "plug": "p5", "attrs": {"content": ["x"]}},
+        ]
+        for plug in plugs:
+            index.add(plug)
+
+        def candidates(slot):
+            return sorted(plug["plug"] for plug in index.candidates(slot))
+
+        # plugs with a different content are never candidates
+        assert candidates({"attrs": {"content": "x"}}) == [
+            "p1", "p3", "p4", "p5"
+        ]
+        assert candidates({"attrs": {"content": "w"}}) == ["p3", "p4", "p5"]
+        # slots without content (or with unhashable content) may connect to
+        # any plug
+        assert candidates({}) == ["p1", "p2", "p3", "p4", "p5"]
+        assert candidates({"attrs": {"content": ["x"]}}) == [
+            "p1", "p2", "p3", "p4", "p5"
+        ]
+
+
+def synthetic_connection_data(
+    plugs=10000, slots=10000, snaps=200, interfaces=200, contents=100
+):
+    """
+    Create a `connections` endpoint response with plugs and slots spread
+    over snaps and interfaces, some of them content interfaces.
+    """
+    rng = random.Random(0)
+
+    def endpoint(kind, index):
+        interface = rng.randrange(interfaces + 1)
+        endpoint = {"snap": f"snap{index % snaps}", kind: f"{kind}{index}"}
+        if interface == interfaces:
+            endpoint["interface"] = "content"
+            content = f"content{rng.randrange(contents)}"
+            endpoint["attrs"] = {"content": content}
+        else:
+            endpoint["interface"] = f"interface{interface}"
+        return endpoint
+
+    return {
+        "result": {
+            "plugs": [endpoint("plug", index) for index in range(plugs)],
+            "slots": [endpoint("slot", index) for index in range(slots)],
+        }
+    }
+
+
+class TestConnectorIndexing:
+
+    def test_process_with_snaps(self):
+        data = synthetic_connection_data(1000, 1000, snaps=20, interfaces=10)
+        selected = {"snap1", "snap2"}
+        connections = Connector(snaps=selected).process(data)
+        expected = Connector(
+            predicates=[lambda plug, slot: plug["snap"] in selected]
+        ).process(data)
+        assert connections == expected
+        assert {connection.plug_snap for connection in connections} == selected
+
+    def test_process_with_workers(self):
+        data = synthetic_connection_data(1000, 1000, snaps=20, interfaces=10)
+        connector = Connector(snaps={"snap1", "snap2"})
+        assert connector.process(data, workers=2) == connector.process(data)
+
+    @pytest.mark.benchmark
+    def test_benchmark(self):
+        """
+        Compare the indexed matcher with pairing every plug with every slot
+        of the same interface (and filtering the snaps with a predicate),
+        over 10k plugs and 10k slots.
+        """
+        data = synthetic_connection_data()
+        selected = {f"snap{index}" for index in range(10)}
+
+        def process_unindexed(connector):
+            interface_plugs = defaultdict(list)
+            for plug in data["result"]["plugs"]:
+                if "connections" not in plug:
+                    interface_plugs[plug["interface"]].append(plug)
+            return {
+                Connection.from_dicts(plug, slot)
+                for slot in data["result"]["slots"]
+                if (interface := slot["interface"]) in interface_plugs
+                for plug in interface_plugs[interface]
+                if all(
+                    predicate(plug, slot)
+                    for predicate in connector.predicates
+                )
+            }
+
+        start = time.perf_counter()
+        unindexed = process_unindexed(
+            Connector([lambda plug, slot: plug["snap"] in selected])
+        )
+        unindexed_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        indexed = Connector(snaps=selected).process(data)
+        indexed_time = time.perf_counter() - start
+
+        assert indexed == unindexed
+        assert indexed_time < unindexed_time
+
+
 class TestMainFunction:
 
     def test_main_no_args(self):
         with pytest.raises(SystemExit):
             snap_connections.main([])
 
-    @patch('sys.stdin')
     @patch('sys.stdout', new_callable=StringIO)
-    def test_main_with_snaps_predicate(self, mock_stdout, mock_stdin):
+    def test_main_with_snaps_predicate(self, mock_stdout):
         # Prepare mock input data
         mock_data = {
             "result": {
@@ -319,10 +466,9 @@ class TestMainFunction:
                 ]
             }
         }
-        mock_stdin.read.return_value = json.dumps(mock_data)
-
         test_args = ['allowed-plug-snap-1', 'allowed-plug-snap-2']
-        snap_connections.main(test_args)
+        with patch('sys.stdin', stdin(json.dumps(mock_data).encode())):
+            snap_connections.main(test_args)
 
         # Check the output - should only include connections from allowed-snap
         output = mock_stdout.getvalue().strip()
@@ -330,9 +476,8 @@ class TestMainFunction:
         assert "allowed-plug-snap-2:plug-name/slot-snap:slot-name" in output
         assert "filtered-out-plug-snap" not in output
 
-    @patch('sys.stdin')
     @patch('sys.stdout', new_callable=StringIO)
-    def test_main_with_force_option(self, mock_stdout, mock_stdin):
+    def test_main_with_force_option(self, mock_stdout):
         # Prepare mock input data with no possible connections
         mock_data = {
             "result": {
@@ -340,12 +485,205 @@ class TestMainFunction:
                 "slots": []
             }
         }
-        mock_stdin.read.return_value = json.dumps(mock_data)
-
         # forced connection doesn't need to pertain to the specified snaps
         test_args = ['other-snap', '--force', 'plug-snap:plug/slot-snap:slot']
-        snap_connections.main(test_args)
+        with patch('sys.stdin', stdin(json.dumps(mock_data).encode())):
+            snap_connections.main(test_args)
 
         # Check the output - should include the forced connection
         output = mock_stdout.getvalue().strip()
         assert output == "plug-snap:plug/slot-snap:slot"
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_main_with_http_response(self, mock_stdout):
+        # the raw (chunked) response of the snapd API is also accepted
+        data = synthetic_connection_data(100, 100, snaps=5, interfaces=3)
+        response = chunked_http_response(json.dumps(data).encode())
+        with patch('sys.stdin', stdin(response)):
+            snap_connections.main(['snap1'])
+
+        expected = sorted(Connector(snaps=['snap1']).process(data))
+        assert mock_stdout.getvalue().splitlines() == [
+            str(connection) for connection in expected
+        ]
+
+
+# a fake `snap` command: connections to a "conflict" slot report a change in
+# progress on the first attempt, connections to a "broken" slot fail when
+# watched and connections to a "connected" slot need no change
+FAKE_SNAP = """#!/bin/bash
+case "$1" in
+    connect)
+        case "$4" in
+            *conflict*)
+                if [ ! -e "$STATE/conflict" ]; then
+                    touch "$STATE/conflict"
+                    echo 'error: snap "x" has "connect-snap"' \\
+                        'change in progress'
+                    exit 1
+                fi
+                echo 2 ;;
+            *broken*) echo 3 ;;
+            *connected*) ;;
+            *) echo 1 ;;
+        esac ;;
+    watch)
+        sleep 0.5
+        [ "$2" != 3 ] ;;
+esac
+"""
+
+
+class TestApplyScript:
+
+    def run_script(self, script, tmp_path):
+        for name, content in (("snap", FAKE_SNAP), ("sudo", 'exec "$@"\n')):
+            path = tmp_path / name
+            path.write_text(content)
+            path.chmod(0o755)
+        env = dict(
+            os.environ,
+            PATH=f"{tmp_path}:{os.environ['PATH']}",
+            STATE=str(tmp_path),
+        )
+        return subprocess.run(
+            ["bash", "-s"], input=script, env=env,
+            capture_output=True, text=True
+        )
+
+    def test_apply_script(self, tmp_path):
+        connections = [
+            Connection.from_string(f"a:plug/b:{slot}")
+            for slot in ("slot1", "slot2", "conflict", "connected")
+        ]
+        start = time.perf_counter()
+        result = self.run_script(apply_script(connections), tmp_path)
+        elapsed = time.perf_counter() - start
+
+        assert result.returncode == 0, result.stdout
+        lines = sorted(result.stdout.splitlines())
+        assert [line.rsplit(" ", 1)[0] for line in lines] == [
+            "Connected a:plug to b:conflict",
+            "Connected a:plug to b:connected",
+            "Connected a:plug to b:slot1",
+            "Connected a:plug to b:slot2",
+        ]
+        # every connection is reported with the time it took
+        assert all(line.endswith("s)") for line in lines)
+        # the changes are waited for concurrently
+        assert elapsed < 1.5
+
+    def test_apply_script_failure(self, tmp_path):
+        connections = [
+            Connection.from_string("a:plug/b:slot"),
+            Connection.from_string("a:plug/b:broken"),
+        ]
+        result = self.run_script(apply_script(connections), tmp_path)
+        assert result.returncode == 1
+        assert "Failed to connect a:plug to b:broken" in result.stdout
+        assert "Connected a:plug to b:slot" in result.stdout
+        assert "1 connection(s) failed" in result.stdout
+
+    def test_apply_script_quoting(self):
+        script = apply_script([Connection("a", "p; rm -rf /", "b", "s")])
+        assert "connect 'a:p; rm -rf /' b:s &" in script
+
+    def test_apply_script_no_connections(self, tmp_path):
+        result = self.run_script(apply_script([]), tmp_path)
+        assert result.returncode == 0
+        assert result.stdout.strip() == "No possible connections detected"
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_main_apply(self, mock_stdout):
+        mock_data = {"result": {"plugs": [], "slots": []}}
+        test_args = [
+            'other-snap', '--apply', '--force', 'plug-snap:plug/slot-snap:slot'
+        ]
+        with patch('sys.stdin', stdin(json.dumps(mock_data).encode())):
+            snap_connections.main(test_args)
+        assert "connect plug-snap:plug slot-snap:slot &" in (
+            mock_stdout.getvalue()
+        )
+
+
+class TestIterEndpoints:
+
+    def test_iter_endpoints(self):
+        data = {
+            "type": "sync",
+            "status-code": 200,
+            "result": {
+                "established": [{"slot": {"snap": "a", "slot": "s"}}],
+                "plugs": [{"snap": "a", "plug": "p", "interface": "i"}],
+                "slots": [
+                    {"snap": "b", "slot": "s", "interface": "i"},
+                    {"snap": "c", "slot": "ü", "interface": "i"},
+                ],
+                "undesired": [],
+            },
+        }
+        document = json.dumps(data, ensure_ascii=False)
+        # the endpoints are the same however the document is split
+        for size in (1, 7, len(document)):
+            pieces = [
+                document[i:i + size] for i in range(0, len(document), size)
+            ]
+            assert list(iter_endpoints(pieces)) == [
+                ("plugs", data["result"]["plugs"][0]),
+                ("slots", data["result"]["slots"][0]),
+                ("slots", data["result"]["slots"][1]),
+            ]
+
+    def test_iter_endpoints_error(self):
+        data = {
+            "type": "error",
+            "status-code": 403,
+            "status": "Forbidden",
+            "result": {"message": "access denied", "kind": "login-required"},
+        }
+        with pytest.raises(SnapdError) as error:
+            list(iter_endpoints([json.dumps(data)]))
+        assert (error.value.status, error.value.message, error.value.kind) == (
+            403, "access denied", "login-required"
+        )
+
+    def test_iter_endpoints_error_status(self):
+        # the status is checked even if it follows the result
+        document = '{"result": {"plugs": []}, "status-code": 500}'
+        with pytest.raises(SnapdError) as error:
+            list(iter_endpoints([document]))
+        assert error.value.status == 500
+
+    @patch('sys.stdout', new_callable=StringIO)
+    def test_main_error_response(self, mock_stdout):
+        data = {
+            "type": "error",
+            "status-code": 401,
+            "result": {"message": "access denied"},
+        }
+        with patch('sys.stdin', stdin(json.dumps(data).encode())):
+            with pytest.raises(SystemExit) as error:
+                snap_connections.main(['snap1', '--apply'])
+        assert "access denied" in str(error.value.code)
+        assert mock_stdout.getvalue() == ""
+
+    def test_process_stream_discards_slots_without_plugs(self):
+        connector = Connector()
+        endpoints = [
+            ("plugs", {"snap": "a", "plug": "p", "interface": "i"}),
+            ("slots", {"snap": "b", "slot": "s", "interface": "i"}),
+            ("slots", {"snap": "b", "slot": "t", "interface": "other"}),
+        ]
+        assert connector.process_stream(endpoints) == {
+            Connection("a", "p", "b", "s")
+        }
+
+    def test_process_stream_slots_before_plugs(self):
+        connector = Connector()
+        endpoints = [
+            ("slots", {"snap": "b", "slot": "s", "interface": "i"}),
+            ("plugs", {"snap": "a", "plug": "p", "interface": "i"}),
+        ]
+        assert connector.process_stream(endpoints) == {
+            Connection("a", "p", "b", "s")
+        }
@@ -0,0 +1,391 @@
+import json
+import socket
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+from toolbox import snapd
+from toolbox.snapd import (
+    Change, CommandTransport, SnapdClient, SnapdError, Task, Transport,
+    UnixSocketTransport, ssh_transport
+)
+
+
+def change_dict(change_id, status="Doing", ready=False, tasks=None):
+    return {
+        "id": change_id,
+        "kind": "install-snap",
+        "summary": f"Change {change_id}",
+        "status": status,
+        "ready": ready,
+        "tasks": tasks or [],
+        "spawn-time": "2024-03-05T11:10:00.000000000Z",
+    }
+
+
+class FakeSnapd(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A snapd API (serving just the `changes` endpoints) on a unix socket.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        self.changes = {}
+        self.connections = 0
+        self.requests = 0
+        # close each connection after responding
+        self.close_connections = False
+        super().__init__(path, FakeSnapdHandler)
+
+    def __enter__(self):
+        threading.Thread(
+            target=self.serve_forever, args=(0.05,), daemon=True
+        ).start()
+        return self
+
+    def __exit__(self, *_):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeSnapdHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *_):
+        pass
+
+    def respond(self, status, document):
+        content = json.dumps(document).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        if self.server.close_connections:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self.server.requests += 1
+        changes = self.server.changes
+        if self.path == "/v2/changes?select=in-progress":
+            result = [
+                change for change in changes.values() if not change["ready"]
+            ]
+        elif self.path.startswith("/v2/changes/"):
+            result = changes.get(self.path[len("/v2/changes/"):])
+            if result is None:
+                self.respond(404, {
+                    "type": "error",
+                    "status-code": 404,
+                    "result": {"message": "cannot find change", "kind": ""},
+                })
+                return
+        else:
+            result = list(changes.values())
+        self.respond(200, {"type": "sync", "status-code": 200, "result": result})
+
+
+# relays its standard input and output to a unix socket (like `nc -U`)
+RELAY = """
+import socket, sys, threading
+connection = socket.socket(socket.AF_UNIX)
+connection.connect(sys.argv[1])
+def forward():
+    while True:
+        data = connection.recv(65536)
+        if not data:
+            break
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+threading.Thread(target=forward).start()
+while True:
+    data = sys.stdin.buffer.read1(65536)
+    if not data:
+        break
+    connection.sendall(data)
+"""
+
+
+@pytest.fixture
+def server(tmp_path):
+    with FakeSnapd(str(tmp_path / "snapd.socket")) as server:
+        yield server
+
+
+@pytest.fixture
+def stalled_socket(tmp_path):
+    """
+    A unix socket that accepts connections (in its backlog) but never
+    responds, like a stalled snapd.
+    """
+    path = str(tmp_path / "stalled.socket")
+    with socket.socket(socket.AF_UNIX) as listener:
+        listener.bind(path)
+        listener.listen()
+        yield path
+
+
+@pytest.fixture
+def client(server):
+    with SnapdClient(UnixSocketTransport(server.server_address)) as client:
+        yield client
+
+
+class TestChange:
+
+    def test_from_dict(self):
+        task = {
+            "id": "123",
+            "kind": "download-snap",
+            "summary": "Download snap",
+            "status": "Doing",
+            "progress": {"label": "checkbox", "done": 1024, "total": 4096},
+        }
+        change = Change.from_dict(change_dict("12", tasks=[task]))
+        assert change.id == "12"
+        assert change.status == "Doing"
+        assert not change.ready
+        assert not change.waiting
+        assert change.tasks == [
+            Task("123", "download-snap", "Download snap", "Doing", (1024, 4096))
+        ]
+        assert str(change) == "12\tDoing\tChange 12"
+
+    def test_waiting(self):
+        assert Change.from_dict(change_dict("1", status="Wait")).waiting
+        assert not Change.from_dict(
+            change_dict("1", status="Done", ready=True)
+        ).waiting
+
+    def test_default_tasks(self):
+        first = Change("1", "install-snap", "Change 1", "Doing", False)
+        second = Change("2", "install-snap", "Change 2", "Doing", False)
+        assert first.tasks == []
+        assert first.tasks is not second.tasks
+
+
+class TestSnapdClient:
+
+    def test_changes(self, server, client):
+        server.changes["1"] = change_dict("1")
+        server.changes["2"] = change_dict("2", status="Done", ready=True)
+        assert [change.id for change in client.changes()] == ["1"]
+        assert client.change("2").status == "Done"
+        # all the requests are sent over the same connection
+        assert server.connections == 1
+
+    def test_error(self, client):
+        with pytest.raises(SnapdError) as error:
+            client.change("missing")
+        assert error.value.status == 404
+        assert error.value.message == "cannot find change"
+
+    def test_reconnect(self, server, client):
+        server.close_connections = True
+        server.changes["1"] = change_dict("1")
+        for _ in range(3):
+            assert client.change("1").id == "1"
+        assert server.connections == 3
+
+    def test_command_transport(self, server):
+        transport = CommandTransport(
+            [sys.executable, "-c", RELAY, server.server_address]
+        )
+        server.changes["1"] = change_dict("1")
+        with SnapdClient(transport) as client:
+            for _ in range(3):
+                assert client.change("1").id == "1"
+        assert server.connections == 1
+
+    def test_abstract_transport(self):
+        with pytest.raises(TypeError):
+            Transport()
+
+    def test_response_timeout(self, stalled_socket):
+        transport = UnixSocketTransport(stalled_socket)
+        with SnapdClient(transport, timeout=0.2) as client:
+            start = time.perf_counter()
+            with pytest.raises(TimeoutError):
+                client.changes()
+            assert time.perf_counter() - start < 1
+            assert client.streams is None
+
+    def test_command_transport_timeout(self, stalled_socket):
+        transport = CommandTransport(
+            [sys.executable, "-c", RELAY, stalled_socket]
+        )
+        with SnapdClient(transport, timeout=0.2) as client:
+            with pytest.raises(TimeoutError):
+                client.changes()
+            assert transport.process is None
+
+
+class TestWaitForChanges:
+
+    def complete_later(self, server, change_id, delay):
+        def complete():
+            time.sleep(delay)
+            server.changes[change_id] = change_dict(
+                change_id, status="Done", ready=True
+            )
+        threading.Thread(target=complete, daemon=True).start()
+
+    def test_wait_for_all_changes(self, server, client):
+        server.changes["1"] = change_dict("1")
+        server.changes["2"] = change_dict("2", status="Do")
+        self.complete_later(server, "1", 0.2)
+        self.complete_later(server, "2", 0.4)
+        reports = []
+        start = time.perf_counter()
+        waiting = client.wait_for_changes(
+            timeout=10, interval=0.05, report=reports.append
+        )
+        elapsed = time.perf_counter() - start
+        assert waiting == []
+        # the changes are reported only when their status is updated
+        assert [[change.id for change in report] for report in reports] == [
+            ["1", "2"], ["2"]
+        ]
+        # completion is detected well within a second
+        assert elapsed < 1
+        assert server.connections == 1
+
+    def test_wait_for_change_ids(self, server, client):
+        server.changes["1"] = change_dict("1")
+        server.changes["2"] = change_dict("2")
+        self.complete_later(server, "1", 0.1)
+        assert client.wait_for_changes(["1"], timeout=10, interval=0.05) == []
+
+    def test_waiting_change(self, server, client):
+        server.changes["1"] = change_dict("1", status="Wait")
+        waiting = client.wait_for_changes(timeout=10, interval=0.05)
+        assert [change.id for change in waiting] == ["1"]
+
+    def test_timeout(self, server, client):
+        server.changes["1"] = change_dict("1")
+        with pytest.raises(TimeoutError):
+            client.wait_for_changes(timeout=0.2, interval=0.05)
+        # a timeout of 0 checks once
+        requests = server.requests
+        with pytest.raises(TimeoutError):
+            client.wait_for_changes(timeout=0)
+        assert server.requests == requests + 1
+
+    def test_unreachable(self, tmp_path):
+        transport = UnixSocketTransport(str(tmp_path / "missing.socket"))
+        with SnapdClient(transport) as client:
+            with patch("toolbox.snapd.RECONNECT_DELAY", 0.05):
+                with pytest.raises(TimeoutError):
+                    client.wait_for_changes(timeout=0.2)
+
+    def test_stalled(self, stalled_socket):
+        # the response to each request is only waited for until the
+        # deadline (or at least a poll interval)
+        transport = UnixSocketTransport(stalled_socket)
+        with SnapdClient(transport) as client:
+            start = time.perf_counter()
+            with patch("toolbox.snapd.RECONNECT_DELAY", 0.05):
+                with pytest.raises(TimeoutError):
+                    client.wait_for_changes(timeout=0.2)
+            assert time.perf_counter() - start < 2
+            assert client.deadline is None
+
+
+class TestSSHTransport:
+
+    def test_command(self):
+        environment = {
+            "DEVICE_IP": "10.0.0.1",
+            "SSH_OPTS": "-o ConnectTimeout=5",
+            "SSH_CONTROL_OPTS": "",
+        }
+        with patch.dict("os.environ", environment, clear=True):
+            transport = ssh_transport()
+        assert transport.command == [
+            "ssh", "-o", "ConnectTimeout=5",
+            "ubuntu@10.0.0.1", "nc -U /run/snapd.socket"
+        ]
+
+    def test_command_multiplexed(self):
+        environment = {
+            "DEVICE_IP": "10.0.0.1",
+            "SSH_OPTS": "-o ConnectTimeout=5",
+            "SSH_CONTROL_OPTS": "-o ControlMaster=auto -o ControlPath=/tmp/%C",
+        }
+        with patch.dict("os.environ", environment, clear=True):
+            transport = ssh_transport()
+        assert transport.command[1:7] == [
+            "-o", "ConnectTimeout=5",
+            "-o", "ControlMaster=auto", "-o", "ControlPath=/tmp/%C",
+        ]
+
+    def test_command_with_password(self):
+        environment = {
+            "DEVICE_IP": "10.0.0.1",
+            "DEVICE_USER": "user",
+            "DEVICE_PWD": "secret",
+        }
+        with patch.dict("os.environ", environment, clear=True):
+            transport = ssh_transport()
+        assert transport.command[:4] == ["sshpass", "-p", "secret", "ssh"]
+        assert transport.command[-2] == "user@10.0.0.1"
+
+    def test_no_device(self):
+        with patch.dict("os.environ", {}, clear=True):
+            with pytest.raises(SystemExit):
+                ssh_transport()
+
+
+class TestMainFunction:
+
+    def main(self, server, *args):
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            try:
+                snapd.main(["--socket", server.server_address, *args])
+            except SystemExit as exit:
+                return exit.code, stdout.getvalue()
+        return 0, stdout.getvalue()
+
+    def test_changes(self, server):
+        server.changes["1"] = change_dict("1")
+        server.changes["2"] = change_dict("2", status="Done", ready=True)
+        assert self.main(server, "changes") == (0, "1\tDoing\tChange 1\n")
+        _, output = self.main(server, "changes", "--all")
+        assert output.splitlines() == [
+            "1\tDoing\tChange 1", "2\tDone\tChange 2"
+        ]
+
+    def test_wait_complete(self, server):
+        server.changes["1"] = change_dict("1", status="Done", ready=True)
+        code, output = self.main(server, "wait", "--timeout", "0")
+        assert code == 0
+        assert output == "No ongoing or pending snap changes\n"
+
+    def test_wait_timeout(self, server):
+        server.changes["1"] = change_dict("1")
+        code, output = self.main(server, "wait", "--timeout", "0")
+        assert code == 1
+        assert "1\tDoing\tChange 1" in output
+
+    def test_wait_waiting(self, server):
+        server.changes["1"] = change_dict("1", status="Wait")
+        code, output = self.main(server, "wait", "1")
+        assert code == 2
+        assert "Snap changes are waiting" in output
+
+    def test_wait_missing_change(self, server):
+        code, _ = self.main(server, "wait", "missing")
+        assert code == "Error: cannot find change (status 404)"
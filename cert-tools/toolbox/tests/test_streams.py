@@ -0,0 +1,113 @@
+import io
+import json
+from unittest.mock import patch
+
+import pytest
+
+from toolbox.streams import (
+    JSONStream, decode, read_chunked, read_response_body
+)
+
+
+class TestReadResponseBody:
+
+    def test_bare_body(self):
+        stream = io.BytesIO(b'{"key": "value"}')
+        assert b"".join(read_response_body(stream)) == b'{"key": "value"}'
+
+    def test_empty_body(self):
+        assert list(read_response_body(io.BytesIO(b""))) == []
+
+    def test_content_length(self):
+        stream = io.BytesIO(
+            b"HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello trailing"
+        )
+        assert b"".join(read_response_body(stream)) == b"hello"
+
+    def test_chunked(self):
+        stream = io.BytesIO(
+            b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"5;extension=1\r\nhello\r\n6\r\n world\r\n0\r\n\r\n"
+        )
+        assert b"".join(read_response_body(stream)) == b"hello world"
+
+    def test_truncated_chunk(self):
+        stream = io.BytesIO(b"5\r\nhel")
+        with pytest.raises(EOFError):
+            list(read_chunked(stream))
+
+
+class TestDecode:
+
+    def test_split_character(self):
+        encoded = "ü".encode()
+        assert "".join(decode([encoded[:1], encoded[1:]])) == "ü"
+
+
+class TestJSONStream:
+
+    def test_navigation(self):
+        document = '{"a": 12345, "b": [1, {"c": [true, null]}], "d": {}}'
+        for size in (1, 3, len(document)):
+            pieces = [
+                document[i:i + size] for i in range(0, len(document), size)
+            ]
+            stream = JSONStream(pieces)
+            values = {}
+            for key in stream.members():
+                if key == "b":
+                    stream.skip()
+                else:
+                    values[key] = stream.value()
+            # numbers split across pieces are decoded whole
+            assert values == {"a": 12345, "d": {}}
+            assert stream.peek() == ""
+
+    def test_elements(self):
+        stream = JSONStream(["[", "]"])
+        assert list(stream.elements()) == []
+        stream = JSONStream(['[{"a": 1}, ', '{"a": 2}]'])
+        assert [stream.value() for _ in stream.elements()] == [
+            {"a": 1}, {"a": 2}
+        ]
+
+    def test_values_split_anywhere(self):
+        document = (
+            '[{"a": "x\\"y\\\\", "b": [1.5e3, {"c": "]}"}]}, '
+            '"\\u00fc", -12, true, null, "", [], 7]'
+        )
+        expected = json.loads(document)
+        for size in range(1, 8):
+            pieces = [
+                document[i:i + size] for i in range(0, len(document), size)
+            ]
+            stream = JSONStream(pieces)
+            assert [stream.value() for _ in stream.elements()] == expected
+            assert stream.peek() == ""
+
+    def test_value_decoded_once(self):
+        # a value that spans many pieces is decoded once, when it is whole
+        value = {"plugs": [{"plug": str(i)} for i in range(100)]}
+        document = json.dumps(value)
+        pieces = [document[i:i + 10] for i in range(0, len(document), 10)]
+        with patch.object(
+            json.JSONDecoder, "raw_decode", autospec=True,
+            side_effect=json.JSONDecoder.raw_decode,
+        ) as raw_decode:
+            assert JSONStream(pieces).value() == value
+        assert raw_decode.call_count == 1
+
+    def test_scalar_document(self):
+        assert JSONStream(["12", "34"]).value() == 1234
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            list(JSONStream(["[1, 2"]).members())
+        with pytest.raises(ValueError):
+            JSONStream(['{"a": ', '[1, 2']).value()
+        with pytest.raises(ValueError):
+            JSONStream(["tru", "e1"]).value()
+        stream = JSONStream(['{"a": [1, 2'])
+        with pytest.raises(ValueError):
+            for _ in stream.members():
+                stream.skip()
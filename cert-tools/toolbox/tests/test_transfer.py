@@ -0,0 +1,255 @@
+from io import StringIO
+from unittest.mock import patch
+
+import pytest
+
+from toolbox import transfer
+from toolbox.transfer import (
+    TransferReport, list_local_files, parse_manifest, parse_rsync_stats,
+    partition, remote_path, split_source
+)
+
+
+def write_tree(root, files):
+    for path, content in files.items():
+        (root / path).parent.mkdir(parents=True, exist_ok=True)
+        (root / path).write_text(content)
+
+
+def read_tree(root):
+    return {
+        str(path.relative_to(root)): path.read_text()
+        for path in root.rglob("*") if path.is_file()
+    }
+
+
+class TestPaths:
+
+    def test_remote_path(self):
+        assert remote_path(":") == "."
+        assert remote_path(":.scriptlets") == ".scriptlets"
+        assert remote_path("/var/log") == "/var/log"
+
+    def test_split_source(self):
+        assert split_source("a/b/") == ("a", "b")
+        assert split_source("file") == (".", "file")
+
+    def test_list_local_files(self, tmp_path):
+        write_tree(tmp_path, {"dir/a": "a", "dir/sub/b": "b", "c": "c"})
+        groups = list_local_files([str(tmp_path / "dir"), str(tmp_path / "c")])
+        assert sorted(groups[str(tmp_path)]) == ["c", "dir/a", "dir/sub/b"]
+
+    def test_partition(self):
+        sizes = {"a": 10, "b": 6, "c": 5, "d": 1}
+        batches = partition(list(sizes), sizes, 2)
+        assert sorted(map(sorted, batches)) == [["a", "d"], ["b", "c"]]
+        assert partition(["a"], {}, 8) == [["a"]]
+        assert partition([], {}, 8) == []
+
+
+class TestParsing:
+
+    def test_parse_manifest(self):
+        digest = "0" * 64
+        output = f"{digest}  dir/a\n\\{digest}  escaped\\nname\nerror\n"
+        assert parse_manifest(output) == {"dir/a": digest}
+
+    def test_parse_rsync_stats(self):
+        output = (
+            "Number of files: 12 (reg: 10, dir: 2)\n"
+            "Number of regular files transferred: 3\n"
+            "Total bytes sent: 1,024\n"
+            "Total bytes received: 100\n"
+        )
+        assert parse_rsync_stats(output) == (3, 10, 1124)
+
+    def test_parse_rsync_stats_older(self):
+        output = (
+            "Number of files: 4\n"
+            "Number of files transferred: 1\n"
+            "Total bytes sent: 10\n"
+        )
+        assert parse_rsync_stats(output) == (1, 4, 10)
+
+
+class TestManifestTransfer:
+
+    def test_put(self, device, tmp_path):
+        local = tmp_path / "local"
+        remote = tmp_path / "remote"
+        write_tree(local, {
+            f"scriptlets/file{index}": f"content {index}"
+            for index in range(20)
+        })
+        write_tree(local, {"scriptlets/defs/ssh_options": "options"})
+        sources = [str(local / "scriptlets")]
+
+        report = transfer.transfer(
+            device, True, sources, f":{remote}", method="manifest"
+        )
+        assert (report.files, report.total) == (21, 21)
+        assert report.bytes == sum(
+            len(content) for content in read_tree(local).values()
+        )
+        assert read_tree(remote) == read_tree(local)
+
+        # only the changed (or new) files are transferred again
+        write_tree(local, {"scriptlets/file3": "changed", "scriptlets/new": ""})
+        report = transfer.transfer(
+            device, True, sources, f":{remote}", workers=4,
+            compress=True, method="manifest"
+        )
+        assert (report.files, report.total) == (2, 22)
+        assert read_tree(remote) == read_tree(local)
+
+    def test_get(self, device, tmp_path):
+        remote = tmp_path / "remote"
+        local = tmp_path / "local"
+        write_tree(remote, {
+            "logs/syslog": "syslog", "logs/journal/1": "1", "other": "x"
+        })
+        sources = [f":{remote / 'logs'}", f":{remote / 'other'}"]
+
+        report = transfer.transfer(
+            device, False, sources, str(local), method="manifest"
+        )
+        assert (report.files, report.total, report.bytes) == (3, 3, 8)
+        assert read_tree(local) == read_tree(remote)
+
+        write_tree(remote, {"logs/syslog": "updated"})
+        report = transfer.transfer(
+            device, False, sources, str(local), compress=True,
+            method="manifest"
+        )
+        assert (report.files, report.total, report.bytes) == (1, 3, 7)
+        assert read_tree(local) == read_tree(remote)
+
+    def test_get_missing(self, device, tmp_path):
+        with pytest.raises(SystemExit) as error:
+            transfer.transfer(
+                device, False, [f":{tmp_path / 'missing'}"], str(tmp_path),
+                method="manifest"
+            )
+        assert str(error.value) == (
+            f"{tmp_path / 'missing'}: No such file or directory"
+        )
+
+    def test_put_file(self, device, tmp_path):
+        source = tmp_path / "source"
+        source.write_text("content")
+        # a single file is renamed to a target that doesn't exist (or that
+        # is a file), as with scp
+        for target in ("new", "dir/new", "new"):
+            report = transfer.transfer(
+                device, True, [str(source)], f":{tmp_path / target}",
+                method="manifest"
+            )
+            assert (tmp_path / target).read_text() == "content"
+        assert (report.files, report.total, report.bytes) == (0, 1, 0)
+        assert sorted(read_tree(tmp_path / "dir")) == ["new"]
+
+        source.write_text("changed")
+        report = transfer.transfer(
+            device, True, [str(source)], f":{tmp_path / 'new'}",
+            compress=True, method="manifest"
+        )
+        assert (report.files, report.total, report.bytes) == (1, 1, 7)
+        assert (tmp_path / "new").read_text() == "changed"
+
+        # and copied into a target directory
+        transfer.transfer(
+            device, True, [str(source)], f":{tmp_path / 'dir'}",
+            method="manifest"
+        )
+        assert read_tree(tmp_path / "dir") == {
+            "new": "content", "source": "changed"
+        }
+
+    def test_get_file(self, device, tmp_path):
+        remote = tmp_path / "remote"
+        write_tree(remote, {"syslog": "syslog"})
+        sources = [f":{remote / 'syslog'}"]
+        local = tmp_path / "local"
+
+        report = transfer.transfer(
+            device, False, sources, str(local / "renamed"), method="manifest"
+        )
+        assert (report.files, report.total, report.bytes) == (1, 1, 6)
+        assert read_tree(local) == {"renamed": "syslog"}
+        report = transfer.transfer(
+            device, False, sources, str(local / "renamed"), method="manifest"
+        )
+        assert (report.files, report.total) == (0, 1)
+
+        # the target is a directory
+        transfer.transfer(
+            device, False, sources, str(local), method="manifest"
+        )
+        assert read_tree(local) == {"renamed": "syslog", "syslog": "syslog"}
+
+
+class TestRsyncTransfer:
+
+    def test_rsync_command(self, device):
+        stats = "Number of files: 2\nNumber of regular files transferred: 1\n"
+        with patch("subprocess.run") as run:
+            run.return_value.stdout = stats
+            run.return_value.returncode = 0
+            report = transfer.transfer(
+                device, True, ["scriptlets/"], ":.scriptlets",
+                compress=True, method="rsync"
+            )
+        command = run.call_args[0][0]
+        assert command[0] == "rsync"
+        assert "--checksum" in command and "--compress" in command
+        assert command[-2:] == ["scriptlets", "ubuntu@10.0.0.1:.scriptlets"]
+        assert command[command.index("-e") + 1].startswith("ssh ")
+        assert (report.method, report.files, report.total) == ("rsync", 1, 2)
+
+    def test_rsync_missing_source(self, device, tmp_path, capfd):
+        rsync = tmp_path / "bin" / "rsync"
+        rsync.write_text(
+            "#!/bin/bash\n"
+            "echo 'rsync: link_stat \"/missing\" failed: "
+            "No such file or directory (2)' >&2\n"
+            "echo 'Number of files: 0'\n"
+            "exit 23\n"
+        )
+        rsync.chmod(0o755)
+        with pytest.raises(SystemExit) as error:
+            transfer.transfer(
+                device, False, [":/missing"], str(tmp_path), method="rsync"
+            )
+        assert error.value.code == 23
+        assert "No such file or directory" in capfd.readouterr().err
+
+    def test_auto_without_rsync(self, device, tmp_path):
+        with patch.dict("os.environ", {"PATH": "/nonexistent"}), \
+             patch.object(transfer, "manifest_put") as manifest_put:
+            transfer.transfer(device, True, ["a"], ":")
+        manifest_put.assert_called_once()
+
+
+class TestMainFunction:
+
+    def test_main(self, device, tmp_path):
+        (tmp_path / "file").write_text("content")
+        environment = {"DEVICE_IP": "10.0.0.1"}
+        with patch.dict("os.environ", environment), \
+             patch("sys.stdout", new_callable=StringIO) as stdout:
+            transfer.main([
+                "put", "--method", "manifest",
+                str(tmp_path / "file"), f":{tmp_path / 'remote'}"
+            ])
+        assert stdout.getvalue().startswith("Transferred 1 of 1 files (7 bytes)")
+        assert (tmp_path / "remote").read_text() == "content"
+
+    def test_main_no_target(self):
+        with pytest.raises(SystemExit):
+            transfer.main(["put", "file"])
+
+    def test_report(self):
+        report = TransferReport("manifest", 1, 2, 3, 0.5)
+        assert str(report) == (
+            "Transferred 1 of 2 files (3 bytes) in 0.50s (manifest)"
+        )
@@ -4,6 +4,7 @@ Get version and revision data for snaps we care about testing
 """
 
 import json
+import re
 import requests
 import sys
 import yaml
@@ -14,6 +15,20 @@ parser.add_argument("--config", "-c", required=True,
                     help="Yaml file with snap names and store data")
 args = parser.parse_args()
 
+# top-level `grade` key of a snap.yaml (top-level keys are not indented)
+GRADE_PATTERN = re.compile(r"^grade:\s*[\"']?([\w-]+)[\"']?\s*(?:#.*)?$",
+                           re.MULTILINE)
+
+
+def get_grade(snap_yaml):
+    """
+    Return the grade declared in a snap.yaml (or None), scanning for the
+    top-level key instead of loading the whole (possibly large) document
+    """
+    match = GRADE_PATTERN.search(snap_yaml)
+    return match.group(1) if match else None
+
+
 with open(args.config) as f:
     snap_data = yaml.safe_load(f)
     SNAPS = [(k, snap_data[k]["store"]) for k in snap_data.keys()]
@@ -46,8 +61,7 @@ for snap, store in SNAPS:
         revision = x["revision"]
         snap_yaml = x.get("snap-yaml")
         if snap_yaml:
-            snap_dict = yaml.safe_load(snap_yaml)
-            grade = snap_dict.get("grade")
+            grade = get_grade(snap_yaml)
         else:
             grade = "unknown"
         # Special case: We only want to test mir-kiosk for grade: stable
@@ -24,9 +24,10 @@ clone() {
 
 install_on_device() {
     # copy selected scriptlets over to the device
+    # (only the ones that have changed since they were last copied)
     DEVICE_SCRIPTLETS=(retry check_for_packages_complete wait_for_packages_complete install_packages clean_machine git_get_shallow)
     _run mkdir -p "$TOOLS_PATH_DEVICE" \
-    && _put "${DEVICE_SCRIPTLETS[@]/#/$SCRIPTLETS_PATH/}" :"$TOOLS_PATH_DEVICE"
+    && _put --sync "${DEVICE_SCRIPTLETS[@]/#/$SCRIPTLETS_PATH/}" :"$TOOLS_PATH_DEVICE"
 
     # fuser is required by `check_for_packages_complete`
     # (so install it on the device, where it is used)
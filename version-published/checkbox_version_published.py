@@ -59,13 +59,65 @@ to check if both snaps and packages are available would be:
 """
 
 import argparse
+import csv
+import gzip
+import json
+import re
 import requests
 import sys
 import time
 import yaml
-from typing import NamedTuple, List, Dict
-
-from snap_info_utility import get_snap_info_from_store
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import unquote
+from typing import (
+    Callable,
+    IO,
+    NamedTuple,
+    List,
+    Dict,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from snap_info_utility import ChannelMap, get_snap_info_from_store
+
+
+# Codenames of the Ubuntu releases, used to locate the Packages index of
+# each release in the PPA (other releases are looked up in DISTRO_INFO)
+UBUNTU_SERIES = {
+    "16.04": "xenial",
+    "18.04": "bionic",
+    "20.04": "focal",
+    "22.04": "jammy",
+    "24.04": "noble",
+    "24.10": "oracular",
+    "25.04": "plucky",
+    "25.10": "questing",
+}
+
+# The Ubuntu releases known to distro-info (from the distro-info-data
+# package), as a CSV file with (at least) a version and a series column
+DISTRO_INFO = "/usr/share/distro-info/ubuntu.csv"
+
+# The (package, version, architecture) tuples listed in a Packages index
+PackageIndex = Set[Tuple[str, str, str]]
+
+# The .deb files linked from the listing of a pool directory of the PPA
+POOL_FILE = re.compile(r'href="(?:[^"]*/)?([^"/_]+)_([^"/_]+)_([^"/_]+)\.deb"')
+
+# Columns of the timeline of the availability of the snaps and packages
+TIMELINE_FIELDS = (
+    "type",
+    "name",
+    "version",
+    "channel",
+    "ubuntu_version",
+    "arch",
+    "available_after",
+)
 
 
 # The named tuple for the snap specification.
@@ -88,6 +140,70 @@ class PackageSpec(NamedTuple):
     arch: str
 
 
+class Backoff:
+    """
+    Adaptive polling interval for a single target (a snap in the store or
+    a Packages index in the PPA): the interval is reset to its minimum
+    whenever the target changes and grows geometrically while it doesn't.
+    """
+
+    def __init__(
+        self, minimum: float = 5, maximum: float = 30, factor: float = 2
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.interval = minimum
+        self.next_poll = 0.0
+
+    def is_due(self, now: float) -> bool:
+        return now >= self.next_poll
+
+    def schedule(self, now: float, changed: bool) -> None:
+        if changed:
+            self.interval = self.minimum
+        else:
+            self.interval = min(self.interval * self.factor, self.maximum)
+        self.next_poll = now + self.interval
+
+
+class PollState:
+    """
+    State that is kept between the iterations of `check_availability`:
+    the last response for each snap and Packages index (so that unchanged
+    targets can be detected and indexes can be requested conditionally)
+    and the backoff of each target.
+    """
+
+    def __init__(self):
+        self.backoffs = {}  # type: Dict[str, Backoff]
+        self.store_responses = {}  # type: Dict[str, dict]
+        # url -> (ETag, Last-Modified, parsed index)
+        self.package_indexes = {}  # type: Dict[str, Tuple]
+
+    def is_due(self, target: str) -> bool:
+        backoff = self.backoffs.get(target)
+        return backoff is None or backoff.is_due(time.monotonic())
+
+    def schedule(self, target: str, changed: bool) -> None:
+        backoff = self.backoffs.setdefault(target, Backoff())
+        backoff.schedule(time.monotonic(), changed)
+
+    def time_until_next_poll(self, targets: List[str]) -> Optional[float]:
+        """
+        Return the number of seconds until the first of the given targets
+        is due to be polled again, or None if none of them was polled yet.
+        """
+        next_polls = [
+            self.backoffs[target].next_poll
+            for target in targets
+            if target in self.backoffs
+        ]
+        if not next_polls:
+            return None
+        return max(0.0, min(next_polls) - time.monotonic())
+
+
 def get_snap_specs(yaml_content: dict, version: str) -> List[SnapSpec]:
     """
     Create a list of SnapSpec objects from the yaml content.
@@ -106,70 +222,76 @@ def get_snap_specs(yaml_content: dict, version: str) -> List[SnapSpec]:
     return snap_specs
 
 
-def is_snap_available(snap_spec: SnapSpec, store_response: dict) -> bool:
+def is_snap_available(
+    snap_spec: SnapSpec, store_response: Union[dict, ChannelMap]
+) -> bool:
     """
     Process the response from the snap store and check whether the specified
     snap is available.
     :param snap_spec: the snap specification
-    :param store_response: the response from the snap store
+    :param store_response: the response from the snap store (or an index
+        over its channel map)
     :return: True if the snap is available, False otherwise
     """
-    # let's split the "channel" provided by the user
-    # into the track and the risk
-
-    def matches_spec(channel_info: dict) -> bool:
-        # some of the channel names don't follow the "track/risk" format
-        # so we need to handle them separately
-        if "/" not in snap_spec.channel:
-            return (
-                channel_info["channel"]["name"] == snap_spec.channel
-                and channel_info["version"] == snap_spec.version
-                and channel_info["channel"]["architecture"] in snap_spec.arch
-            )
-        else:
-            track, risk = snap_spec.channel.split("/")
-            return (
-                channel_info["channel"]["track"] == track
-                and channel_info["channel"]["risk"] == risk
-                and channel_info["version"] == snap_spec.version
-                and channel_info["channel"]["architecture"] in snap_spec.arch
-            )
+    if isinstance(store_response, ChannelMap):
+        channel_map = store_response
+    else:
+        channel_map = ChannelMap(store_response)
 
-    return any(
-        matches_spec(channel_info)
-        for channel_info in store_response["channel-map"]
-    )
+    # the architecture in the specification may also be a list
+    archs = snap_spec.arch
+    if isinstance(archs, str):
+        archs = [archs]
+    for arch in archs:
+        channel_info = channel_map.get(snap_spec.channel, arch)
+        if channel_info and channel_info["version"] == snap_spec.version:
+            return True
+    return False
 
 
 def check_snaps_availability(
     snap_specs: List[SnapSpec],
     snaps_available: Dict[SnapSpec, bool],
+    executor: Optional[Executor] = None,
+    state: Optional[PollState] = None,
 ) -> None:
     print("Checking if the snaps are available ...")
-    # Record of snaps for which we've already fetched the data from the store.
-    # avoid re-querying the store for the same snap name. Leaving the function
-    # invalidates the cache, as we expect the situation to be constantly
-    # evolving
-    local_store_cache = {}
+    state = state or PollState()
+    map_fn: Callable = executor.map if executor else map
+
+    # Only query the store once for each snap that has specs that are not
+    # already available and that is due to be polled again
+    names = list(
+        dict.fromkeys(
+            snap_spec.name
+            for snap_spec in snap_specs
+            if not snaps_available[snap_spec]
+            and state.is_due(snap_spec.name)
+        )
+    )
 
-    for snap_spec in snap_specs:
-        # Only fetch from the store if not already fetched and not already
-        # available.
-        if snaps_available[snap_spec]:
-            continue
+    def fetch(name: str) -> Optional[ChannelMap]:
         try:
-            if snap_spec.name not in local_store_cache:
-                local_store_cache[snap_spec.name] = get_snap_info_from_store(
-                    snap_spec.name
-                )
-            store_response = local_store_cache[snap_spec.name]
-            snaps_available[snap_spec] = is_snap_available(
-                snap_spec, store_response
-            )
-
+            store_response = get_snap_info_from_store(name)
         except (requests.RequestException, RuntimeError) as exc:
-            # Handle request exceptions but continue the loop.
+            # Handle request exceptions but continue with the other snaps.
             print(f"Error while querying the snap store: {exc}")
+            state.schedule(name, changed=False)
+            return None
+        changed = store_response != state.store_responses.get(name)
+        state.store_responses[name] = store_response
+        state.schedule(name, changed)
+        return ChannelMap(store_response)
+
+    channel_maps = dict(zip(names, map_fn(fetch, names)))
+
+    for snap_spec in snap_specs:
+        channel_map = channel_maps.get(snap_spec.name)
+        if snaps_available[snap_spec] or channel_map is None:
+            continue
+        snaps_available[snap_spec] = is_snap_available(
+            snap_spec, channel_map
+        )
 
     # Print the list of snaps that were not found.
     not_available = [
@@ -221,30 +343,189 @@ def get_package_specs(yaml_content: dict, version: str) -> List[PackageSpec]:
     return package_specs
 
 
+@lru_cache(maxsize=None)
+def get_distro_info_series() -> Dict[str, str]:
+    """
+    Get the series (codename) of each Ubuntu release known to distro-info,
+    by version (e.g. "24.04"), or nothing if distro-info-data is missing.
+    """
+    try:
+        with open(DISTRO_INFO, newline="") as distro_info:
+            return {
+                # LTS versions are listed as e.g. "24.04 LTS"
+                row["version"].split()[0]: row["series"]
+                for row in csv.DictReader(distro_info)
+            }
+    except (OSError, KeyError, IndexError, csv.Error):
+        return {}
+
+
+def get_ubuntu_series(ubuntu_version: str) -> Optional[str]:
+    """
+    Get the series of an Ubuntu release, or None if it is unknown.
+    """
+    return UBUNTU_SERIES.get(ubuntu_version) or get_distro_info_series().get(
+        ubuntu_version
+    )
+
+
+def get_package_index_url(package_spec: PackageSpec) -> str:
+    """
+    Get the url of the (compressed) Packages index of the PPA that lists
+    the package in the specification or, if the series of its Ubuntu
+    release is unknown, the url of the pool directory of its source.
+    """
+    series = get_ubuntu_series(package_spec.ubuntu_version)
+    if series is None:
+        source = package_spec.source
+        prefix = source[:4] if source.startswith("lib") else source[0]
+        return (
+            f"http://ppa.launchpad.net/checkbox-dev/{package_spec.channel}"
+            f"/ubuntu/pool/main/{prefix}/{source}"
+        )
+    # architecture-independent packages are listed in the index of
+    # every architecture
+    arch = "amd64" if package_spec.arch == "all" else package_spec.arch
+    return (
+        f"http://ppa.launchpad.net/checkbox-dev/{package_spec.channel}"
+        f"/ubuntu/dists/{series}/main/binary-{arch}/Packages.gz"
+    )
+
+
+def get_package_index_key(package_spec: PackageSpec) -> Tuple[str, str, str]:
+    """
+    Get the (package, version, architecture) tuple under which the package
+    in the specification is listed in the Packages index.
+    """
+    return (
+        package_spec.package,
+        f"{package_spec.version}~ubuntu{package_spec.ubuntu_version}.1",
+        package_spec.arch,
+    )
+
+
+def parse_package_index(content: str) -> PackageIndex:
+    """
+    Parse the content of a Packages index into a set of
+    (package, version, architecture) tuples.
+    """
+    index = set()
+    for stanza in content.split("\n\n"):
+        fields = {}
+        for line in stanza.splitlines():
+            # skip continuation lines of multi-line fields
+            if line[:1] in (" ", "\t") or ":" not in line:
+                continue
+            field, value = line.split(":", 1)
+            fields[field] = value.strip()
+        if "Package" in fields:
+            index.add(
+                (
+                    fields["Package"],
+                    fields.get("Version"),
+                    fields.get("Architecture"),
+                )
+            )
+    return index
+
+
+def parse_pool_listing(content: str) -> PackageIndex:
+    """
+    Parse the listing of a pool directory into a set of
+    (package, version, architecture) tuples, from the names of the .deb
+    files it links to.
+    """
+    return {
+        tuple(unquote(part) for part in match.groups())
+        for match in POOL_FILE.finditer(content)
+    }
+
+
+def get_package_index(
+    url: str, state: PollState
+) -> Tuple[PackageIndex, bool]:
+    """
+    Get the parsed Packages index (or pool listing) of the PPA, using the
+    ETag and Last-Modified headers of the previous response (if any) so that
+    an unchanged index is neither transferred nor parsed again.
+    :param url: the url of the Packages index (or pool directory)
+    :param state: the polling state holding the previous responses
+    :return: the parsed index and whether it changed since the previous
+        response
+    """
+    etag, last_modified, index = state.package_indexes.get(
+        url, (None, None, None)
+    )
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = requests.get(url, headers=headers)
+    if response.status_code == 304 and index is not None:
+        return index, False
+    if response.status_code == 404:
+        # the index doesn't exist until something is published for the
+        # series and architecture
+        new_index = set()
+    else:
+        response.raise_for_status()
+        if url.endswith(".gz"):
+            new_index = parse_package_index(
+                gzip.decompress(response.content).decode("utf-8")
+            )
+        else:
+            new_index = parse_pool_listing(response.text)
+    state.package_indexes[url] = (
+        response.headers.get("ETag"),
+        response.headers.get("Last-Modified"),
+        new_index,
+    )
+    return new_index, new_index != index
+
+
 def check_packages_availability(
     package_specs: List[PackageSpec],
     packages_available: Dict[PackageSpec, bool],
+    executor: Optional[Executor] = None,
+    state: Optional[PollState] = None,
 ) -> None:
     print("Checking if the packages are available ...")
-    # avoid re-querying LP for the same deb. Leaving the function
-    # invalidates the cache, as we expect the situation to be constantly
-    # evolving
-    local_lp_cache = {}
+    state = state or PollState()
+    map_fn: Callable = executor.map if executor else map
+
+    # Only query LP once for each Packages index that lists packages that
+    # are not already available and that is due to be polled again
+    urls = list(
+        dict.fromkeys(
+            get_package_index_url(package_spec)
+            for package_spec in package_specs
+            if not packages_available[package_spec]
+        )
+    )
+    urls = [url for url in urls if state.is_due(url)]
+
+    def fetch(url: str) -> Optional[PackageIndex]:
+        try:
+            index, changed = get_package_index(url, state)
+        except (requests.RequestException, OSError, EOFError) as exc:
+            # Handle request (and decompression) exceptions but continue
+            # with the other indexes.
+            print(f"Error while querying the PPA: {exc}")
+            state.schedule(url, changed=False)
+            return None
+        state.schedule(url, changed)
+        return index
+
+    indexes = dict(zip(urls, map_fn(fetch, urls)))
 
     for package_spec in package_specs:
-        if packages_available[package_spec]:
+        index = indexes.get(get_package_index_url(package_spec))
+        if packages_available[package_spec] or index is None:
             continue
-        url = (
-            f"http://ppa.launchpad.net/checkbox-dev/{package_spec.channel}"
-            f"/ubuntu/pool/main/c/{package_spec.source}"
+        packages_available[package_spec] = (
+            get_package_index_key(package_spec) in index
         )
-        name = (
-            f"{package_spec.package}_{package_spec.version}~ubuntu"
-            f"{package_spec.ubuntu_version}.1_{package_spec.arch}.deb"
-        )
-        if url not in local_lp_cache:
-            local_lp_cache[url] = requests.get(url)
-        packages_available[package_spec] = name in local_lp_cache[url].text
 
     # Print the list of packages that were not found.
     not_available = [
@@ -268,36 +549,164 @@ def check_packages_availability(
         print("All packages were found.")
 
 
+def format_spec(spec: Union[SnapSpec, PackageSpec]) -> str:
+    if isinstance(spec, SnapSpec):
+        return f"snap {spec.name} ({spec.channel}, {spec.arch})"
+    return f"package {spec.package} ({spec.ubuntu_version}, {spec.arch})"
+
+
+def record_available(
+    available: Dict[Union[SnapSpec, PackageSpec], bool],
+    timeline: Dict[Union[SnapSpec, PackageSpec], float],
+    elapsed: float,
+) -> None:
+    """
+    Record in the timeline the time (in seconds since the start of the
+    check) at which each snap or package was first found to be available.
+    """
+    for spec, is_available in available.items():
+        if is_available and spec not in timeline:
+            timeline[spec] = elapsed
+            print(f"Found {format_spec(spec)} after {elapsed:.1f} seconds")
+
+
 def check_availability(
-    snap_specs: list, package_specs: list, timeout: int
+    snap_specs: list,
+    package_specs: list,
+    timeout: int,
+    workers: int = 8,
+    timeline: Optional[Dict[Union[SnapSpec, PackageSpec], float]] = None,
 ) -> None:
+    """
+    Wait until all the snaps and packages are available or the timeout is
+    reached. If a timeline is given, the time (in seconds since the start
+    of the check) at which each snap and package was first found to be
+    available is recorded in it, even if the timeout is reached.
+    """
     # Dict to store whether each snap and package is available.
     snaps_available = {snap_spec: False for snap_spec in snap_specs}
     packages_available = {
         package_spec: False for package_spec in package_specs
     }
+    if timeline is None:
+        timeline = {}
+    # Responses and backoffs are kept across iterations, so that only the
+    # targets that are due are polled and unchanged pages aren't re-fetched
+    state = PollState()
     # Set the deadline.
     deadline = time.time() + timeout
-    while True:
-        if not all(snaps_available.values()):
-            check_snaps_availability(snap_specs, snaps_available)
-        if not all(packages_available.values()):
-            check_packages_availability(package_specs, packages_available)
-
-        # Exit the loop if all snaps and/or packages are found.
-        if all(snaps_available.values()) and all(packages_available.values()):
-            break
-
-        # Exit the loop if the timeout is reached.
-        if time.time() > deadline:
-            raise TimeoutError("Timeout reached.")
-
-        print("--- Waiting 30 seconds before retrying ---\n")
-        # Wait before the next iteration.
-        time.sleep(30)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            if not all(snaps_available.values()):
+                check_snaps_availability(
+                    snap_specs, snaps_available, executor, state
+                )
+            if not all(packages_available.values()):
+                check_packages_availability(
+                    package_specs, packages_available, executor, state
+                )
+            elapsed = time.monotonic() - start
+            record_available(snaps_available, timeline, elapsed)
+            record_available(packages_available, timeline, elapsed)
+
+            # Exit the loop as soon as all snaps and/or packages are found.
+            if all(snaps_available.values()) and all(
+                packages_available.values()
+            ):
+                break
+
+            # Exit the loop if the timeout is reached.
+            now = time.time()
+            if now > deadline:
+                raise TimeoutError("Timeout reached.")
+
+            # Wait until the first target that is still missing is due
+            pending = [
+                snap_spec.name
+                for snap_spec, is_available in snaps_available.items()
+                if not is_available
+            ] + [
+                get_package_index_url(package_spec)
+                for package_spec, is_available in packages_available.items()
+                if not is_available
+            ]
+            delay = state.time_until_next_poll(pending)
+            if delay is None:
+                delay = Backoff().minimum
+            delay = min(delay, max(0.0, deadline - now))
+            print(f"--- Waiting {delay:.0f} seconds before retrying ---\n")
+            time.sleep(delay)
     print("All snaps/packages for the specific version were found.")
 
 
+def get_timeline_records(
+    specs: List[Union[SnapSpec, PackageSpec]],
+    timeline: Dict[Union[SnapSpec, PackageSpec], float],
+) -> List[dict]:
+    """
+    Create a record (with the fields in TIMELINE_FIELDS) for each snap and
+    package, with the time at which it was first found to be available or
+    None if it never was.
+    """
+    records = []
+    for spec in specs:
+        if isinstance(spec, SnapSpec):
+            record = {
+                "type": "snap",
+                "name": spec.name,
+                "channel": spec.channel,
+                "ubuntu_version": None,
+            }
+        else:
+            record = {
+                "type": "package",
+                "name": spec.package,
+                "channel": spec.channel,
+                "ubuntu_version": spec.ubuntu_version,
+            }
+        record["version"] = spec.version
+        record["arch"] = spec.arch
+        record["available_after"] = timeline.get(spec)
+        records.append(record)
+    return records
+
+
+def write_timeline(records: List[dict], output: IO, output_format: str):
+    if output_format == "csv":
+        writer = csv.DictWriter(output, fieldnames=TIMELINE_FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+    else:
+        json.dump(records, output, indent=2)
+        output.write("\n")
+
+
+def escape_influx_tag(value: str) -> str:
+    for char in ("\\", ",", "=", " "):
+        value = value.replace(char, f"\\{char}")
+    return value
+
+
+def write_influx_lines(records: List[dict], output: IO):
+    """
+    Write the publication latency of each snap and package that was found
+    to be available in InfluxDB line protocol.
+    """
+    for record in records:
+        if record["available_after"] is None:
+            continue
+        tags = ",".join(
+            f"{field}={escape_influx_tag(str(record[field]))}"
+            for field in TIMELINE_FIELDS[:-1]
+            if record[field] is not None
+        )
+        output.write(
+            f"checkbox_publication_latency,{tags} "
+            f"seconds={record['available_after']}\n"
+        )
+
+
 def main(argv):
     parser = argparse.ArgumentParser(
         description="Check whether snaps are available in the snap store."
@@ -314,6 +723,30 @@ def main(argv):
         default=300,
         type=int,
     )
+    parser.add_argument(
+        "--workers",
+        help="Number of concurrent requests to the store and the PPA.",
+        default=8,
+        type=int,
+    )
+    parser.add_argument(
+        "--timeline",
+        type=argparse.FileType("w"),
+        help="Path to a file where to write the time at which each snap "
+        "and package was found to be available.",
+    )
+    parser.add_argument(
+        "--timeline-format",
+        choices=["json", "csv"],
+        default="json",
+        help="Format of the timeline.",
+    )
+    parser.add_argument(
+        "--influx",
+        type=argparse.FileType("w"),
+        help="Path to a file where to write the publication latency of "
+        "each snap and package in InfluxDB line protocol.",
+    )
     args = parser.parse_args(argv[1:])
 
     yaml_content = yaml.load(args.checkbox_yaml, Loader=yaml.FullLoader)
@@ -324,7 +757,23 @@ def main(argv):
     snap_specs = get_snap_specs(yaml_content, args.version)
     package_specs = get_package_specs(yaml_content, args.version)
 
-    check_availability(snap_specs, package_specs, args.timeout)
+    timeline = {}
+    try:
+        check_availability(
+            snap_specs,
+            package_specs,
+            args.timeout,
+            workers=args.workers,
+            timeline=timeline,
+        )
+    finally:
+        # the timeline is also written when the timeout is reached, to
+        # show which snaps and packages were late
+        records = get_timeline_records(snap_specs + package_specs, timeline)
+        if args.timeline:
+            write_timeline(records, args.timeline, args.timeline_format)
+        if args.influx:
+            write_influx_lines(records, args.influx)
 
 
 if __name__ == "__main__":
@@ -6,13 +6,27 @@ since the latest version tag
 
 Example usage:
     python3 checkout_to_version.py repository_path version_string
+
+With --remote, the repository is fetched from the given url into
+repository_path (which is created if needed), transferring only the commits
+since the tag preceding the version and the files of the target commit:
+    python3 checkout_to_version.py --remote \\
+        https://github.com/canonical/checkbox.git checkbox version_string
 """
 
+import os
 import sys
 from argparse import ArgumentParser
-from subprocess import check_call
+from subprocess import check_call, check_output
+from typing import Dict
 
-from snap_info_utility import get_revision_at_offset
+from snap_info_utility import (
+    VERSION_TAG,
+    find_previous_tag,
+    get_revision_at_offset,
+    get_version_and_offset,
+    sort_version_tags,
+)
 
 
 def checkout_to_version(version: str, repository_path: str):
@@ -20,6 +34,143 @@ def checkout_to_version(version: str, repository_path: str):
     check_call(["git", "switch", revision, "--detach"], cwd=repository_path)
 
 
+def get_remote_tags(remote: str) -> Dict[str, str]:
+    """
+    Return the commit of each version tag (vX.Y.Z) of the remote, without
+    fetching anything.
+    """
+    output = check_output(["git", "ls-remote", "--tags", remote], text=True)
+    tags = {}
+    for line in output.splitlines():
+        commit, ref = line.split("\t")
+        tag = ref[len("refs/tags/") :]
+        if tag.endswith("^{}"):
+            # the commit an annotated tag points to
+            tag = tag[: -len("^{}")]
+            if VERSION_TAG.match(tag):
+                tags[tag] = commit
+        elif VERSION_TAG.match(tag):
+            tags.setdefault(tag, commit)
+    return tags
+
+
+def init_partial_repository(remote: str, repository_path: str):
+    """
+    Create an empty repository with the remote as a promisor remote, so
+    that the trees and blobs that are missing (because they were filtered
+    out of a fetch) are fetched on demand.
+    """
+    if not os.path.isdir(os.path.join(repository_path, ".git")):
+        check_call(["git", "init", "--quiet", repository_path])
+        check_call(
+            ["git", "remote", "add", "origin", remote], cwd=repository_path
+        )
+    check_call(
+        ["git", "config", "remote.origin.promisor", "true"],
+        cwd=repository_path,
+    )
+    check_call(
+        ["git", "config", "remote.origin.partialclonefilter", "tree:0"],
+        cwd=repository_path,
+    )
+
+
+def get_remote_revision_at_offset(
+    version: str, remote: str, repository_path: str, branch: str = "main"
+) -> str:
+    """
+    Resolve the version to a commit of the remote, fetching only the
+    commits (no trees or blobs) of the main branch since the tag that
+    precedes the version.
+
+    The tag itself is fetched as well, so that the version of the checkout
+    can be derived from it with `git describe` (as setuptools-scm does when
+    Checkbox is built from it).
+    """
+    base_version, offset = get_version_and_offset(version)
+    tags = get_remote_tags(remote)
+    previous_tag = find_previous_tag(base_version, sort_version_tags(tags))
+    print(
+        f"Checkout to {offset} commits after the preceding tag {previous_tag}"
+    )
+    init_partial_repository(remote, repository_path)
+    if offset == 0:
+        check_call(
+            [
+                "git",
+                "fetch",
+                "--quiet",
+                "--filter=tree:0",
+                "--depth=1",
+                "origin",
+                f"+refs/tags/{previous_tag}:refs/tags/{previous_tag}",
+            ],
+            cwd=repository_path,
+        )
+        return tags[previous_tag]
+
+    # only the commits that are not reachable from the tag are fetched
+    check_call(
+        [
+            "git",
+            "fetch",
+            "--quiet",
+            "--filter=tree:0",
+            f"--shallow-exclude={previous_tag}",
+            "origin",
+            f"+refs/heads/{branch}:refs/remotes/origin/{branch}",
+        ],
+        cwd=repository_path,
+    )
+    # then the tag, right below the shallow boundary of that history
+    check_call(
+        [
+            "git",
+            "fetch",
+            "--quiet",
+            "--filter=tree:0",
+            "--deepen=1",
+            "origin",
+            f"+refs/tags/{previous_tag}:refs/tags/{previous_tag}",
+        ],
+        cwd=repository_path,
+    )
+    main = f"origin/{branch}"
+    count = int(
+        check_output(
+            ["git", "rev-list", "--count", f"{previous_tag}..{main}"],
+            text=True,
+            cwd=repository_path,
+        )
+    )
+    # the history since the tag is the tag followed by the count commits
+    # since then, so the commit at the offset is the (count - offset)th
+    # newest one
+    if offset > count:
+        raise SystemExit(
+            f"Unable to locate the commit that generated version: {version}"
+        )
+    return check_output(
+        [
+            "git",
+            "rev-list",
+            f"--skip={count - offset}",
+            "--max-count=1",
+            main,
+        ],
+        text=True,
+        cwd=repository_path,
+    ).strip()
+
+
+def checkout_to_remote_version(
+    version: str, remote: str, repository_path: str
+):
+    revision = get_remote_revision_at_offset(version, remote, repository_path)
+    # the trees and blobs of the revision are fetched on demand
+    check_call(["git", "switch", revision, "--detach"], cwd=repository_path)
+
+
 def parse_args(argv):
     parser = ArgumentParser()
     parser.add_argument("repository_path", help="Path to the repository")
@@ -27,12 +178,21 @@ def parse_args(argv):
         "version",
         help="Version string in the format vX.Y.Z-devAA or vX.Y.Z",
     )
+    parser.add_argument(
+        "--remote",
+        help="Url of a repository to fetch only the needed history from",
+    )
     return parser.parse_args(argv)
 
 
 def main(argv):
     args = parse_args(argv)
-    checkout_to_version(args.version, args.repository_path)
+    if args.remote:
+        checkout_to_remote_version(
+            args.version, args.remote, args.repository_path
+        )
+    else:
+        checkout_to_version(args.version, args.repository_path)
 
 
 if __name__ == "__main__":
@@ -11,7 +11,7 @@ import sys
 
 from argparse import ArgumentParser
 
-from snap_info_utility import get_snap_info_from_store
+from snap_info_utility import ChannelMap, get_snap_info_from_store
 
 
 def parse_args(argv):
@@ -27,10 +27,10 @@ def parse_args(argv):
 
 
 def get_latest_version(snap_info, channel):
-    for entry in snap_info["channel-map"]:
-        if entry["channel"]["name"] == channel:
-            return entry["version"]
-    raise SystemExit("No version found in the specified channel")
+    entry = ChannelMap(snap_info).get(channel)
+    if entry is None:
+        raise SystemExit("No version found in the specified channel")
+    return entry["version"]
 
 
 def get_snap_store_version(snap_name: str, channel: str) -> str:
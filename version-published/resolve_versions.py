@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+This script resolves many version strings in the form of vX.Y.Z-devAA,
+where AA is the ammount of commits since the latest version tag, to the
+commits that generated them, printing one "version commit" line for each
+
+The versions are read from the command line or, if there are none, from
+the standard input (one per line)
+
+Example usage:
+    python3 resolve_versions.py repository_path v4.0.0-dev10 v4.0.0-dev12
+"""
+
+import sys
+from argparse import ArgumentParser
+
+from snap_info_utility import resolve_versions
+
+
+def parse_args(argv):
+    parser = ArgumentParser()
+    parser.add_argument("repository_path", help="Path to the repository")
+    parser.add_argument(
+        "versions",
+        nargs="*",
+        help="Version strings in the format vX.Y.Z-devAA or vX.Y.Z",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    versions = args.versions or [
+        line.strip() for line in sys.stdin if line.strip()
+    ]
+    revisions = resolve_versions(versions, args.repository_path)
+    unresolved = []
+    for version, revision in revisions.items():
+        if revision is None:
+            unresolved.append(version)
+        else:
+            print(version, revision)
+    if unresolved:
+        raise SystemExit(
+            f"Unable to locate the commits that generated versions: "
+            f"{', '.join(unresolved)}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
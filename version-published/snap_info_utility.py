@@ -3,14 +3,37 @@ This module contains every utility function shared among multiple
 scripts that fetches information about snaps
 """
 
+import json
+import os
+import re
 import requests
+import sys
 
 try:
     from packaging.version import Version
 except ImportError:
     from distutils.version import LooseVersion as Version
 
-from subprocess import check_output
+try:
+    # when available, the history is read directly from the object
+    # database instead of spawning (and parsing the output of) git
+    import pygit2
+except ImportError:
+    pygit2 = None
+
+from subprocess import DEVNULL, call, check_output
+from typing import Dict, List, Optional, Tuple
+
+
+# snap risks, from the least to the most stable
+RISKS = ("edge", "beta", "candidate", "stable")
+
+# name of the file (in the git directory of a repository) that holds its
+# HistoryIndex
+HISTORY_INDEX_FILE = "version-history-index.json"
+
+# tags of released versions (e.g. v1.2 or v1.2.3)
+VERSION_TAG = re.compile(r"^v\d+(\.\d+)*$")
 
 
 def get_snap_info_from_store(snap_name: str) -> dict:
@@ -31,7 +54,113 @@ def get_snap_info_from_store(snap_name: str) -> dict:
     return response.json()
 
 
+def parse_channel(name: str) -> Tuple[str, str, Optional[str]]:
+    """
+    Split a snap channel name (e.g. "edge", "uc22", "latest/beta/fix")
+    into a (track, risk, branch) tuple, using the default track (latest)
+    and risk (stable) for any component that is missing.
+    """
+    components = name.split("/")
+    if components[0] in RISKS:
+        components.insert(0, "latest")
+    track, risk, branch = (components + [None, None])[:3]
+    return track, risk or "stable", branch
+
+
+class ChannelMap:
+    """
+    Index the entries of the `channel-map` in a response from the info
+    endpoint of the snap store by (track, risk, branch, architecture),
+    so that each lookup takes constant time instead of a scan of the
+    whole channel map.
+    """
+
+    def __init__(self, store_response: dict):
+        self.store_response = store_response
+        self._entries = None  # type: Optional[Dict[Tuple, dict]]
+
+    @property
+    def entries(self) -> Dict[Tuple, dict]:
+        # the index is built once, on the first lookup
+        if self._entries is None:
+            self._entries = {}
+            for entry in self.store_response.get("channel-map", []):
+                channel = entry["channel"]
+                track, risk, branch = parse_channel(channel.get("name", ""))
+                key = (
+                    channel.get("track") or track,
+                    channel.get("risk") or risk,
+                    channel.get("branch") or branch,
+                )
+                arch = channel.get("architecture")
+                self._entries.setdefault(key + (arch,), entry)
+                # entries can also be looked up regardless of architecture
+                self._entries.setdefault(key + (None,), entry)
+        return self._entries
+
+    def get(self, channel: str, arch: Optional[str] = None) -> Optional[dict]:
+        """
+        Return the entry for a channel and architecture (or for any
+        architecture, if none is specified) or None if there is no entry.
+        """
+        return self.entries.get(parse_channel(channel) + (arch,))
+
+    def latest(
+        self, channel: str, arch: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        Return the entry for a channel and architecture, falling back to
+        increasingly stable risks on the same track (in the same way that
+        a closed channel follows the next more stable one), or None if
+        there is no such entry.
+        """
+        track, risk, branch = parse_channel(channel)
+        candidates = [(track, risk, branch)] + [
+            (track, fallback, None)
+            for fallback in RISKS[RISKS.index(risk) + 1 :]
+        ]
+        for candidate in candidates:
+            entry = self.entries.get(candidate + (arch,))
+            if entry is not None:
+                return entry
+        return None
+
+
+def open_repository(repo_path: str):
+    """
+    Open the repository with pygit2, or return None if pygit2 is not
+    available (or can't open the repository) so that git is used instead.
+    """
+    if pygit2 is None:
+        return None
+    git_dir = pygit2.discover_repository(repo_path)
+    if git_dir is None:
+        return None
+    try:
+        return pygit2.Repository(git_dir)
+    except pygit2.GitError:
+        return None
+
+
+def walk_history(repository, start: str, end: str) -> List[str]:
+    """
+    Return the commits reachable from end but not from start (as in
+    `git log start..end`), from the newest to the oldest.
+    """
+    walker = repository.walk(
+        repository.revparse_single(end).peel(pygit2.Commit).id,
+        # children before their parents (even if committed in the same
+        # second), then from the newest to the oldest
+        pygit2.GIT_SORT_TOPOLOGICAL | pygit2.GIT_SORT_TIME,
+    )
+    walker.hide(repository.revparse_single(start).peel(pygit2.Commit).id)
+    return [str(commit.id) for commit in walker]
+
+
 def get_history_since(tag: str, repo_path: str):
+    repository = open_repository(repo_path)
+    if repository is not None:
+        return walk_history(repository, f"{tag}~1", "origin/main")
     return check_output(
         [
             "git",
@@ -45,6 +174,67 @@ def get_history_since(tag: str, repo_path: str):
     ).splitlines()
 
 
+def get_history_between(start: str, end: str, repo_path: str):
+    repository = open_repository(repo_path)
+    if repository is not None:
+        return walk_history(repository, start, end)
+    return check_output(
+        [
+            "git",
+            "log",
+            "--pretty=format:%H",
+            "--no-patch",
+            f"{start}..{end}",
+        ],
+        text=True,
+        cwd=repo_path,
+    ).splitlines()
+
+
+def get_commit(revision: str, repo_path: str) -> str:
+    repository = open_repository(repo_path)
+    if repository is not None:
+        commit = repository.revparse_single(revision).peel(pygit2.Commit)
+        return str(commit.id)
+    return check_output(
+        ["git", "rev-parse", "--verify", f"{revision}^{{commit}}"],
+        text=True,
+        cwd=repo_path,
+    ).strip()
+
+
+def is_ancestor(ancestor: str, descendant: str, repo_path: str) -> bool:
+    repository = open_repository(repo_path)
+    if repository is not None:
+        ancestor_id, descendant_id = (
+            repository.revparse_single(revision).peel(pygit2.Commit).id
+            for revision in (ancestor, descendant)
+        )
+        return ancestor_id == descendant_id or repository.descendant_of(
+            descendant_id, ancestor_id
+        )
+    return (
+        call(
+            ["git", "merge-base", "--is-ancestor", ancestor, descendant],
+            cwd=repo_path,
+            stdout=DEVNULL,
+            stderr=DEVNULL,
+        )
+        == 0
+    )
+
+
+def get_git_dir(repo_path: str) -> str:
+    repository = open_repository(repo_path)
+    if repository is not None:
+        return os.path.normpath(repository.path)
+    return check_output(
+        ["git", "rev-parse", "--absolute-git-dir"],
+        text=True,
+        cwd=repo_path,
+    ).strip()
+
+
 def get_version_and_offset(version_str: str):
     # Extract the base version and dev number if present
     # (e.g. v1.2.3-dev45, 1.2.3.dev45, 1.2.3)
@@ -72,11 +262,36 @@ def get_version_and_offset(version_str: str):
     return base_version, int(dev_number)
 
 
+def get_tags_by_creation_date(repository) -> List[str]:
+    """
+    Return the tags of the repository from the most to the least recently
+    created (as in `git tag --sort=-creatordate`).
+    """
+    tags = []
+    for ref_name in repository.references:
+        if not ref_name.startswith("refs/tags/"):
+            continue
+        target = repository.references[ref_name].peel()
+        if isinstance(target, pygit2.Tag) and target.tagger:
+            # annotated tags are dated by their tagger
+            created = target.tagger.time
+        else:
+            created = repository.references[ref_name].peel(
+                pygit2.Commit
+            ).commit_time
+        tags.append((-created, ref_name[len("refs/tags/") :]))
+    return [tag for _, tag in sorted(tags)]
+
+
 def get_list_of_tags(repo_path: str):
     # Get the list of tags sorted by creation date
-    tags = check_output(
-        ["git", "tag", "--sort=-creatordate"], cwd=repo_path, text=True
-    ).splitlines()
+    repository = open_repository(repo_path)
+    if repository is not None:
+        tags = get_tags_by_creation_date(repository)
+    else:
+        tags = check_output(
+            ["git", "tag", "--sort=-creatordate"], cwd=repo_path, text=True
+        ).splitlines()
 
     # Filter the list of tags to only include the ones that start with 'v'
     tags = [t for t in tags if t.startswith("v")]
@@ -87,36 +302,205 @@ def get_list_of_tags(repo_path: str):
     return tags
 
 
-def get_previous_tag(base_version: str, tags: list):
-    # Get the previous tag corresponding to the base version. We have to do it
-    # this way because the tags are only created once the version is published.
-    # For example, 4.0.0.dev333 will use the previous tag v3.3.0 to calculate
-    # the offset, not v4.0.0. The versions after 4.0.0 will use v4.0.0.
-    try:
-        return next(t for t in tags if Version(t[1:]) < Version(base_version))
-    except StopIteration:
+def sort_version_tags(tags: List[str]) -> List[str]:
+    """
+    Sort the tags (in the form vX.Y.Z) by version, dropping the tags that
+    are not versions.
+    """
+    # tags that aren't versions can't precede a version (and LooseVersion,
+    # used when packaging is missing, parses them without complaining but
+    # can't compare them to versions)
+    return sorted(
+        (tag for tag in tags if VERSION_TAG.match(tag)),
+        key=lambda tag: Version(tag[1:]),
+    )
+
+
+def find_previous_tag(base_version: str, sorted_tags: List[str]) -> str:
+    """
+    Return the tag of the greatest version lower than base_version, using a
+    binary search over tags sorted with sort_version_tags.
+    """
+    version = Version(base_version)
+    # binary search for the first tag that isn't lower than the version
+    low, high = 0, len(sorted_tags)
+    while low < high:
+        middle = (low + high) // 2
+        if Version(sorted_tags[middle][1:]) < version:
+            low = middle + 1
+        else:
+            high = middle
+    if low == 0:
         raise SystemExit(
             f"Unable to locate a previous tag for the version: {base_version}"
         )
+    return sorted_tags[low - 1]
+
+
+class HistoryIndex:
+    """
+    Persistent index of the history of a repository, stored as a JSON file
+    in its git directory, so that finding the commit at an offset from a
+    tag doesn't require walking the whole history since the tag every time.
+
+    The index holds the version tags of the repository, sorted by version
+    (so that the tag preceding a version is found with a binary search),
+    and for each tag that was looked up, the history since the tag up to
+    the commit of origin/main at the time it was indexed (so that only the
+    commits added since then have to be walked).
+    """
+
+    def __init__(self, repo_path: str, main: str = "origin/main"):
+        self.repo_path = repo_path
+        self.main = main
+        git_dir = get_git_dir(repo_path)
+        self.path = os.path.join(git_dir, HISTORY_INDEX_FILE)
+        # the tags of the repository, as listed by get_list_of_tags
+        self.raw_tags = []  # type: List[str]
+        # the version tags, sorted by version
+        self.tags = []  # type: List[str]
+        # tag -> {"head": commit, "commits": [tag, ..., head]}
+        self.histories = {}  # type: Dict[str, dict]
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as index_file:
+                content = json.load(index_file)
+            self.raw_tags = content["raw_tags"]
+            self.tags = content["tags"]
+            self.histories = content["histories"]
+        except (OSError, ValueError, KeyError):
+            # a missing or corrupted index is rebuilt from scratch
+            self.raw_tags = []
+            self.tags = []
+            self.histories = {}
+
+    def save(self):
+        # write to a temporary file first, so that concurrent readers never
+        # see a partially written index
+        temporary_path = f"{self.path}.{os.getpid()}"
+        with open(temporary_path, "w") as index_file:
+            json.dump(
+                {
+                    "raw_tags": self.raw_tags,
+                    "tags": self.tags,
+                    "histories": self.histories,
+                },
+                index_file,
+            )
+        os.replace(temporary_path, self.path)
+
+    def update_tags(self) -> bool:
+        """
+        Update the list of tags from the repository, returning whether it
+        changed. The versions of the tags are only parsed if it did.
+        """
+        tags = get_list_of_tags(self.repo_path)
+        # (the tags that aren't versions are compared as well, otherwise
+        # they would make the index look outdated every time)
+        if set(tags) == set(self.raw_tags):
+            return False
+        self.raw_tags = tags
+        self.tags = sort_version_tags(tags)
+        return True
+
+    def previous_tag(self, base_version: str) -> str:
+        return find_previous_tag(base_version, self.tags)
+
+    def history(self, tag: str) -> Tuple[List[str], bool]:
+        """
+        Return the history since the tag (included) up to the current
+        commit of the main branch, from the oldest to the newest commit,
+        and whether the index had to be updated.
+        """
+        head = get_commit(self.main, self.repo_path)
+        indexed = self.histories.get(tag)
+        if indexed and indexed["head"] == head:
+            return indexed["commits"], False
+        if indexed and is_ancestor(indexed["head"], head, self.repo_path):
+            # only walk the commits added since the index was updated
+            new_commits = get_history_between(
+                indexed["head"], head, self.repo_path
+            )
+            commits = indexed["commits"] + list(reversed(new_commits))
+        else:
+            # history is HEAD -> latest_tag(included)
+            # reverse it so it tag -> HEAD
+            commits = list(
+                reversed(get_history_since(tag, self.repo_path))
+            )
+        self.histories[tag] = {"head": head, "commits": commits}
+        return commits, True
+
+    def revision_at_offset(
+        self, base_version: str, offset: int
+    ) -> Optional[str]:
+        """
+        Return the commit at the offset from the tag preceding base_version
+        (or None if the offset is beyond the main branch), saving the
+        index if it had to be updated.
+        """
+        updated = self.update_tags()
+        previous_tag = self.previous_tag(base_version)
+        print(
+            f"Checkout to {offset} commits after the preceding tag "
+            f"{previous_tag}"
+        )
+        history, history_updated = self.history(previous_tag)
+        if updated or history_updated:
+            self.save()
+        # 0 is the tag
+        # 1 is the commit after the tag
+        # len(history) - 1 is HEAD
+        if offset < len(history):
+            return history[offset]
+        return None
 
 
 def get_revision_at_offset(version_str: str, repo_path: str):
     base_version, offset = get_version_and_offset(version_str)
-    tag_list = get_list_of_tags(repo_path)
-    previous_tag = get_previous_tag(base_version, tag_list)
-    history = get_history_since(previous_tag, repo_path)
-    print(
-        f"Checkout to {offset} commits after the preceding tag {previous_tag}"
+    revision = HistoryIndex(repo_path).revision_at_offset(
+        base_version, offset
     )
-    # history is HEAD -> latest_tag(included)
-    # reverse it so it tag -> HEAD
-    history = list(reversed(history))
-    # so now 0 is tag
-    #        1 is the commit after the tag
-    #        len(history) -1 is HEAD
-    try:
-        return history[offset]
-    except IndexError:
+    if revision is None:
         raise SystemExit(
             f"Unable to locate the commit that generated version: {version_str}"
         )
+    return revision
+
+
+def resolve_versions(
+    versions: List[str], repo_path: str
+) -> Dict[str, Optional[str]]:
+    """
+    Resolve many versions (in the form vX.Y.Z-devAA) to the commits that
+    generated them, walking the history since each tag only once for all
+    the versions that follow it.
+
+    :return: the commit of each version, or None for the versions that
+        are invalid or that can't be located
+    """
+    index = HistoryIndex(repo_path)
+    updated = index.update_tags()
+    revisions = dict.fromkeys(versions)  # type: Dict[str, Optional[str]]
+    # tag -> [(version, offset), ...]
+    offsets_by_tag = {}  # type: Dict[str, List[Tuple[str, int]]]
+    for version in revisions:
+        try:
+            base_version, offset = get_version_and_offset(version)
+            previous_tag = index.previous_tag(base_version)
+        except SystemExit as exc:
+            print(exc, file=sys.stderr)
+            continue
+        offsets_by_tag.setdefault(previous_tag, []).append((version, offset))
+
+    for tag, offsets in offsets_by_tag.items():
+        history, history_updated = index.history(tag)
+        updated = updated or history_updated
+        for version, offset in offsets:
+            if offset < len(history):
+                revisions[version] = history[offset]
+    if updated:
+        index.save()
+    return revisions
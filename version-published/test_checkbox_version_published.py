@@ -1,9 +1,16 @@
+import gzip
+import io
+import json
+import os
 import requests
+import tempfile
 import unittest
 
 from unittest.mock import patch, MagicMock
 
 from checkbox_version_published import (
+    Backoff,
+    PollState,
     SnapSpec,
     PackageSpec,
     get_snap_specs,
@@ -12,11 +19,40 @@ from checkbox_version_published import (
     check_snaps_availability,
     get_package_specs,
     check_packages_availability,
+    get_package_index,
+    get_package_index_url,
+    get_distro_info_series,
+    parse_package_index,
+    parse_pool_listing,
     check_availability,
+    get_timeline_records,
+    write_timeline,
+    write_influx_lines,
     main,
 )
 
 
+class TestBackoff(unittest.TestCase):
+    def test_interval_grows_while_unchanged(self):
+        backoff = Backoff(minimum=5, maximum=20, factor=2)
+        self.assertTrue(backoff.is_due(0))
+        backoff.schedule(0, changed=False)
+        self.assertEqual(backoff.interval, 10)
+        self.assertFalse(backoff.is_due(9))
+        self.assertTrue(backoff.is_due(10))
+        backoff.schedule(10, changed=False)
+        backoff.schedule(30, changed=False)
+        # the interval is capped
+        self.assertEqual(backoff.interval, 20)
+
+    def test_interval_reset_on_change(self):
+        backoff = Backoff(minimum=5, maximum=20, factor=2)
+        backoff.schedule(0, changed=False)
+        backoff.schedule(10, changed=True)
+        self.assertEqual(backoff.interval, 5)
+        self.assertEqual(backoff.next_poll, 15)
+
+
 class TestGetSnapSpecs(unittest.TestCase):
     def test_multiple_snaps_and_channels(self):
         # Test case for multiple snaps and channels
@@ -398,6 +434,24 @@ class TestGetPackageSpecs(unittest.TestCase):
         with self.assertRaises(KeyError):
             get_package_specs(yaml_content, version)
 
+    def test_unknown_ubuntu_version(self):
+        yaml_content = {
+            "required-packages": [
+                {
+                    "channel": "edge",
+                    "source": "src1",
+                    "package": "pkg1",
+                    "versions": ["99.04"],
+                    "architectures": ["amd64"],
+                }
+            ]
+        }
+        # releases that aren't known yet don't prevent the check
+        self.assertEqual(
+            get_package_specs(yaml_content, "3.0-dev10"),
+            [PackageSpec("edge", "src1", "pkg1", "3.0~dev10", "99.04", "amd64")],
+        )
+
     def test_empty_yaml(self):
         # Test case and empty YAML
         yaml_content = {}
@@ -413,19 +467,25 @@ class TestCheckPackagesAvailability(unittest.TestCase):
             PackageSpec("edge", "src2", "pkg2", "3.0~dev10", "22.04", "arm64"),
         ]
 
-    def get_available_package_html(self, package_spec: PackageSpec):
-        name = (
-            f"{package_spec.package}_{package_spec.version}~ubuntu"
-            f"{package_spec.ubuntu_version}.1_{package_spec.arch}.deb"
+    def get_package_index_response(self, *package_specs: PackageSpec):
+        content = "\n".join(
+            f"Package: {package_spec.package}\n"
+            f"Version: {package_spec.version}~ubuntu"
+            f"{package_spec.ubuntu_version}.1\n"
+            f"Architecture: {package_spec.arch}\n"
+            for package_spec in package_specs
+        )
+        return MagicMock(
+            status_code=200,
+            content=gzip.compress(content.encode()),
+            headers={},
         )
-        return f"<td><a href={name}>{name}</a></td>"
 
     @patch("requests.get")
     def test_all_packages_available(self, mock_url_get):
         # Mock url_header_check to simulate all packages being available
         mock_url_get.side_effect = [
-            MagicMock(text=self.get_available_package_html(x))
-            for x in self.package_specs
+            self.get_package_index_response(x) for x in self.package_specs
         ]
         packages_available = {
             package_spec: False for package_spec in self.package_specs
@@ -437,10 +497,8 @@ class TestCheckPackagesAvailability(unittest.TestCase):
     @patch("requests.get")
     def test_some_packages_not_available(self, mock_url_get):
         mock_url_get.side_effect = [
-            MagicMock(
-                text=self.get_available_package_html(self.package_specs[0])
-            ),
-            MagicMock(text=""),
+            self.get_package_index_response(self.package_specs[0]),
+            self.get_package_index_response(),
         ]
         packages_available = {
             package_spec: False for package_spec in self.package_specs
@@ -454,7 +512,7 @@ class TestCheckPackagesAvailability(unittest.TestCase):
     def test_only_retry_packages_not_available(self, mock_url_get):
         # Mock url_header_check to simulate some packages not being available
         # and check that only those packages are retried
-        mock_url_get.return_value.text = self.get_available_package_html(
+        mock_url_get.return_value = self.get_package_index_response(
             self.package_specs[1]
         )
 
@@ -472,6 +530,176 @@ class TestCheckPackagesAvailability(unittest.TestCase):
         self.assertTrue(all(packages_available.values()))
 
 
+    @patch("requests.get")
+    def test_targets_not_due_are_skipped(self, mock_url_get):
+        mock_url_get.return_value = self.get_package_index_response()
+        packages_available = {
+            package_spec: False for package_spec in self.package_specs
+        }
+        state = PollState()
+        check_packages_availability(
+            self.package_specs, packages_available, state=state
+        )
+        self.assertEqual(mock_url_get.call_count, 2)
+
+        # none of the pool directories is due to be polled again yet
+        check_packages_availability(
+            self.package_specs, packages_available, state=state
+        )
+        self.assertEqual(mock_url_get.call_count, 2)
+
+
+class TestParsePackageIndex(unittest.TestCase):
+    def test_parse_package_index(self):
+        content = (
+            "Package: checkbox-ng\n"
+            "Architecture: all\n"
+            "Version: 3.0~dev10~ubuntu22.04.1\n"
+            "Description: Checkbox\n"
+            " A multi-line description: with a colon\n"
+            "\n"
+            "Package: checkbox-provider-base\n"
+            "Architecture: amd64\n"
+            "Version: 3.0~dev10~ubuntu22.04.1\n"
+        )
+        self.assertEqual(
+            parse_package_index(content),
+            {
+                ("checkbox-ng", "3.0~dev10~ubuntu22.04.1", "all"),
+                ("checkbox-provider-base", "3.0~dev10~ubuntu22.04.1", "amd64"),
+            },
+        )
+
+
+class TestGetPackageIndex(unittest.TestCase):
+    url = (
+        "http://ppa.launchpad.net/checkbox-dev/edge/ubuntu"
+        "/dists/jammy/main/binary-amd64/Packages.gz"
+    )
+
+    @patch("requests.get")
+    def test_conditional_request(self, mock_url_get):
+        state = PollState()
+        mock_url_get.return_value = MagicMock(
+            status_code=200,
+            content=gzip.compress(
+                b"Package: pkg1\nVersion: 1.0\nArchitecture: amd64\n"
+            ),
+            headers={"ETag": "abc", "Last-Modified": "yesterday"},
+        )
+        expected_index = {("pkg1", "1.0", "amd64")}
+        self.assertEqual(
+            get_package_index(self.url, state), (expected_index, True)
+        )
+        mock_url_get.assert_called_with(self.url, headers={})
+
+        mock_url_get.return_value = MagicMock(status_code=304)
+        self.assertEqual(
+            get_package_index(self.url, state), (expected_index, False)
+        )
+        mock_url_get.assert_called_with(
+            self.url,
+            headers={
+                "If-None-Match": "abc",
+                "If-Modified-Since": "yesterday",
+            },
+        )
+
+    @patch("requests.get")
+    def test_missing_index(self, mock_url_get):
+        mock_url_get.return_value = MagicMock(status_code=404, headers={})
+        self.assertEqual(
+            get_package_index(self.url, PollState()), (set(), True)
+        )
+
+
+class TestGetPackageIndexUrl(unittest.TestCase):
+    def setUp(self):
+        get_distro_info_series.cache_clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.distro_info = os.path.join(self.directory.name, "ubuntu.csv")
+        with open(self.distro_info, "w") as distro_info:
+            distro_info.write(
+                "version,codename,series,created,release,eol\n"
+                "24.04 LTS,Noble Numbat,noble,2023-10-12,2024-04-25,2029-05-31\n"
+                "99.04,Zesty Zebra,zesty,2098-10-10,2099-04-20,2100-01-20\n"
+            )
+
+    def tearDown(self):
+        get_distro_info_series.cache_clear()
+        self.directory.cleanup()
+
+    def test_known_release(self):
+        package_spec = PackageSpec(
+            "edge", "checkbox-ng", "checkbox-ng", "3.0~dev10", "22.04", "all"
+        )
+        self.assertEqual(
+            get_package_index_url(package_spec),
+            "http://ppa.launchpad.net/checkbox-dev/edge/ubuntu"
+            "/dists/jammy/main/binary-amd64/Packages.gz",
+        )
+
+    def test_release_from_distro_info(self):
+        package_spec = PackageSpec(
+            "edge", "src1", "pkg1", "3.0~dev10", "99.04", "arm64"
+        )
+        with patch(
+            "checkbox_version_published.DISTRO_INFO", self.distro_info
+        ):
+            self.assertEqual(
+                get_package_index_url(package_spec),
+                "http://ppa.launchpad.net/checkbox-dev/edge/ubuntu"
+                "/dists/zesty/main/binary-arm64/Packages.gz",
+            )
+
+    def test_unknown_release(self):
+        package_spec = PackageSpec(
+            "edge", "checkbox-ng", "checkbox-ng", "3.0~dev10", "99.10", "all"
+        )
+        with patch(
+            "checkbox_version_published.DISTRO_INFO",
+            os.path.join(self.directory.name, "missing.csv"),
+        ):
+            self.assertEqual(
+                get_package_index_url(package_spec),
+                "http://ppa.launchpad.net/checkbox-dev/edge/ubuntu"
+                "/pool/main/c/checkbox-ng",
+            )
+
+    def test_parse_pool_listing(self):
+        content = (
+            '<a href="checkbox-ng_3.0~dev10~ubuntu99.10.1_all.deb">deb</a>\n'
+            '<a href="checkbox-ng_3.0~dev10~ubuntu99.10.1.dsc">dsc</a>\n'
+            '<a href="/ubuntu/pool/main/c/checkbox-ng/'
+            'python3-checkbox-ng_1%3a3.0~dev10_amd64.deb">deb</a>\n'
+        )
+        self.assertEqual(
+            parse_pool_listing(content),
+            {
+                ("checkbox-ng", "3.0~dev10~ubuntu99.10.1", "all"),
+                ("python3-checkbox-ng", "1:3.0~dev10", "amd64"),
+            },
+        )
+
+    @patch("requests.get")
+    def test_check_unknown_release(self, mock_url_get):
+        package_spec = PackageSpec(
+            "edge", "checkbox-ng", "checkbox-ng", "3.0~dev10", "99.10", "all"
+        )
+        mock_url_get.return_value = MagicMock(
+            status_code=200,
+            text='<a href="checkbox-ng_3.0~dev10~ubuntu99.10.1_all.deb">',
+            headers={},
+        )
+        packages_available = {package_spec: False}
+        with patch(
+            "checkbox_version_published.DISTRO_INFO",
+            os.path.join(self.directory.name, "missing.csv"),
+        ):
+            check_packages_availability([package_spec], packages_available)
+        self.assertTrue(packages_available[package_spec])
+
+
 class TestCheckAvailability(unittest.TestCase):
     def setUp(self):
         self.snap_specs = [SnapSpec("snap1", "1.0", "stable", "amd64")]
@@ -484,11 +712,15 @@ class TestCheckAvailability(unittest.TestCase):
     def test_all_available_before_timeout(
         self, mock_check_packages, mock_check_snaps
     ):
-        mock_check_snaps.side_effect = lambda specs, avail: avail.update(
-            (spec, True) for spec in specs
+        mock_check_snaps.side_effect = (
+            lambda specs, avail, *_: avail.update(
+                (spec, True) for spec in specs
+            )
         )
-        mock_check_packages.side_effect = lambda specs, avail: avail.update(
-            (spec, True) for spec in specs
+        mock_check_packages.side_effect = (
+            lambda specs, avail, *_: avail.update(
+                (spec, True) for spec in specs
+            )
         )
 
         check_availability(self.snap_specs, self.package_specs, 60)
@@ -507,16 +739,114 @@ class TestCheckAvailability(unittest.TestCase):
             start_time + 61,
         ]  # Simulate time passage to trigger timeout
 
-        mock_check_snaps.side_effect = lambda specs, avail: avail.update(
-            (spec, False) for spec in specs
+        mock_check_snaps.side_effect = (
+            lambda specs, avail, *_: avail.update(
+                (spec, False) for spec in specs
+            )
         )
-        mock_check_packages.side_effect = lambda specs, avail: avail.update(
-            (spec, False) for spec in specs
+        mock_check_packages.side_effect = (
+            lambda specs, avail, *_: avail.update(
+                (spec, False) for spec in specs
+            )
         )
 
         with self.assertRaises(TimeoutError):
             check_availability(self.snap_specs, self.package_specs, 60)
 
+    @patch("checkbox_version_published.check_snaps_availability")
+    @patch("checkbox_version_published.check_packages_availability")
+    @patch("time.monotonic")
+    @patch("time.sleep")
+    def test_timeline(
+        self, mock_sleep, mock_monotonic, mock_check_packages, mock_check_snaps
+    ):
+        # the snap is found in the first iteration, the package in the second
+        mock_monotonic.side_effect = [100, 101, 105]
+        mock_check_snaps.side_effect = (
+            lambda specs, avail, *_: avail.update(
+                (spec, True) for spec in specs
+            )
+        )
+        found = iter([False, True])
+        mock_check_packages.side_effect = (
+            lambda specs, avail, *_: avail.update(
+                (spec, next(found)) for spec in specs
+            )
+        )
+        timeline = {}
+        check_availability(
+            self.snap_specs, self.package_specs, 60, timeline=timeline
+        )
+        self.assertEqual(
+            timeline,
+            {self.snap_specs[0]: 1, self.package_specs[0]: 5},
+        )
+
+
+class TestTimelineOutput(unittest.TestCase):
+    def setUp(self):
+        self.snap_spec = SnapSpec("snap1", "1.0", "latest/edge", "amd64")
+        self.package_spec = PackageSpec(
+            "edge", "src1", "pkg1", "1.0", "22.04", "all"
+        )
+        self.records = get_timeline_records(
+            [self.snap_spec, self.package_spec], {self.snap_spec: 12.5}
+        )
+
+    def test_get_timeline_records(self):
+        self.assertEqual(
+            self.records,
+            [
+                {
+                    "type": "snap",
+                    "name": "snap1",
+                    "version": "1.0",
+                    "channel": "latest/edge",
+                    "ubuntu_version": None,
+                    "arch": "amd64",
+                    "available_after": 12.5,
+                },
+                {
+                    "type": "package",
+                    "name": "pkg1",
+                    "version": "1.0",
+                    "channel": "edge",
+                    "ubuntu_version": "22.04",
+                    "arch": "all",
+                    "available_after": None,
+                },
+            ],
+        )
+
+    def test_write_timeline_json(self):
+        output = io.StringIO()
+        write_timeline(self.records, output, "json")
+        self.assertEqual(json.loads(output.getvalue()), self.records)
+
+    def test_write_timeline_csv(self):
+        output = io.StringIO()
+        write_timeline(self.records, output, "csv")
+        lines = output.getvalue().splitlines()
+        self.assertEqual(
+            lines,
+            [
+                "type,name,version,channel,ubuntu_version,arch,"
+                "available_after",
+                "snap,snap1,1.0,latest/edge,,amd64,12.5",
+                "package,pkg1,1.0,edge,22.04,all,",
+            ],
+        )
+
+    def test_write_influx_lines(self):
+        output = io.StringIO()
+        write_influx_lines(self.records, output)
+        # only the snaps and packages that were found are written
+        self.assertEqual(
+            output.getvalue(),
+            "checkbox_publication_latency,type=snap,name=snap1,version=1.0,"
+            "channel=latest/edge,arch=amd64 seconds=12.5\n",
+        )
+
 
 class TestMain(unittest.TestCase):
     @patch("builtins.open")
@@ -1,6 +1,8 @@
+import os
+import tempfile
 import unittest
 import subprocess
-from unittest.mock import patch
+from unittest.mock import call, patch
 
 import checkout_to_version
 
@@ -22,3 +24,150 @@ class TestCheckoutToVersion(unittest.TestCase):
 
         self.assertTrue(get_revision_at_offset_mock.called)
         self.assertTrue(check_call_mock.called)
+
+
+class TestCheckoutToRemoteVersion(unittest.TestCase):
+    ls_remote = (
+        "aaa\trefs/tags/v1.0.0\n"
+        "bbb\trefs/tags/v1.1.0\n"
+        "ccc\trefs/tags/v1.1.0^{}\n"
+        "ddd\trefs/tags/not-a-version\n"
+    )
+
+    @patch("checkout_to_version.check_output")
+    def test_get_remote_tags(self, check_output_mock):
+        check_output_mock.return_value = self.ls_remote
+        self.assertEqual(
+            checkout_to_version.get_remote_tags("url"),
+            {"v1.0.0": "aaa", "v1.1.0": "ccc"},
+        )
+
+    @patch("checkout_to_version.check_call")
+    @patch("checkout_to_version.check_output")
+    def test_main_remote(self, check_output_mock, check_call_mock):
+        check_output_mock.side_effect = [self.ls_remote, "5\n", "eee\n"]
+        checkout_to_version.main(
+            ["--remote", "url", "checkbox", "v1.2.0-dev2"]
+        )
+        # only the history since the preceding tag is fetched
+        self.assertIn(
+            call(
+                [
+                    "git",
+                    "fetch",
+                    "--quiet",
+                    "--filter=tree:0",
+                    "--shallow-exclude=v1.1.0",
+                    "origin",
+                    "+refs/heads/main:refs/remotes/origin/main",
+                ],
+                cwd="checkbox",
+            ),
+            check_call_mock.call_args_list,
+        )
+        # and the tag, for versioning the checkout
+        self.assertIn(
+            call(
+                [
+                    "git",
+                    "fetch",
+                    "--quiet",
+                    "--filter=tree:0",
+                    "--deepen=1",
+                    "origin",
+                    "+refs/tags/v1.1.0:refs/tags/v1.1.0",
+                ],
+                cwd="checkbox",
+            ),
+            check_call_mock.call_args_list,
+        )
+        # 5 commits since the tag, the 2nd of them is the 4th newest
+        check_output_mock.assert_called_with(
+            ["git", "rev-list", "--skip=3", "--max-count=1", "origin/main"],
+            text=True,
+            cwd="checkbox",
+        )
+        check_call_mock.assert_called_with(
+            ["git", "switch", "eee", "--detach"], cwd="checkbox"
+        )
+
+    @patch("checkout_to_version.check_call")
+    @patch("checkout_to_version.check_output")
+    def test_main_remote_tag(self, check_output_mock, check_call_mock):
+        check_output_mock.return_value = self.ls_remote
+        checkout_to_version.main(["--remote", "url", "checkbox", "v1.2.0"])
+        check_call_mock.assert_called_with(
+            ["git", "switch", "ccc", "--detach"], cwd="checkbox"
+        )
+
+    @patch("checkout_to_version.check_call")
+    @patch("checkout_to_version.check_output")
+    def test_main_remote_offset_too_large(
+        self, check_output_mock, check_call_mock
+    ):
+        check_output_mock.side_effect = [self.ls_remote, "5\n"]
+        with self.assertRaises(SystemExit):
+            checkout_to_version.main(
+                ["--remote", "url", "checkbox", "v1.2.0-dev6"]
+            )
+
+
+class TestCheckoutFromLocalRemote(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.remote = os.path.join(self.directory.name, "remote")
+        self.checkout = os.path.join(self.directory.name, "checkout")
+        self.git(self.remote, "init", "-q", "-b", "main", self.remote)
+        # partial fetches are refused by default
+        self.git(self.remote, "config", "uploadpack.allowFilter", "true")
+        self.commits = []
+        for index in range(6):
+            self.git(
+                self.remote,
+                "-c",
+                "user.name=test",
+                "-c",
+                "user.email=test@example.com",
+                "commit",
+                "-q",
+                "--allow-empty",
+                "-m",
+                f"commit {index}",
+            )
+            self.commits.append(self.git(self.remote, "rev-parse", "HEAD"))
+        self.git(self.remote, "tag", "v1.0.0", self.commits[1])
+        self.git(self.remote, "tag", "v1.1.0", self.commits[3])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def git(self, cwd, *args):
+        os.makedirs(cwd, exist_ok=True)
+        return subprocess.check_output(
+            ["git", *args], cwd=cwd, text=True
+        ).strip()
+
+    def test_checkout(self):
+        checkout_to_version.main(
+            ["--remote", f"file://{self.remote}", self.checkout, "v1.2.0-dev1"]
+        )
+        self.assertEqual(
+            self.git(self.checkout, "rev-parse", "HEAD"), self.commits[4]
+        )
+        # only the history since the preceding tag was fetched, but the
+        # checkout can still be described from the tag
+        self.assertEqual(
+            self.git(self.checkout, "rev-list", "--count", "origin/main"), "3"
+        )
+        self.assertEqual(
+            self.git(self.checkout, "describe", "--tags"),
+            f"v1.1.0-1-g{self.commits[4][:7]}",
+        )
+
+    def test_checkout_tag(self):
+        checkout_to_version.main(
+            ["--remote", f"file://{self.remote}", self.checkout, "v1.1.1"]
+        )
+        self.assertEqual(
+            self.git(self.checkout, "describe", "--tags"), "v1.1.0"
+        )
@@ -0,0 +1,41 @@
+import io
+import unittest
+from unittest.mock import patch
+
+import resolve_versions
+
+
+class TestResolveVersions(unittest.TestCase):
+    @patch("resolve_versions.resolve_versions")
+    def test_main_happy(self, resolve_versions_mock):
+        resolve_versions_mock.return_value = {
+            "v1.2.3-dev1": "aaa",
+            "v1.2.3-dev2": "bbb",
+        }
+        with patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            resolve_versions.main(["checkbox", "v1.2.3-dev1", "v1.2.3-dev2"])
+        resolve_versions_mock.assert_called_once_with(
+            ["v1.2.3-dev1", "v1.2.3-dev2"], "checkbox"
+        )
+        self.assertEqual(
+            stdout.getvalue(), "v1.2.3-dev1 aaa\nv1.2.3-dev2 bbb\n"
+        )
+
+    @patch("resolve_versions.resolve_versions")
+    def test_main_stdin(self, resolve_versions_mock):
+        resolve_versions_mock.return_value = {}
+        with patch("sys.stdin", io.StringIO("v1.2.3-dev1\n\nv1.2.3-dev2\n")):
+            resolve_versions.main(["checkbox"])
+        resolve_versions_mock.assert_called_once_with(
+            ["v1.2.3-dev1", "v1.2.3-dev2"], "checkbox"
+        )
+
+    @patch("resolve_versions.resolve_versions")
+    def test_main_unhappy(self, resolve_versions_mock):
+        resolve_versions_mock.return_value = {
+            "v1.2.3-dev1": "aaa",
+            "v1.2.3-dev99": None,
+        }
+        with self.assertRaises(SystemExit) as context:
+            resolve_versions.main(["checkbox", "v1.2.3-dev1", "v1.2.3-dev99"])
+        self.assertIn("v1.2.3-dev99", str(context.exception))
@@ -1,8 +1,13 @@
+import subprocess
+import tempfile
+import time
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 
 import textwrap
 
+import pytest
+
 import snap_info_utility
 
 
@@ -50,47 +55,389 @@ class TestSnapInfoUtility(unittest.TestCase):
         with self.assertRaises(SystemExit):
             snap_info_utility.get_list_of_tags("/path/to/repo")
 
-    @patch("snap_info_utility.check_output")
-    def test_get_previous_tag(self, mock_check_output):
-        tags = ["v1.2.3", "v1.2.2", "v1.2.1"]
-        result = snap_info_utility.get_previous_tag("1.2.3", tags)
+    def test_find_previous_tag(self):
+        tags = snap_info_utility.sort_version_tags(
+            ["v1.2.3", "v1.2.2", "vnext", "v1.2.1", "v1.2.4-rc1"]
+        )
+        self.assertEqual(tags, ["v1.2.1", "v1.2.2", "v1.2.3"])
+        result = snap_info_utility.find_previous_tag("1.2.3", tags)
         self.assertEqual(result, "v1.2.2")
 
-    @patch("snap_info_utility.get_list_of_tags", MagicMock())
-    @patch("snap_info_utility.get_previous_tag")
-    @patch("snap_info_utility.get_history_since")
-    def test_get_revision_at_offset(
-        self, mock_get_history_since, mock_get_previous_tag
-    ):
-        mock_get_previous_tag.return_value = "v1.0.0"
-        mock_get_history_since.return_value = [
-            "tag_hash + 3",
-            "tag_hash + 2",
-            "tag_hash + 1",
-            "tag_hash",
-        ]
+    @patch("snap_info_utility.HistoryIndex")
+    def test_get_revision_at_offset(self, mock_history_index):
+        index = mock_history_index.return_value
+        index.revision_at_offset.return_value = "tag_hash + 2"
 
         result = snap_info_utility.get_revision_at_offset(
             "v1.2.3-dev2", "/path/to/repo"
         )
 
         self.assertEqual(result, "tag_hash + 2")
+        mock_history_index.assert_called_once_with("/path/to/repo")
+        index.revision_at_offset.assert_called_once_with("1.2.3", 2)
+
+    @patch("snap_info_utility.HistoryIndex")
+    def test_get_revision_at_offset_error(self, mock_history_index):
+        index = mock_history_index.return_value
+        index.revision_at_offset.return_value = None
+
+        with self.assertRaises(SystemExit):
+            snap_info_utility.get_revision_at_offset(
+                "v1.2.3-dev5", "/path/to/repo"
+            )
+
+
+class TestHistoryIndex(unittest.TestCase):
+    def setUp(self):
+        self.repo_dir = tempfile.TemporaryDirectory()
+        self.repo_path = self.repo_dir.name
+        self.git("init", "-q")
+        self.commits = []
+        # the history since a tag starts from the parent of the tag
+        self.commit()
+        self.commits = []
+
+    def tearDown(self):
+        self.repo_dir.cleanup()
+
+    def git(self, *args):
+        return subprocess.check_output(
+            ["git", *args], cwd=self.repo_path, text=True
+        ).strip()
+
+    def commit(self, tag=None):
+        self.git(
+            "-c",
+            "user.name=test",
+            "-c",
+            "user.email=test@example.com",
+            "commit",
+            "-q",
+            "--allow-empty",
+            "-m",
+            f"commit {len(self.commits)}",
+        )
+        self.commits.append(self.git("rev-parse", "HEAD"))
+        if tag:
+            self.git("tag", tag)
+        # the index follows the main branch of the origin
+        self.git("update-ref", "refs/remotes/origin/main", "HEAD")
+
+    def test_revision_at_offset(self):
+        self.commit("v1.0.0")
+        self.commit()
+        self.commit("v1.1.0")
+        self.commit()
+        self.commit()
+
+        index = snap_info_utility.HistoryIndex(self.repo_path)
+        self.assertEqual(
+            index.revision_at_offset("1.1.1", 0), self.commits[2]
+        )
+        self.assertEqual(
+            index.revision_at_offset("1.1.1", 2), self.commits[4]
+        )
+        self.assertEqual(
+            index.revision_at_offset("1.1.0", 1), self.commits[1]
+        )
+        self.assertIsNone(index.revision_at_offset("1.1.1", 3))
+
+    def test_previous_tag(self):
+        self.commit("v1.0.0")
+        self.commit("not-a-version")
+        self.commit("v1.10.0")
+        self.commit("v1.2.0")
+
+        index = snap_info_utility.HistoryIndex(self.repo_path)
+        index.update_tags()
+        self.assertEqual(index.tags, ["v1.0.0", "v1.2.0", "v1.10.0"])
+        self.assertEqual(index.previous_tag("1.3.0"), "v1.2.0")
+        self.assertEqual(index.previous_tag("2.0.0"), "v1.10.0")
+        with self.assertRaises(SystemExit):
+            index.previous_tag("1.0.0")
+
+    def test_update_tags(self):
+        self.commit("v1.0.0")
+        self.commit("vnext")
+
+        index = snap_info_utility.HistoryIndex(self.repo_path)
+        self.assertTrue(index.update_tags())
+        self.assertEqual(index.tags, ["v1.0.0"])
+        index.save()
+        # tags that aren't versions don't make the index look outdated
+        index = snap_info_utility.HistoryIndex(self.repo_path)
+        self.assertFalse(index.update_tags())
+        self.commit("v1.1.0")
+        self.assertTrue(index.update_tags())
+        self.assertEqual(index.tags, ["v1.0.0", "v1.1.0"])
 
-    @patch("snap_info_utility.get_list_of_tags", MagicMock())
-    @patch("snap_info_utility.get_previous_tag")
     @patch("snap_info_utility.get_history_since")
-    def test_get_revision_at_offset_error(
-        self, mock_get_history_since, mock_get_previous_tag
+    @patch("snap_info_utility.get_history_between")
+    def test_incremental_update(
+        self, mock_get_history_between, mock_get_history_since
     ):
-        mock_get_previous_tag.return_value = "v1.0.0"
+        self.commit("v1.0.0")
+        self.commit()
         mock_get_history_since.return_value = [
-            "tag_hash + 3",
-            "tag_hash + 2",
-            "tag_hash + 1",
-            "tag_hash",
+            self.commits[1],
+            self.commits[0],
         ]
+        index = snap_info_utility.HistoryIndex(self.repo_path)
+        self.assertEqual(
+            index.revision_at_offset("1.0.1", 1), self.commits[1]
+        )
 
-        with self.assertRaises(SystemExit):
-            snap_info_utility.get_revision_at_offset(
-                "v1.2.3-dev5", "/path/to/repo"
+        # the index is persisted and only the new commits are walked
+        self.commit()
+        mock_get_history_between.return_value = [self.commits[2]]
+        index = snap_info_utility.HistoryIndex(self.repo_path)
+        self.assertEqual(
+            index.revision_at_offset("1.0.1", 2), self.commits[2]
+        )
+        mock_get_history_since.assert_called_once()
+        mock_get_history_between.assert_called_once_with(
+            self.commits[1], self.commits[2], self.repo_path
+        )
+
+        # nothing is walked if the main branch didn't move
+        index = snap_info_utility.HistoryIndex(self.repo_path)
+        self.assertEqual(
+            index.revision_at_offset("1.0.1", 0), self.commits[0]
+        )
+        mock_get_history_since.assert_called_once()
+        mock_get_history_between.assert_called_once()
+
+    @patch("snap_info_utility.get_history_since")
+    def test_resolve_versions(self, mock_get_history_since):
+        self.commit("v1.0.0")
+        self.commit()
+        self.commit("v1.1.0")
+        self.commit()
+        mock_get_history_since.side_effect = lambda tag, repo_path: {
+            "v1.0.0": self.commits[3::-1],
+            "v1.1.0": self.commits[3:1:-1],
+        }[tag]
+
+        revisions = snap_info_utility.resolve_versions(
+            [
+                "v1.1.1-dev1",
+                "v1.0.1-dev1",
+                "v1.1.1-dev0",
+                "v1.0.1-dev3",
+                "v1.1.1-dev2",
+                "bad.version.devbad",
+                "v0.1.0",
+            ],
+            self.repo_path,
+        )
+        self.assertEqual(
+            revisions,
+            {
+                "v1.1.1-dev1": self.commits[3],
+                "v1.0.1-dev1": self.commits[1],
+                "v1.1.1-dev0": self.commits[2],
+                "v1.0.1-dev3": self.commits[3],
+                "v1.1.1-dev2": None,
+                "bad.version.devbad": None,
+                "v0.1.0": None,
+            },
+        )
+        # the history since each tag is only walked once
+        self.assertEqual(mock_get_history_since.call_count, 2)
+
+    def test_corrupted_index(self):
+        self.commit("v1.0.0")
+        index = snap_info_utility.HistoryIndex(self.repo_path)
+        with open(index.path, "w") as index_file:
+            index_file.write("{")
+        index = snap_info_utility.HistoryIndex(self.repo_path)
+        self.assertEqual(
+            index.revision_at_offset("1.0.1", 0), self.commits[0]
+        )
+
+
+class TestHistoryIndexWithoutPygit2(TestHistoryIndex):
+    def setUp(self):
+        # run the same tests with git instead of pygit2
+        patcher = patch("snap_info_utility.pygit2", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+
+@unittest.skipIf(snap_info_utility.pygit2 is None, "pygit2 not installed")
+class TestGitBackends(unittest.TestCase):
+    commits = 3000
+
+    @classmethod
+    def setUpClass(cls):
+        # a long history with a merge and (lightweight and annotated) tags,
+        # created at once with fast-import
+        cls.repo_dir = tempfile.TemporaryDirectory()
+        cls.repo_path = cls.repo_dir.name
+        subprocess.check_call(["git", "init", "-q"], cwd=cls.repo_path)
+
+        def commit(branch, mark, date, message, *parents):
+            return (
+                f"commit refs/heads/{branch}\nmark :{mark}\n"
+                f"committer test <test@example.com> {date} +0000\n"
+                f"data {len(message)}\n{message}\n"
+                + "".join(
+                    f"{kind} :{parent}\n"
+                    for kind, parent in zip(["from", "merge"], parents)
+                )
             )
+
+        side = cls.commits + 1
+        commands = []
+        for mark in range(1, cls.commits + 1):
+            date = 1700000000 + mark
+            if mark == cls.commits // 2:
+                commands.append(commit("side", side, date, "side", 1))
+                commands.append(
+                    commit("main", mark, date, "merge", mark - 1, side)
+                )
+            else:
+                commands.append(commit("main", mark, date, str(mark)))
+            if mark in (2, cls.commits // 3):
+                commands.append(
+                    f"tag v1.{mark}.0\nfrom :{mark}\n"
+                    f"tagger test <test@example.com> {date} +0000\n"
+                    f"data 3\ntag\n"
+                )
+        subprocess.run(
+            ["git", "fast-import", "--quiet"],
+            input="".join(commands),
+            text=True,
+            check=True,
+            cwd=cls.repo_path,
+        )
+        subprocess.check_call(
+            ["git", "update-ref", "refs/remotes/origin/main", "main"],
+            cwd=cls.repo_path,
+        )
+        subprocess.check_call(
+            ["git", "tag", "v2.0.0", "main~10"], cwd=cls.repo_path
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.repo_dir.cleanup()
+
+    def with_git(self, function, *args):
+        with patch("snap_info_utility.pygit2", None):
+            return function(*args)
+
+    def test_same_results(self):
+        for function, args in [
+            (snap_info_utility.get_list_of_tags, (self.repo_path,)),
+            (snap_info_utility.get_history_since, ("v1.2.0", self.repo_path)),
+            (
+                snap_info_utility.get_history_between,
+                ("v1.1000.0", "origin/main", self.repo_path),
+            ),
+            (snap_info_utility.get_commit, ("v1.2.0", self.repo_path)),
+            (
+                snap_info_utility.is_ancestor,
+                ("v1.2.0", "v1.1000.0", self.repo_path),
+            ),
+            (
+                snap_info_utility.is_ancestor,
+                ("v1.1000.0", "v1.2.0", self.repo_path),
+            ),
+        ]:
+            with self.subTest(function=function.__name__, args=args):
+                self.assertEqual(
+                    function(*args), self.with_git(function, *args)
+                )
+
+    @pytest.mark.benchmark
+    def test_benchmark(self):
+        """
+        Compare resolving versions with an up-to-date HistoryIndex (as in
+        most CI calls: the tags are listed, the main branch is resolved and
+        only the few new commits are walked) with pygit2 and with git.
+        """
+        rounds = 20
+        timings = {}
+        for backend, pygit2_module in [
+            ("git", None),
+            ("pygit2", snap_info_utility.pygit2),
+        ]:
+            with patch("snap_info_utility.pygit2", pygit2_module):
+                history = snap_info_utility.get_history_since(
+                    "v1.2.0", self.repo_path
+                )
+
+                # the index is up to date but for the last 5 commits
+                index = snap_info_utility.HistoryIndex(self.repo_path)
+                index.update_tags()
+                indexed = {
+                    "head": history[5],
+                    "commits": list(reversed(history[5:])),
+                }
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    index.histories["v1.2.0"] = dict(indexed)
+                    index.update_tags()
+                    commits, _ = index.history("v1.2.0")
+                timings[backend] = time.perf_counter() - start
+                self.assertEqual(commits, list(reversed(history)))
+        self.assertLess(timings["pygit2"], timings["git"])
+
+
+class TestChannelMap(unittest.TestCase):
+    def setUp(self):
+        def entry(name, track, risk, arch, version):
+            return {
+                "channel": {
+                    "name": name,
+                    "track": track,
+                    "risk": risk,
+                    "architecture": arch,
+                },
+                "version": version,
+            }
+
+        self.channel_map = snap_info_utility.ChannelMap(
+            {
+                "channel-map": [
+                    entry("stable", "latest", "stable", "amd64", "1.0"),
+                    entry("edge", "latest", "edge", "amd64", "1.1"),
+                    entry("edge", "latest", "edge", "arm64", "1.2"),
+                    entry("uc22/stable", "uc22", "stable", "amd64", "2.0"),
+                ]
+            }
+        )
+
+    def test_parse_channel(self):
+        parse_channel = snap_info_utility.parse_channel
+        self.assertEqual(parse_channel("edge"), ("latest", "edge", None))
+        self.assertEqual(parse_channel("uc22"), ("uc22", "stable", None))
+        self.assertEqual(
+            parse_channel("latest/beta/fix"), ("latest", "beta", "fix")
+        )
+
+    def test_get(self):
+        self.assertEqual(
+            self.channel_map.get("latest/edge", "arm64")["version"], "1.2"
+        )
+        self.assertEqual(self.channel_map.get("edge")["version"], "1.1")
+        self.assertEqual(
+            self.channel_map.get("uc22", "amd64")["version"], "2.0"
+        )
+        self.assertIsNone(self.channel_map.get("beta", "amd64"))
+        self.assertIsNone(self.channel_map.get("stable", "arm64"))
+
+    def test_latest(self):
+        self.assertEqual(
+            self.channel_map.latest("beta", "amd64")["version"], "1.0"
+        )
+        self.assertEqual(
+            self.channel_map.latest("uc22/edge", "amd64")["version"], "2.0"
+        )
+        self.assertIsNone(self.channel_map.latest("candidate", "arm64"))
+
+    def test_missing_channel_map(self):
+        channel_map = snap_info_utility.ChannelMap({})
+        self.assertIsNone(channel_map.get("stable"))